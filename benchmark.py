@@ -0,0 +1,356 @@
+"""Measure startup time and the scaling of the analysis functions, so that regressions are caught and speedups are shown"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+from data_corpus import Corpus
+from data_analysis import (
+    unique_words_from_texts, return_most_common, update_missing_words, calculate_tf_idf,
+    calculate_word_pair_frequencies, analyze_ngrams, count_ngrams, clear_frequency_tables, lexical_statistics, calculate_mean_word_length,
+)
+from data_mapreduce import run_analysis
+
+# Slowest acceptable import of each module, in milliseconds (cumulative time reported by python -X importtime)
+IMPORT_BUDGETS_MS = {
+    "main": 500,
+    "data_analysis": 400,
+    "data_index": 400,
+    "data_cache": 400,
+    "data_collection": 300,
+    "data_preprocessing": 200,
+}
+# Heavy packages that must only be imported when they are used, not when the command line starts
+LAZY_PACKAGES = ["matplotlib", "seaborn", "wordcloud", "PIL", "nltk", "requests", "scipy", "pandas"]
+
+# Default corpus sizes as (books, total tokens)
+DEFAULT_SIZES = [(1, 10000), (10, 100000), (100, 1000000)]
+# Title of the single document holding every book, as in main()
+ALL_BOOKS = "All books"
+
+def import_profile(module):
+    """
+    Import a module in a fresh interpreter with -X importtime.
+    Return the cumulative import time of the module in milliseconds and the top-level packages it imported.
+    Args:
+        module (string): Name of the module, importable from this directory.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total_us = None
+    packages = set()
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        packages.add(name.split(".")[0])
+        if name == module:
+            total_us = int(cumulative)
+    return total_us / 1000, packages
+
+def check_imports(budgets=IMPORT_BUDGETS_MS, repeat=5):
+    """
+    Time each module's import (best of repeat runs) and check it against its budget and the lazy packages.
+    Return one row per module: (module, milliseconds, budget, eagerly imported heavy packages).
+    Args:
+        budgets (dict): Module names mapped to their budget in milliseconds.
+        repeat (int): Number of fresh interpreters per module; the fastest run is kept to reduce noise.
+    """
+    rows = []
+    for module, budget in budgets.items():
+        # The first run also writes the bytecode cache, so it is not timed
+        import_profile(module)
+        timings = []
+        for _ in range(repeat):
+            milliseconds, packages = import_profile(module)
+            timings.append(milliseconds)
+        rows.append((module, min(timings), budget, sorted(packages.intersection(LAZY_PACKAGES))))
+    return rows
+
+def synthetic_word(rank):
+    """Return the made-up word of a frequency rank; more frequent words are shorter, as in natural text."""
+    # Offset so that every word has at least three letters
+    n = rank + 26 * 26
+    letters = []
+    while n:
+        n, r = divmod(n, 26)
+        letters.append(chr(ord("a") + r))
+    return "".join(reversed(letters))
+
+def synthetic_corpus(num_books, num_tokens, vocabulary_size=50000, exponent=1.1, seed=0):
+    """
+    Generate a Corpus of made-up books whose word frequencies follow Zipf's law, without any network access.
+    Every book draws from the same rank distribution, but past the 100 most common ranks each book maps ranks to words in its own order,
+    so books have distinctive and unique words like real novels.
+    Args:
+        num_books (int): Number of books.
+        num_tokens (int): Total number of tokens, split evenly across the books.
+        vocabulary_size (int): Number of distinct words that can be drawn.
+        exponent (float): Zipf exponent; about 1 for English.
+        seed (int): Seed of the random generator, so runs are reproducible.
+    """
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, vocabulary_size + 1) ** exponent
+    probabilities = weights / weights.sum()
+    corpus = Corpus([synthetic_word(rank) for rank in range(vocabulary_size)])
+    shared = min(100, vocabulary_size)
+    for book in range(num_books):
+        length = num_tokens // num_books + (book < num_tokens % num_books)
+        ranks = rng.choice(vocabulary_size, size=length, p=probabilities)
+        word_of_rank = np.concatenate([np.arange(shared), shared + rng.permutation(vocabulary_size - shared)])
+        corpus.documents[f"Book {book + 1}"] = word_of_rank[ranks].astype(Corpus.dtype)
+    return corpus
+
+def synthetic_raw_text(corpus, title):
+    """
+    Return a book of a synthetic corpus as raw Project Gutenberg text: capitalized sentences between the start and end markers.
+    Args:
+        corpus (Corpus): A corpus from synthetic_corpus.
+        title (string): The title of the book.
+    """
+    words = corpus.words(title)
+    sentences = (" ".join(words[i:i + 12]).capitalize() for i in range(0, len(words), 12))
+    return (
+        f"The Project Gutenberg eBook of {title}\r\n*** START OF THE PROJECT GUTENBERG EBOOK ***\r\n"
+        + ".\r\n".join(sentences)
+        + ".\r\n*** END OF THE PROJECT GUTENBERG EBOOK ***\r\n"
+    )
+
+def analysis_cases(corpus, form="corpus"):
+    """
+    Return the benchmarked calls on a corpus as a {name: function} dictionary, with their inputs prepared as main() prepares them.
+    Args:
+        corpus (Corpus): The books to analyze.
+        form (string): "corpus" to pass the Corpus, as main() does, or "text" to pass dictionaries of joined text, as earlier versions did.
+    """
+    if form == "text":
+        books_text = {title: corpus.text(title) for title in corpus}
+        all_text = {ALL_BOOKS: " ".join(books_text.values())}
+        all_words = all_text[ALL_BOOKS]
+    else:
+        books_text = corpus
+        all_text = all_words = corpus.combined(ALL_BOOKS)
+    # Inputs of the later stages are computed once, outside the timings
+    common_words = {title: return_most_common(books_text if form == "corpus" else books_text[title], 10, title) for title in books_text}
+    common_word_list = {ALL_BOOKS: [word for word, _ in return_most_common(all_words, 50)]}
+    missing_words = update_missing_words(common_words, books_text)
+    return {
+        "unique_words_from_texts": lambda: unique_words_from_texts(books_text),
+        "return_most_common": lambda: return_most_common(all_words, 50),
+        "update_missing_words": lambda: update_missing_words(common_words, books_text),
+        "calculate_tf_idf": lambda: calculate_tf_idf(missing_words, books_text),
+        "calculate_mean_word_length": lambda: calculate_mean_word_length(books_text, 50),
+        "lexical_statistics": lambda: lexical_statistics(books_text, 50),
+        "calculate_word_pair_frequencies": lambda: calculate_word_pair_frequencies(all_text, common_word_list, 1),
+        "analyze_ngrams": lambda: analyze_ngrams(books_text, 2),
+        "count_ngrams": lambda: count_ngrams(books_text, 2),
+        # The map-reduce executor always reads token IDs, whatever the form
+        "run_analysis": lambda: run_analysis(corpus, common_word_list[ALL_BOOKS], 1, ns=[2]),
+    }
+
+def nltk_available():
+    """Return whether the NLTK resources preprocess_text needs are installed, without downloading them."""
+    from data_preprocessing import ensure_nltk_resources
+    try:
+        ensure_nltk_resources(download=False)
+    except LookupError as error:
+        print(f"Skipping preprocess_text: {error}")
+        return False
+    return True
+
+def preprocessing_case(corpus):
+    """
+    Return a call preprocessing every book of a corpus as raw text.
+    Args:
+        corpus (Corpus): A corpus from synthetic_corpus.
+    """
+    from data_preprocessing import preprocess_text
+    raw_texts = [synthetic_raw_text(corpus, title) for title in corpus]
+    return lambda: [preprocess_text(text) for text in raw_texts]
+
+def measure(function, repeat=3):
+    """
+    Return the best wall time of repeat calls in seconds, and the peak traced memory of one more call in bytes.
+    Memoized frequency tables are cleared before every call, so each call does the full work.
+    Args:
+        function (function): The call to measure.
+        repeat (int): Number of timed calls.
+    """
+    timings = []
+    for _ in range(repeat):
+        clear_frequency_tables()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    # Memory is measured in a separate call, as tracing allocations slows them down
+    clear_frequency_tables()
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return min(timings), peak
+
+def run_analysis_benchmarks(sizes=DEFAULT_SIZES, functions=None, form="corpus", repeat=3, vocabulary_size=50000, exponent=1.1, seed=0):
+    """
+    Benchmark the analysis functions on synthetic corpora of each size.
+    Return one result dict per function and size, with its time in seconds and peak memory in bytes.
+    Args:
+        sizes (list): (books, total tokens) pairs.
+        functions (list): Names of the functions to benchmark (all if None); "preprocess_text" needs the NLTK resources.
+        form (string): Input form passed to the functions, "corpus" or "text".
+        repeat (int): Number of timed calls per function; the fastest is kept.
+        vocabulary_size (int): Number of distinct words of the synthetic corpora.
+        exponent (float): Zipf exponent of the synthetic corpora.
+        seed (int): Seed of the synthetic corpora.
+    """
+    results = []
+    preprocess = (functions is None or "preprocess_text" in functions) and nltk_available()
+    for num_books, num_tokens in sizes:
+        corpus = synthetic_corpus(num_books, num_tokens, vocabulary_size, exponent, seed)
+        cases = analysis_cases(corpus, form)
+        if preprocess:
+            cases = dict(preprocess_text=preprocessing_case(corpus), **cases)
+        for name, function in cases.items():
+            if functions is not None and name not in functions:
+                continue
+            seconds, peak = measure(function, repeat)
+            result = {"function": name, "form": form, "books": num_books, "tokens": num_tokens, "seconds": seconds, "peak_bytes": peak}
+            print(f"{name:<32} {num_books:>6} {num_tokens:>10} {seconds:>10.4f} {peak / 2 ** 20:>10.1f}")
+            results.append(result)
+    return results
+
+def scaling_exponents(results):
+    """
+    Fit how each function's time grows with the number of tokens: time ~ tokens ** exponent.
+    Return a {function: exponent} dictionary for the functions measured at two or more sizes.
+    Args:
+        results (list): Results of run_analysis_benchmarks.
+    """
+    curves = {}
+    for result in results:
+        curves.setdefault(result["function"], []).append((result["tokens"], result["seconds"]))
+    exponents = {}
+    for name, points in curves.items():
+        tokens, seconds = np.array(sorted(points), dtype=np.float64).T
+        if len(np.unique(tokens)) > 1:
+            exponents[name] = float(np.polyfit(np.log(tokens), np.log(np.maximum(seconds, 1e-9)), 1)[0])
+    return exponents
+
+def save_results(results, file_path):
+    """
+    Save benchmark results as JSON, with the interpreter and NumPy versions they were measured with.
+    Args:
+        results (list): Results of run_analysis_benchmarks.
+        file_path (string): Path of the JSON file.
+    """
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "results": results,
+        }, f, indent=1)
+
+def compare_results(results, baseline_path, tolerance=0.25, min_seconds=0.01):
+    """
+    Compare results with a saved baseline and print the speedup of each function and size.
+    Return the results that are slower than the baseline by more than the tolerance.
+    Args:
+        results (list): Results of run_analysis_benchmarks.
+        baseline_path (string): Path of a JSON file written by save_results.
+        tolerance (float): Allowed slowdown, ie 0.25 for 25%.
+        min_seconds (float): Timings this short are too noisy to count as slower; they are still printed.
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {
+            (r["function"], r["form"], r["books"], r["tokens"]): r
+            for r in json.load(f)["results"]
+        }
+    regressions = []
+    print(f"{'function':<32} {'books':>6} {'tokens':>10} {'speedup':>10} {'memory':>10}")
+    for result in results:
+        before = baseline.get((result["function"], result["form"], result["books"], result["tokens"]))
+        if before is None:
+            continue
+        speedup = before["seconds"] / result["seconds"] if result["seconds"] else float("inf")
+        memory = result["peak_bytes"] / before["peak_bytes"] if before["peak_bytes"] else float("nan")
+        slower = result["seconds"] > max(before["seconds"] * (1 + tolerance), min_seconds)
+        print(f"{result['function']:<32} {result['books']:>6} {result['tokens']:>10} {speedup:>9.2f}x {memory:>9.2f}x  {'SLOWER' if slower else ''}")
+        if slower:
+            regressions.append(result)
+    return regressions
+
+def parse_size(text):
+    """Parse a corpus size given as BOOKS:TOKENS, ie 10:100000."""
+    books, tokens = text.split(":")
+    return int(books), int(tokens)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark startup and the analysis functions.")
+    commands = parser.add_subparsers(dest="command")
+
+    imports = commands.add_parser("imports", help="Check that the modules import within their startup budgets (default).")
+    imports.add_argument("--repeat", type=int, default=5,
+                         help="Number of timed imports per module; the fastest is reported (default: 5).")
+
+    analysis = commands.add_parser("analysis", help="Time the analysis functions on synthetic Zipf-distributed corpora.")
+    analysis.add_argument("--sizes", type=parse_size, nargs="+", default=DEFAULT_SIZES, metavar="BOOKS:TOKENS",
+                          help="Corpus sizes to benchmark (default: 1:10000 10:100000 100:1000000).")
+    analysis.add_argument("--functions", nargs="+", default=None,
+                          help="Functions to benchmark (default: all; preprocess_text needs the NLTK resources).")
+    analysis.add_argument("--form", default="corpus", choices=["corpus", "text"],
+                          help="Pass the books as a Corpus, or as dictionaries of joined text (default: corpus).")
+    analysis.add_argument("--repeat", type=int, default=3,
+                          help="Number of timed calls per function; the fastest is reported (default: 3).")
+    analysis.add_argument("--vocabulary", type=int, default=50000,
+                          help="Number of distinct words in the synthetic corpora (default: 50000).")
+    analysis.add_argument("--exponent", type=float, default=1.1,
+                          help="Zipf exponent of the synthetic corpora (default: 1.1).")
+    analysis.add_argument("--seed", type=int, default=0,
+                          help="Seed of the synthetic corpora (default: 0).")
+    analysis.add_argument("--save", default=None, metavar="FILE",
+                          help="Save the results as a JSON baseline.")
+    analysis.add_argument("--compare", default=None, metavar="FILE",
+                          help="Compare the results with a saved baseline; exit with an error if a function got slower.")
+    analysis.add_argument("--tolerance", type=float, default=0.25,
+                          help="Slowdown allowed by --compare before it fails (default: 0.25).")
+    args = parser.parse_args(argv)
+
+    if args.command == "analysis":
+        print(f"{'function':<32} {'books':>6} {'tokens':>10} {'seconds':>10} {'peak MB':>10}")
+        results = run_analysis_benchmarks(args.sizes, args.functions, args.form, args.repeat, args.vocabulary, args.exponent, args.seed)
+        exponents = scaling_exponents(results)
+        if exponents:
+            print("\nScaling with the number of tokens (time ~ tokens ** exponent):")
+            for name, exponent in exponents.items():
+                print(f"{name:<32} {exponent:>6.2f}")
+        if args.save:
+            save_results(results, args.save)
+        if args.compare:
+            print()
+            return 1 if compare_results(results, args.compare, args.tolerance) else 0
+        return 0
+
+    failed = False
+    print(f"{'module':<20} {'import ms':>10} {'budget ms':>10}  eager heavy packages")
+    for module, milliseconds, budget, eager in check_imports(repeat=getattr(args, "repeat", 5)):
+        status = "ok" if milliseconds <= budget and not eager else "FAIL"
+        failed = failed or status == "FAIL"
+        print(f"{module:<20} {milliseconds:>10.1f} {budget:>10}  {', '.join(eager) or '-'}  {status}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
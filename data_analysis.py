@@ -1,45 +1,203 @@
 """Create data structures to give data_graphing functions"""
+import hashlib
 import itertools
 import re
-from collections import Counter
-from itertools import chain
+from collections import Counter, deque
 import numpy as np
-import pandas as pd
+from data_corpus import Corpus
+from data_sketch import SpaceSaving
 
-def unique_words_from_texts(book_texts):
+def book_tokens(book_texts, title):
+    '''
+    Return the tokens of one book as an iterable of words; token streams are passed through without being read.
+    Args:
+        book_texts (dict or Corpus): Dictionary with book titles as keys and full text, token lists or token streams as values, or a Corpus.
+        title (string): The title of the book.
+    '''
+    if isinstance(book_texts, Corpus):
+        return book_texts.words(title)
+    text = book_texts[title]
+    return text.split() if isinstance(text, str) else text
+
+def book_words(book_texts, title):
+    '''
+    Return the tokens of one book as a list of words.
+    Args:
+        book_texts (dict or Corpus): Dictionary with book titles as keys and full text or tokens as values, or a Corpus.
+        title (string): The title of the book.
+    '''
+    tokens = book_tokens(book_texts, title)
+    return tokens if isinstance(tokens, list) else list(tokens)
+
+def book_length(book_texts, title):
+    '''
+    Return the number of tokens in one book.
+    Args:
+        book_texts (dict or Corpus): Dictionary with book titles as keys and full text as values, or a Corpus.
+        title (string): The title of the book.
+    '''
+    if isinstance(book_texts, Corpus):
+        return book_texts.num_tokens(title)
+    return frequency_table(book_texts[title], title).length
+
+class FrequencyTable:
+    '''
+    Word counts of one book, most common first with ties in order of first occurrence.
+    Args:
+        words (list): Distinct words of the book.
+        counts (np.ndarray): Count of each word.
+        length (int): Number of tokens in the book.
+        vocabulary (list): Vocabulary the words were decoded from, if the book came from a Corpus.
+    '''
+    def __init__(self, words, counts, length, vocabulary=None):
+        self.words = words
+        self.counts = counts
+        self.length = length
+        self.vocabulary = vocabulary
+        self._lookup = None
+
+    def most_common(self, number_common_words=None):
+        '''
+        Return the most common words as (word, count) pairs, like Counter.most_common.
+        Args:
+            number_common_words (int): What number of most common words to return (all if None).
+        '''
+        return list(zip(self.words[:number_common_words], self.counts[:number_common_words].tolist()))
+
+    def __getitem__(self, word):
+        if self._lookup is None:
+            self._lookup = dict(zip(self.words, self.counts.tolist()))
+        return self._lookup.get(word, 0)
+
+# Frequency tables computed during this run, keyed by book title and content hash
+_frequency_tables = {}
+
+def frequency_table(text, title=None):
+    '''
+    Return the frequency table of a book, counting it only the first time it is seen.
+    Tables are cached by book title and a hash of the content, so each book is tokenized and counted once per run.
+    Args:
+        text (string or Corpus): The full text of the book, or a Corpus.
+        title (string): The title of the book; for a Corpus, None means the whole corpus.
+    '''
+    if isinstance(text, Corpus):
+        documents = [text.tokens(title)] if title is not None else list(text.documents.values())
+        digest = hashlib.blake2b(digest_size=16)
+        for token_ids in documents:
+            digest.update(memoryview(np.ascontiguousarray(token_ids)))
+        key = (title, 'ids', digest.digest())
+        table = _frequency_tables.get(key)
+        # The same IDs only mean the same words over the same vocabulary
+        if table is None or table.vocabulary is not text.vocabulary:
+            ids, counts = most_common_ids(documents, len(text.vocabulary))
+            table = FrequencyTable(text.decode(ids), counts, sum(len(d) for d in documents), text.vocabulary)
+            _frequency_tables[key] = table
+        return table
+    # str caches its own hash, so repeated lookups of the same text are cheap
+    key = (title, 'text', len(text), hash(text))
+    table = _frequency_tables.get(key)
+    if table is None:
+        words = text.split()
+        ranked = Counter(words).most_common()
+        table = FrequencyTable([w for w, _ in ranked], np.array([c for _, c in ranked], dtype=np.int64), len(words))
+        _frequency_tables[key] = table
+    return table
+
+def clear_frequency_tables(title=None):
+    '''
+    Invalidate cached frequency tables and lexical statistics, for one book title or for every book.
+    Args:
+        title (string): Optional book title.
+    '''
+    for cache in (_frequency_tables, _lexical_statistics):
+        if title is None:
+            cache.clear()
+        else:
+            for key in [k for k in cache if k[0] == title]:
+                del cache[key]
+
+def most_common_ids(documents, vocabulary_size, number_common_words=None):
+    '''
+    Return the most common token IDs and their counts over one or more token ID arrays.
+    Ties are ordered by first occurrence, matching Counter.most_common on the same tokens.
+    Args:
+        documents (list): Token ID arrays, treated as one concatenated sequence.
+        vocabulary_size (int): Number of words in the vocabulary.
+        number_common_words (int): What number of most common IDs to return (all if None).
+    '''
+    counts = np.zeros(vocabulary_size, dtype=np.int64)
+    first_seen = np.full(vocabulary_size, np.iinfo(np.int64).max, dtype=np.int64)
+    offset = 0
+    for token_ids in documents:
+        ids, first_index = np.unique(token_ids, return_index=True)
+        np.minimum.at(first_seen, ids, first_index + offset)
+        counts += np.bincount(token_ids, minlength=vocabulary_size)
+        offset += len(token_ids)
+    present = np.flatnonzero(counts)
+    order = np.lexsort((first_seen[present], -counts[present]))[:number_common_words]
+    return present[order], counts[present[order]]
+
+def document_frequencies(corpus):
+    '''
+    Count, in one pass over the books, how many books contain each word.
+    Return an array indexed by token ID.
+    Args:
+        corpus (Corpus): The tokenized books.
+    '''
+    doc_counts = np.zeros(len(corpus.vocabulary), dtype=np.int64)
+    for token_ids in corpus.documents.values():
+        doc_counts[np.unique(token_ids)] += 1
+    return doc_counts
+
+def unique_words_from_texts(book_texts, return_counts=False):
     '''
     Identify unique words for each book based on their presence across all texts.
     Return a dictionary with book titles as keys and unique words for each book, including duplicates, as the value. 
     Args:
-        book_texts (dict): Dictionary with book titles as keys and full text as values.
+        book_texts (dict or Corpus): Dictionary with book titles as keys and full text as values, or a Corpus.
+        return_counts (bool): Return a Counter of each book's unique words instead of the full list with duplicates.
     '''
-    # Tokenize each book into a list of words
-    tokenized_texts = {
-        title: re.findall(r'\b\w+\b', text)
-        for title, text in book_texts.items()
-    }
-    # Create sets of words for each book to determine uniqueness
-    word_sets = {
-        title: set(words) for title, words in tokenized_texts.items()
-    }
-    # Identify unique words for each book
-    unique_words = {
-        book: [
-            word for word in tokenized_texts[book]
-            if word not in set(chain(*[word_sets[b] for b in word_sets if b != book]))
-        ]
-        for book in tokenized_texts
-    }
+    # Tokenize each book into token IDs (a Corpus is already tokenized)
+    if isinstance(book_texts, Corpus):
+        corpus = book_texts
+    else:
+        corpus = Corpus.from_texts({
+            title: re.findall(r'\b\w+\b', text)
+            for title, text in book_texts.items()
+        })
+    # A word is unique to a book when exactly one book contains it
+    unique_mask = document_frequencies(corpus) == 1
+    unique_words = {}
+    for title, token_ids in corpus.items():
+        unique_ids = token_ids[unique_mask[token_ids]]
+        if return_counts:
+            # Keep first-occurrence order so the Counter matches Counter(word_list)
+            ids, first_index, counts = np.unique(unique_ids, return_index=True, return_counts=True)
+            order = np.argsort(first_index)
+            unique_words[title] = Counter(dict(zip(corpus.decode(ids[order]), counts[order].tolist())))
+        else:
+            unique_words[title] = corpus.decode(unique_ids)
     return unique_words
 
-def return_most_common(text, number_common_words):
+def return_most_common(text, number_common_words, title=None, capacity=None):
     '''
     Returns the top [number_common_words] most common words for a text.
     Args:
-        text (string): The full text of the novel to be analyzed 
+        text (string, iterable or Corpus): The full text of the novel to be analyzed, its tokens (ie a stream from stream_preprocessed_tokens), or a Corpus
         number_common_words (int): What number of most common words to return 
+        title (string): Book to analyze when text is a Corpus (if None, the whole corpus is counted); for a string, the title its counts are cached under
+        capacity (int): If set, count approximately in bounded memory with a Space-Saving summary of this many words (see data_sketch)
     '''
-    word_counts = Counter(text.split())
+    if capacity is not None:
+        if isinstance(text, Corpus):
+            tokens = text.words(title) if title is not None else itertools.chain.from_iterable(text.words(t) for t in text)
+        else:
+            tokens = text.split() if isinstance(text, str) else text
+        return SpaceSaving(capacity).update(tokens).most_common(number_common_words)
+    if isinstance(text, (str, Corpus)):
+        return frequency_table(text, title).most_common(number_common_words)
+    # A token stream is counted as it is read, without holding the text
+    word_counts = Counter(text)
     most_common = word_counts.most_common(number_common_words)
     return most_common
 
@@ -47,27 +205,132 @@ def calculate_mean_word_length(text_dict, number_common_words):
     '''
     Calculate the mean length of the most common words for each book.
     Args:
-        text (dict): A dictionary where keys are book titles and 
-        values are full texts
+        text_dict (dict, Corpus or DataFrame): A dictionary where keys are book titles and 
+        values are full texts, a Corpus, or a table from lexical_statistics
         number_common_words (int): The number of most common words to calculate average length of 
     '''
-    common_words_dict = {title: return_most_common(text, number_common_words)
-                        for title, text in text_dict.items()}
+    if isinstance(text_dict, Corpus):
+        # Read the cached statistics rows, which count each book once for every lexical statistic
+        rows = book_statistics_rows(text_dict, number_common_words)
+        return {book: round(row['top_mean_word_length'], 2) for book, row in rows.items()}
+    if not isinstance(text_dict, dict):
+        table = lexical_statistics(text_dict, number_common_words)
+        return {book: round(float(mean), 2) for book, mean in table['top_mean_word_length'].items()}
+    # Texts and token lists only need their most common words, not a whole statistics row
     mean_lengths = {}
-    for book, words in common_words_dict.items():
-        # Extract the words and calculate their lengths
-        word_lengths = np.array([len(word) for word, _ in words])
-        # Compute the mean length
-        mean_lengths[book] = round(float(np.mean(word_lengths)), 2)
+    for title, text in text_dict.items():
+        word_lengths = np.array([len(word) for word, _ in return_most_common(text, number_common_words, title)])
+        mean_lengths[title] = round(float(np.mean(word_lengths)), 2)
     return mean_lengths
 
+# Lexical statistics rows computed during this run, keyed like _frequency_tables plus the statistics' parameters
+_lexical_statistics = {}
+
+def book_statistics(token_ids, word_lengths, number_common_words=50, growth_points=100):
+    '''
+    Compute the lexical statistics of one book in a single vectorized pass over its token IDs.
+    Return a dictionary of the scalar statistics and the arrays behind them (length histograms and the vocabulary growth curve).
+    Args:
+        token_ids (np.ndarray): Token IDs of the book.
+        word_lengths (np.ndarray): Length of each word of the vocabulary, indexed by token ID.
+        number_common_words (int): The number of most common words whose lengths are summarized separately.
+        growth_points (int): Number of evenly spaced positions the vocabulary growth curve is sampled at.
+    '''
+    ids, first_index, counts = np.unique(token_ids, return_index=True, return_counts=True)
+    num_tokens, num_types = len(token_ids), len(ids)
+    lengths = word_lengths[ids]
+    # Most common first, ties in order of first occurrence (as return_most_common ranks them)
+    order = np.lexsort((first_index, -counts))
+    top_lengths = lengths[order[:number_common_words]]
+    # Distinct words seen after each sampled number of tokens: the words first seen before that position
+    growth_tokens = np.linspace(0, num_tokens, growth_points + 1).astype(np.int64)[1:]
+    growth_types = np.searchsorted(np.sort(first_index), growth_tokens)
+    # Zipf's law: log frequency falls linearly with log rank, with a slope near -1
+    if num_types > 1:
+        ranks = np.arange(1, num_types + 1)
+        zipf_slope, _ = np.polyfit(np.log10(ranks), np.log10(counts[order]), 1)
+    else:
+        zipf_slope = np.nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'tokens': num_tokens,
+            'types': num_types,
+            'type_token_ratio': num_types / num_tokens if num_tokens else np.nan,
+            'hapax_legomena': int(np.count_nonzero(counts == 1)),
+            'dis_legomena': int(np.count_nonzero(counts == 2)),
+            'mean_word_length': float(np.dot(lengths, counts) / num_tokens) if num_tokens else np.nan,
+            'top_n': number_common_words,
+            'top_mean_word_length': float(np.mean(top_lengths)) if len(top_lengths) else np.nan,
+            'zipf_slope': float(zipf_slope),
+            # Number of tokens (or of top words) of each length, indexed by length
+            'length_histogram': np.bincount(lengths, weights=counts).astype(np.int64),
+            'top_length_histogram': np.bincount(top_lengths),
+            'growth_tokens': growth_tokens,
+            'growth_types': growth_types,
+        }
+
+def lexical_statistics(text_dict, number_common_words=50, growth_points=100):
+    '''
+    Return a table of lexical statistics with one row per book: token and type counts, type/token ratio, hapax and dis legomena,
+    mean word length over all tokens and over the most common words, Zipf slope, word-length histograms and the vocabulary growth curve.
+    Rows are cached by book title and content hash like frequency tables, so the charts reading them never count a book twice.
+    Args:
+        text_dict (dict, Corpus or DataFrame): A dictionary where keys are book titles and values are full texts, or a Corpus.
+        A table from this function is returned as it is.
+        number_common_words (int): The number of most common words whose lengths are summarized separately.
+        growth_points (int): Number of evenly spaced positions the vocabulary growth curve is sampled at.
+    '''
+    import pandas as pd
+    if isinstance(text_dict, pd.DataFrame):
+        if (text_dict['top_n'] != number_common_words).any():
+            raise ValueError(f"The statistics table summarizes a different number of common words than {number_common_words}")
+        return text_dict
+    return pd.DataFrame.from_dict(book_statistics_rows(text_dict, number_common_words, growth_points), orient='index')
+
+def book_statistics_rows(text_dict, number_common_words=50, growth_points=100):
+    '''
+    Return the lexical statistics of each book as a dictionary with book titles as keys and book_statistics results as values,
+    reusing the rows computed earlier in this run.
+    Args:
+        text_dict (dict or Corpus): A dictionary where keys are book titles and values are full texts, or a Corpus.
+        number_common_words (int): The number of most common words whose lengths are summarized separately.
+        growth_points (int): Number of evenly spaced positions the vocabulary growth curve is sampled at.
+    '''
+    rows = {}
+    corpus_lengths = None
+    for title in text_dict:
+        if isinstance(text_dict, Corpus):
+            token_ids, vocabulary = text_dict.tokens(title), text_dict.vocabulary
+            key = (title, 'ids', hashlib.blake2b(memoryview(np.ascontiguousarray(token_ids)), digest_size=16).digest())
+        else:
+            text = text_dict[title]
+            key, vocabulary = (title, 'text', len(text), hash(text)), None
+        key += (number_common_words, growth_points)
+        cached = _lexical_statistics.get(key)
+        # The same IDs only mean the same words over the same vocabulary
+        if cached is not None and cached[0] is vocabulary:
+            rows[title] = cached[1]
+            continue
+        if vocabulary is None:
+            book = Corpus.from_texts({title: text})
+            token_ids = book.tokens(title)
+            word_lengths = np.fromiter(map(len, book.vocabulary), dtype=np.int64, count=len(book.vocabulary))
+        else:
+            # Word lengths of the shared vocabulary are measured once per call
+            if corpus_lengths is None:
+                corpus_lengths = np.fromiter(map(len, vocabulary), dtype=np.int64, count=len(vocabulary))
+            word_lengths = corpus_lengths
+        rows[title] = book_statistics(token_ids, word_lengths, number_common_words, growth_points)
+        _lexical_statistics[key] = (vocabulary, rows[title])
+    return rows
+
 
 def update_missing_words(common_words, books_text):
     '''
     Complete the most common word dictionary by appending the most common words from one novel (ie "hand" in Study in Scarlet) to another (ie Hound of Baskerville) with count (the count of "hand" in Hound of Baskerville)
     Args:
         word_frequencies (dict): Dictionary with book titles as keys and list of tuples (word, frequency) as values.
-        books_text (dict): A dictionary of books with their full text.
+        books_text (dict or Corpus): A dictionary of books with their full text, or a Corpus.
     '''
     # Create a set of all the most common words across all books
     all_common_words = set(word for words in common_words.values() for word, _ in words)
@@ -77,8 +340,8 @@ def update_missing_words(common_words, books_text):
     for title, top_words in common_words.items():
         # Get the set of words already in the top 10 for the current book
         current_top_words = set(word for word, _ in top_words)
-        # Prepare a Counter for the full word frequencies in this book that haven't been calculated
-        full_word_freq = Counter(re.findall(r'\b\w+\b', books_text[title].lower()))
+        # Full word frequencies of this book, counted once per run and shared with return_most_common
+        full_word_freq = frequency_table(books_text if isinstance(books_text, Corpus) else books_text[title], title)
         # List to hold updated words for this book
         updated_top_words = top_words[:]
         # Check for missing common words and calculate their frequency if needed
@@ -97,114 +360,360 @@ def calculate_tf_idf(word_frequencies, books_text, smooth=False):
     Calculate TF-IDF scores for common words across books.
     Args:
         word_frequencies (dict): Dictionary with book titles as keys and list of tuples (word, frequency) as values.
-        books_text (dict): A dictionary of books with their full text.
+        books_text (dict or Corpus): A dictionary of books with their full text, or a Corpus.
         smooth (bool): Optionally compute smooth IDF.
     '''
+    book_lengths = {book: book_length(books_text, book) for book in word_frequencies}
+    return tf_idf_table(word_frequencies, book_lengths, smooth)
+
+def tf_idf_table(word_frequencies, book_lengths, smooth=False):
+    '''
+    Build the TF-IDF DataFrame of calculate_tf_idf from word counts and book lengths alone.
+    Args:
+        word_frequencies (dict): Dictionary with book titles as keys and list of tuples (word, frequency) as values.
+        book_lengths (dict): Dictionary with book titles as keys and their number of tokens as values.
+        smooth (bool): Optionally compute smooth IDF.
+    '''
+    # pandas is only imported by the functions returning DataFrames, to keep importing this module cheap
+    import pandas as pd
     # Convert frequencies to DataFrame
     data = []
     for book, freqs in word_frequencies.items():
+        total_words = book_lengths[book]
         for word, freq in freqs:
-            total_words = len(books_text[book].split())
             data.append([book, word, freq, freq / total_words])
     tf_df = pd.DataFrame(data, columns=['Book', 'Word', 'Frequency', 'TF'])
-    # Calculate IDF
-    all_words = set(tf_df['Word'])
-    #Create a set of all unique words
-    all_words = set(word for book in word_frequencies.values() for word, _ in book)
-    #Count how many books contain each word
+    #Count how many books contain each word, in one grouped pass over the rows
     num_books = len(word_frequencies)
-    word_doc_count = {
-        word: sum(1 for freqs in word_frequencies.values() if any(w == word and count > 0 for w, count in freqs))
-        for word in all_words
-    }
+    word_doc_count = (
+        tf_df[tf_df['Frequency'] > 0].groupby('Word')['Book'].nunique()
+        .reindex(tf_df['Word'].unique(), fill_value=0)
+    )
     #Calculate IDF for each word
-    idf_scores = {}
-    for word in all_words:
-        # Check if the word appears in any documents (books)
-        doc_count = word_doc_count[word]
-        # Apply "smooth" IDF formula if option enabled
-        if smooth:
-            idf_scores[word] = np.log(1 + (num_books / (doc_count + 1)))
-        else:
-            idf_scores[word] = np.log((num_books / (doc_count)))
+    idf_scores = inverse_document_frequency(word_doc_count.to_numpy(), num_books, smooth)
     # Calculate TF-IDF
-    tf_df['IDF'] = tf_df['Word'].map(idf_scores)
+    tf_df['IDF'] = tf_df['Word'].map(dict(zip(word_doc_count.index, idf_scores)))
     tf_df['TF-IDF'] = tf_df['TF'] * tf_df['IDF']
     return tf_df
 
-def calculate_word_pair_frequencies(all_text, common_word_list, window_size):
+def inverse_document_frequency(doc_counts, num_books, smooth=False):
+    '''
+    Calculate IDF from an array of document frequencies.
+    Args:
+        doc_counts (np.ndarray): Number of books containing each word.
+        num_books (int): Number of books.
+        smooth (bool): Optionally compute smooth IDF.
+    '''
+    doc_counts = np.asarray(doc_counts, dtype=np.float64)
+    # Apply "smooth" IDF formula if option enabled
+    if smooth:
+        return np.log(1 + (num_books / (doc_counts + 1)))
+    with np.errstate(divide='ignore'):
+        return np.log(num_books / doc_counts)
+
+def document_term_matrix(corpus):
+    '''
+    Build a sparse CSR matrix of term counts with one row per book and one column per token ID.
+    Args:
+        corpus (Corpus): The tokenized books.
+    '''
+    from scipy import sparse
+    indptr = [0]
+    indices = [np.zeros(0, dtype=np.int64)]
+    data = [np.zeros(0, dtype=np.int64)]
+    for token_ids in corpus.documents.values():
+        ids, counts = np.unique(token_ids, return_counts=True)
+        indices.append(ids)
+        data.append(counts)
+        indptr.append(indptr[-1] + len(ids))
+    return sparse.csr_matrix(
+        (np.concatenate(data), np.concatenate(indices), np.array(indptr)),
+        shape=(len(corpus), len(corpus.vocabulary)),
+    )
+
+def tf_idf_matrices(corpus, smooth=False):
+    '''
+    Compute TF, IDF and TF-IDF for the full vocabulary of a corpus in vectorized operations.
+    Return the count and TF matrices (sparse CSR, books x token IDs), the IDF array and the TF-IDF matrix.
+    Args:
+        corpus (Corpus): The tokenized books.
+        smooth (bool): Optionally compute smooth IDF.
+    '''
+    from scipy import sparse
+    counts = document_term_matrix(corpus)
+    book_lengths = np.asarray(counts.sum(axis=1), dtype=np.float64).ravel()
+    doc_counts = np.bincount(counts.indices, minlength=counts.shape[1])
+    idf = inverse_document_frequency(doc_counts, counts.shape[0], smooth)
+    # Work on the stored entries directly so TF and TF-IDF keep the sparsity structure of the counts
+    rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+    tf_data = counts.data / book_lengths[rows]
+    tf = sparse.csr_matrix((tf_data, counts.indices, counts.indptr), shape=counts.shape)
+    tf_idf = sparse.csr_matrix((tf_data * idf[counts.indices], counts.indices, counts.indptr), shape=counts.shape)
+    return counts, tf, idf, tf_idf
+
+def calculate_vocabulary_tf_idf(books_text, smooth=False):
+    '''
+    Calculate TF-IDF scores for every word of every book over a sparse document-term matrix.
+    Return the same long-format DataFrame as calculate_tf_idf, with one row per word occurring in a book.
+    Args:
+        books_text (dict or Corpus): A dictionary of books with their full text, or a Corpus.
+        smooth (bool): Optionally compute smooth IDF.
+    '''
+    import pandas as pd
+    corpus = books_text if isinstance(books_text, Corpus) else Corpus.from_texts(books_text)
+    counts, tf, idf, tf_idf = tf_idf_matrices(corpus, smooth)
+    # CSR rows list each book's words in token ID order, so the three matrices line up entry by entry
+    rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+    words = counts.indices
+    return pd.DataFrame({
+        'Book': np.array(corpus.titles(), dtype=object)[rows],
+        'Word': np.array(corpus.vocabulary, dtype=object)[words],
+        'Frequency': counts.data,
+        'TF': tf.data,
+        'IDF': idf[words],
+        'TF-IDF': tf_idf.data,
+    })
+
+def calculate_word_pair_frequencies(all_text, common_word_list, window_size, sliding=False):
     """
     Calculate co-occurrence frequencies of common words within a window size in the given texts.
+    By default each occurrence of a common word is consumed by the first window that counts it, as in earlier versions.
+    With sliding=True, every pair of common-word occurrences at most window_size tokens apart is counted (standard sliding-window co-occurrence).
 
     Args:
-        all_text (dict): Dictionary with title as key and corresponding full texts as value.
+        all_text (dict or Corpus): Dictionary with title as key and corresponding full texts as value, or a Corpus.
         common_word_list (dict): Dictionary with title as key and lists of common words as values.
         window_size (int): The size of the window to check for word co-occurrences.
+        sliding (bool): Use sliding-window semantics instead of consuming each occurrence once.
 
     Returns:
         dict: Co-occurrence matrices for each text identifier.
     """
+    corpus = all_text if isinstance(all_text, Corpus) else Corpus.from_texts(all_text)
     cooccurrence_matrices = {}
-    for book, text in all_text.items():
+    for book, token_ids in corpus.items():
         # List of common words for the current book
         common_words = common_word_list[book]
-        word_indices = [i for i, word in enumerate(text.split()) if word in common_words]
-        # Initialize the co-occurrence matrix
-        matrix = np.zeros((len(common_words), len(common_words)), dtype=int)
         word_to_index = {word: i for i, word in enumerate(common_words)}
-        # Set to track already counted indices
-        counted_indices = set()
-        # Iterate through words and count co-occurrences
-        words = text.split()
-        idx = 0  # Pointer to the current word index
-        while idx < len(word_indices):
-            word_idx = word_indices[idx]
-            if word_idx in counted_indices:
-                idx += 1
-                continue  # Skip if the word index has already been counted
-            window_start = max(word_idx - window_size, 0)
-            window_end = min(word_idx + window_size + 1, len(words))
-            window_words_indices = [
-                (i, words[i]) for i in range(window_start, window_end) if i not in counted_indices
-            ]
-            for i, (index1, word1) in enumerate(window_words_indices):
-                for j, (index2, word2) in enumerate(window_words_indices[i + 1 :], start=i + 1):
-                    if (
-                        #word1 != word2
-                        word1 in word_to_index
-                        and word2 in word_to_index
-                    ):
-                        # Count the co-occurrence of the pair
-                        matrix[word_to_index[word1], word_to_index[word2]] += 1
-                        matrix[word_to_index[word2], word_to_index[word1]] += 1  # Symmetric
-                        counted_indices.add(index1)
-                        counted_indices.add(index2)
-            # Increment the index to skip the word after counting
-            counted_indices.add(word_idx)
-            idx += 1
-        cooccurrence_matrices[book] = matrix
+        # Map every token ID to its row in the matrix, or -1 if it is not a common word
+        target_lookup = np.full(len(corpus.vocabulary), -1, dtype=np.int64)
+        for word, i in word_to_index.items():
+            if word in corpus.word_to_id:
+                target_lookup[corpus.word_to_id[word]] = i
+        targets = target_lookup[token_ids]
+        positions = np.flatnonzero(targets >= 0)
+        targets = targets[positions]
+        groups = None if sliding else consumed_window_groups(positions, window_size)
+        cooccurrence_matrices[book] = window_pair_counts(positions, targets, len(common_words), window_size, groups)
     return cooccurrence_matrices
 
+def window_pair_counts(positions, targets, size, window_size, groups=None):
+    """
+    Count the pairs of common word occurrences sharing a window into a symmetric size x size matrix.
+    Args:
+        positions (np.ndarray): Sorted token positions of the common word occurrences.
+        targets (np.ndarray): Row of each occurrence's word in the matrix.
+        size (int): Number of common words.
+        window_size (int): The size of the window to check for word co-occurrences.
+        groups (np.ndarray): Window of each occurrence (see consumed_window_groups); if None, sliding windows are used.
+    """
+    matrix = np.zeros((size, size), dtype=int)
+    # Pair each occurrence with the ones 1..window_size occurrences after it in the same window
+    for offset in range(1, window_size + 1):
+        if groups is None:
+            # Every common word occurrence belongs to one window starting at each position
+            same_window = positions[offset:] - positions[:-offset] <= window_size
+        else:
+            same_window = groups[offset:] == groups[:-offset]
+        first = targets[:-offset][same_window]
+        second = targets[offset:][same_window]
+        pair_counts = np.bincount(first * size + second, minlength=size ** 2).reshape(size, size)
+        # Symmetric
+        matrix += pair_counts + pair_counts.T
+    return matrix
+
+def consumed_window_groups(positions, window_size):
+    """
+    Assign each common word occurrence to the window that consumes it.
+    A window starts at the first unconsumed occurrence and takes every occurrence up to window_size tokens after it; the next window starts after that.
+    Args:
+        positions (np.ndarray): Sorted token positions of the common word occurrences.
+        window_size (int): The size of the window to check for word co-occurrences.
+    """
+    # For each occurrence, the index of the first occurrence beyond its window
+    next_start = np.searchsorted(positions, positions + window_size, side='right').tolist()
+    is_start = np.zeros(len(positions), dtype=np.int64)
+    start = 0
+    while start < len(positions):
+        is_start[start] = 1
+        start = next_start[start]
+    return np.cumsum(is_start)
+
 def generate_ngrams(text, n):
     """
     Generate a list of n-grams from a given text.
     Args:
-        text (str): Input text.
+        text (str or list): Input text, or a list (or other sequence) of its tokens.
         n (int): Size of n-grams to generate.
     """
-    words = text.split()
-    ngrams = list(itertools.islice(zip(*(words[i:] for i in range(n))), len(words) - n + 1))
+    words = text.split() if isinstance(text, str) else text
+    ngrams = list(itertools.islice(zip(*(words[i:] for i in range(n))), max(0, len(words) - n + 1)))
     return ngrams
 
+def iter_ngrams(tokens, n):
+    """
+    Yield the n-grams of a sequence or stream of tokens, holding only the last n tokens.
+    Args:
+        tokens (iterable): Input tokens.
+        n (int): Size of n-grams to generate.
+    """
+    window = deque(maxlen=n)
+    for token in tokens:
+        window.append(token)
+        if len(window) == n:
+            yield tuple(window)
+
 def analyze_ngrams(book_texts, n):
     """
     Analyze n-gram frequencies for a collection of books and return as a dict with book titles as keys and n-gram frequencies as values.
     Args:
-        book_texts (dict): Dictionary with book titles as keys and full text as values.
+        book_texts (dict or Corpus): Dictionary with book titles as keys and full text, token lists or token streams as values, or a Corpus.
         n (int): Size of n-grams to analyze.
     """
-    ngram_frequencies = {
-        title: Counter(generate_ngrams(text, n))
-        for title, text in book_texts.items()
+    ngram_frequencies = {}
+    for title in book_texts:
+        tokens = book_tokens(book_texts, title)
+        # Sequences are zipped with offset slices of themselves, which is faster; only streams need the sliding window
+        ngrams = generate_ngrams(tokens, n) if isinstance(tokens, (list, tuple)) else iter_ngrams(tokens, n)
+        ngram_frequencies[title] = Counter(ngrams)
+    return ngram_frequencies
+
+class NgramCounts:
+    """
+    N-gram counts of one book kept as arrays of token IDs, ordered like Counter.most_common.
+    Args:
+        vocabulary (list): Words indexed by token ID.
+        ngram_ids (np.ndarray): One row of token IDs per distinct n-gram, most common first.
+        counts (np.ndarray): Count of each row.
+    """
+    def __init__(self, vocabulary, ngram_ids, counts):
+        self.vocabulary = vocabulary
+        self.ngram_ids = ngram_ids
+        self.counts = counts
+        self._index = None
+
+    def most_common(self, n=None):
+        """
+        Return the n most common n-grams as (tuple of words, count) pairs, like Counter.most_common.
+        Args:
+            n (int): Number of n-grams to return (all if None).
+        """
+        vocabulary = self.vocabulary
+        return [
+            (tuple(vocabulary[i] for i in row), count)
+            for row, count in zip(self.ngram_ids[:n].tolist(), self.counts[:n].tolist())
+        ]
+
+    def total(self):
+        """Return the number of n-gram occurrences counted."""
+        return int(self.counts.sum())
+
+    def __getitem__(self, ngram):
+        if self._index is None:
+            self._index = {ngram: i for i, (ngram, _) in enumerate(self.most_common())}
+        i = self._index.get(tuple(ngram))
+        return 0 if i is None else int(self.counts[i])
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __iter__(self):
+        return (ngram for ngram, _ in self.most_common())
+
+    def items(self):
+        """Return (tuple of words, count) pairs, most common first."""
+        return self.most_common()
+
+def ngram_counts_from_ids(token_ids, ns, vocabulary, min_count=1):
+    """
+    Count the n-grams of a token ID array for several values of n in one pass.
+    Args:
+        token_ids (np.ndarray): Token IDs of one book.
+        ns (iterable): Sizes of n-grams to count.
+        vocabulary (list): Words indexed by token ID.
+        min_count (int): Drop n-grams occurring fewer times than this.
+    """
+    return {
+        n: NgramCounts(vocabulary, ngram_ids, counts)
+        for n, (ngram_ids, counts, _) in ngram_tables(token_ids, ns, len(vocabulary), min_count).items()
     }
+
+def ngram_tables(token_ids, ns, vocabulary_size, min_count=1):
+    """
+    Count the n-grams of a token ID array for several values of n in one pass.
+    Return a dict with n as keys and (n-gram rows of token IDs, counts, position of first occurrence) as values, most common first.
+    Each n-gram is packed into one int64 key (key of the (n-1)-gram times the vocabulary size plus the next ID) and counted with np.unique.
+    When the keys would overflow int64, rows of token IDs are compared as raw bytes instead, which stays exact.
+    Args:
+        token_ids (np.ndarray): Token IDs of one book.
+        ns (iterable): Sizes of n-grams to count.
+        vocabulary_size (int): Number of words in the vocabulary.
+        min_count (int): Drop n-grams occurring fewer times than this.
+    """
+    ids = np.asarray(token_ids, dtype=np.int64)
+    vocabulary_size = max(vocabulary_size, 1)
+    wanted = set(ns)
+    if not wanted:
+        return {}
+    results = {}
+    keys = ids
+    packable = True
+    for n in range(1, max(wanted) + 1):
+        if len(ids) < n:
+            keys = ids[:0]
+        elif n > 1 and packable and vocabulary_size ** n <= np.iinfo(np.int64).max:
+            # Extend each (n-1)-gram key by the token that follows it
+            keys = keys[:-1] * vocabulary_size + ids[n - 1:]
+        elif n > 1:
+            packable = False
+            windows = np.ascontiguousarray(np.lib.stride_tricks.sliding_window_view(ids, n))
+            keys = windows.view(np.dtype((np.void, windows.dtype.itemsize * n))).ravel()
+        if n not in wanted:
+            continue
+        _, first_index, counts = np.unique(keys, return_index=True, return_counts=True)
+        keep = counts >= min_count
+        first_index, counts = first_index[keep], counts[keep]
+        # Most common first; ties in order of first occurrence, as in Counter.most_common
+        order = np.lexsort((first_index, -counts))
+        first_index, counts = first_index[order], counts[order]
+        ngram_ids = ids[first_index[:, None] + np.arange(n)]
+        results[n] = (ngram_ids, counts, first_index)
+    return results
+
+def count_ngrams_multi(book_texts, ns, min_count=1):
+    """
+    Count n-grams of several sizes for a collection of books on integer token IDs.
+    Return a dict with n as keys and, as values, dicts with book titles as keys and NgramCounts as values.
+    Args:
+        book_texts (dict or Corpus): Dictionary with book titles as keys and full text as values, or a Corpus.
+        ns (iterable): Sizes of n-grams to analyze.
+        min_count (int): Drop n-grams occurring fewer times than this.
+    """
+    corpus = book_texts if isinstance(book_texts, Corpus) else Corpus.from_texts(book_texts)
+    ns = list(ns)
+    ngram_frequencies = {n: {} for n in ns}
+    for title, token_ids in corpus.items():
+        for n, counts in ngram_counts_from_ids(token_ids, ns, corpus.vocabulary, min_count).items():
+            ngram_frequencies[n][title] = counts
     return ngram_frequencies
+
+def count_ngrams(book_texts, n, min_count=1):
+    """
+    Analyze n-gram frequencies like analyze_ngrams, but count them on integer token IDs.
+    Return a dict with book titles as keys and NgramCounts, which plot_ngrams reads through most_common, as values.
+    Args:
+        book_texts (dict or Corpus): Dictionary with book titles as keys and full text as values, or a Corpus.
+        n (int): Size of n-grams to analyze.
+        min_count (int): Drop n-grams occurring fewer times than this.
+    """
+    return count_ngrams_multi(book_texts, [n], min_count)[n]
@@ -0,0 +1,49 @@
+"""Cache cleaned books by the content hash of their raw text"""
+import hashlib
+from data_preprocessing import preprocess_all_books, PREPROCESSING_VERSION
+from data_storage import TokenStore, CLEANED_STORE_DIR
+from data_profiling import stage
+
+CACHE_DIR = CLEANED_STORE_DIR
+
+def book_key(raw_text, version=PREPROCESSING_VERSION):
+    """
+    Return the cache key of a raw book: a hash of the preprocessing version and the text.
+    Args:
+        raw_text (string): Contains the unprocessed, downloaded text
+        version (int): Version of the preprocessing pipeline that produced the cleaned text.
+    """
+    digest = hashlib.sha256(f"v{version}\n".encode("utf-8"))
+    digest.update(raw_text.encode("utf-8"))
+    return digest.hexdigest()
+
+def load_or_preprocess_corpus(books_raw, workers=1, cache_dir=CACHE_DIR):
+    """
+    Return a Corpus of the cleaned books, only preprocessing books that are new or have changed.
+    Cached books are memory-mapped from the token store rather than parsed, and books no raw book hashes to any more
+    (ie after a text or pipeline version change) are removed from it.
+    Args:
+        books_raw (json object): Contains all of the raw books - their text and metadata
+        workers (int): Number of processes used to preprocess the books that are not cached.
+        cache_dir (string): Directory of the token store.
+    """
+    store = TokenStore(cache_dir)
+    keys = [book_key(book["text"]) for book in books_raw]
+    current = set(keys)
+    stale = [key for key in store.books if key not in current]
+    for key in stale:
+        store.remove(key)
+    # Preprocess copies of the raw books so that books_raw is left untouched
+    missing = [(key, dict(book)) for key, book in zip(keys, books_raw) if key not in store]
+    if missing:
+        print(f"Preprocessing {len(missing)} of {len(books_raw)} books...")
+        with stage("preprocess_all_books", books=len(missing)) as record:
+            preprocess_all_books([book for _, book in missing], workers=workers)
+            record["tokens"] = sum(len(book["text"]) for _, book in missing)
+        with stage("store_books", books=len(missing)):
+            for key, book in missing:
+                store.add(key, book["text"])
+            store.flush()
+    elif stale:
+        store.flush()
+    return store.corpus([(book["title"], key) for key, book in zip(keys, books_raw)])
@@ -1,7 +1,12 @@
 """Download and store text and metadata"""
 import re
 import json
-import requests
+import os
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from data_storage import load_raw_books, save_raw_books, RAW_STORE_DIR
+from data_similarity import drop_duplicate_books
 
 # URLs for the 5 Sherlock Holmes books
 urls = [
@@ -12,19 +17,129 @@ urls = [
     "https://www.gutenberg.org/cache/epub/1661/pg1661.txt",  # The Adventures of Sherlock Holmes
     ]
 
+# Per-URL copies of downloaded books, revalidated with ETag/Last-Modified
+DOWNLOAD_CACHE_DIR = "downloads"
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+def create_session(pool_size=4):
+    """
+    Create a requests session whose connection pool is shared by the download threads.
+    Args:
+        pool_size (int): Number of connections kept open per host.
+    """
+    # requests is only imported when books are downloaded; runs served from the raw store never need it
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def download_cache_paths(url, cache_dir=DOWNLOAD_CACHE_DIR):
+    """
+    Return the paths of the cached text and validators (ETag/Last-Modified) of a URL.
+    Args:
+        url (string): Contains a Project Gutenberg URL.
+        cache_dir (string): Directory of the download cache.
+    """
+    name = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"{name}.txt"), os.path.join(cache_dir, f"{name}.json")
+
+def read_download_cache(url, cache_dir=DOWNLOAD_CACHE_DIR):
+    """
+    Return the cached text and validators of a URL, or (None, {}) if it has not been downloaded.
+    Args:
+        url (string): Contains a Project Gutenberg URL.
+        cache_dir (string): Directory of the download cache.
+    """
+    text_path, meta_path = download_cache_paths(url, cache_dir)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            validators = json.load(f)
+        with open(text_path, "r", encoding="utf-8", newline="") as f:
+            return f.read(), validators
+    except (FileNotFoundError, ValueError):
+        return None, {}
+
+def write_download_cache(url, text, validators, cache_dir=DOWNLOAD_CACHE_DIR):
+    """
+    Store the text and validators of a URL; the validators are written last so a partial write is never trusted.
+    Args:
+        url (string): Contains a Project Gutenberg URL.
+        text (string): The downloaded text.
+        validators (dict): ETag and Last-Modified headers of the response.
+        cache_dir (string): Directory of the download cache.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    text_path, meta_path = download_cache_paths(url, cache_dir)
+    with open(f"{text_path}.tmp", "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+    os.replace(f"{text_path}.tmp", text_path)
+    with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(validators, f)
+    os.replace(f"{meta_path}.tmp", meta_path)
+
 # URL request; return plain text if successful
-def download_book(url):
+def download_book(url, session=None, cache_dir=None, retries=3, backoff=0.5, timeout=10):
     """
     Download the text from a given URL.
     Args: 
         url (string): Contains a Project Gutenberg URL.
+        session (requests.Session): Optional session to reuse pooled connections.
+        cache_dir (string): Optional download cache directory; a cached copy is revalidated instead of downloaded again.
+        retries (int): Number of retries after a connection error, timeout or transient status code.
+        backoff (float): Seconds to wait before the first retry; doubled after each one.
+        timeout (float): Seconds to wait for the server.
     """
-    response = requests.get(url, timeout=10)
-    if response.status_code == 200:  # HTTP status code for OK
-        return response.text
-    else:
-        print(f"Failed to download book from {url}")
-        return None
+    import requests
+    cached_text, validators = read_download_cache(url, cache_dir) if cache_dir else (None, {})
+    headers = {}
+    if cached_text is not None:
+        if "etag" in validators:
+            headers["If-None-Match"] = validators["etag"]
+        if "last_modified" in validators:
+            headers["If-Modified-Since"] = validators["last_modified"]
+    get = session.get if session is not None else requests.get
+    for attempt in range(retries + 1):
+        try:
+            response = get(url, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            response = None
+        if response is not None and response.status_code == 304 and cached_text is not None:  # Not Modified
+            return cached_text
+        if response is not None and response.status_code == 200:  # HTTP status code for OK
+            if cache_dir:
+                validators = {}
+                if "ETag" in response.headers:
+                    validators["etag"] = response.headers["ETag"]
+                if "Last-Modified" in response.headers:
+                    validators["last_modified"] = response.headers["Last-Modified"]
+                write_download_cache(url, response.text, validators, cache_dir)
+            return response.text
+        if response is not None and response.status_code not in RETRY_STATUS_CODES:
+            break
+        if attempt < retries:
+            # Exponential backoff before the next attempt
+            time.sleep(backoff * 2 ** attempt)
+    if cached_text is not None:
+        print(f"Failed to revalidate {url}; using the cached copy")
+        return cached_text
+    print(f"Failed to download book from {url}")
+    return None
+
+def download_books(book_urls, workers=4, cache_dir=DOWNLOAD_CACHE_DIR, **kwargs):
+    """
+    Download several books concurrently over a pooled session. Return the texts in the order of book_urls, with None for failures.
+    Args:
+        book_urls (list): Project Gutenberg URLs.
+        workers (int): Maximum number of downloads in flight.
+        cache_dir (string): Directory of the download cache.
+        **kwargs: Passed on to download_book (retries, backoff, timeout).
+    """
+    with create_session(workers) as session, ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda url: download_book(url, session, cache_dir, **kwargs), book_urls))
 
 # Get title, author, and language from the downloaded text
 def extract_metadata(raw_text):
@@ -42,29 +157,48 @@ def extract_metadata(raw_text):
     return {"title": title, "author": author, "language": language}
 
 # Load raw books if available; if not, redownload them
-def load_or_download_books():
+def load_or_download_books(store_dir=RAW_STORE_DIR, legacy_file="books_raw.json", book_urls=None, workers=4, cache_dir=DOWNLOAD_CACHE_DIR, duplicate_threshold=0.9):
     """
-    If the book has not already been downloaded, download it, extract metadata, and save to a JSON file. If the book has been downloaded, load the JSON file and open it.
+    If the book has not already been downloaded, download it, extract metadata, and save it to the raw book store. If the book has been downloaded, load it from the store.
+    A books_raw.json from earlier versions is converted to the store instead of downloading again.
+    Near-duplicates (ie the same novel under two ebook numbers) are dropped before the books are stored, keeping the first copy.
+    Args:
+        store_dir (string): Directory of the raw book store.
+        legacy_file (string): JSON file used by earlier versions to hold the raw books.
+        book_urls (list): URLs to download; the Sherlock Holmes novels by default.
+        workers (int): Maximum number of concurrent downloads.
+        cache_dir (string): Directory of the per-URL download cache, so a failed download does not force re-downloading the rest.
+        duplicate_threshold (float): Minimum Jaccard similarity of two books' shingles to drop the later one; None keeps every book.
     """
     try:
-        with open("books_raw.json", "r", encoding="utf-8") as f:
+        rawbooks = load_raw_books(store_dir)
+        if not rawbooks:  # Check if the store is empty
+            raise ValueError("The raw book store is empty.")
+        return rawbooks
+    except (FileNotFoundError, ValueError):
+        pass
+    try:
+        with open(legacy_file, "r", encoding="utf-8") as f:
             rawbooks = json.load(f)
             if not rawbooks:  # Check if the file is empty
                 raise ValueError("The JSON file is empty.")
+        if duplicate_threshold is not None:
+            rawbooks = drop_duplicate_books(rawbooks, duplicate_threshold)
     except (FileNotFoundError, ValueError):
-        # Download books to a JSON file if they haven't been downloaded
-        print("Unable to load books_raw.json. Downloading books...")
-        books = []
-        for url in urls:
-            raw_text = download_book(url)
+        # Download books if they haven't been downloaded
+        print(f"Unable to load {store_dir}. Downloading books...")
+        rawbooks = []
+        raw_texts = download_books(book_urls or urls, workers, cache_dir)
+        for raw_text in raw_texts:
             if raw_text:
                 metadata = extract_metadata(raw_text)
                 metadata["text"] = raw_text  # Include the full raw text
-                books.append(metadata)
-         # Save all books to the JSON file
-        with open("books_raw.json", "w", encoding="utf-8") as f:
-            json.dump(books, f, indent=4)
-        # Reopen the file to read the saved data
-        with open("books_raw.json", "r", encoding="utf-8") as f:
-            rawbooks = json.load(f)
+                rawbooks.append(metadata)
+        if duplicate_threshold is not None:
+            rawbooks = drop_duplicate_books(rawbooks, duplicate_threshold)
+        if None in raw_texts:
+            # Leave the store unwritten so the next run retries; the books that did download are in the download cache
+            return rawbooks
+    # Save all books to the raw book store
+    save_raw_books(rawbooks, store_dir)
     return rawbooks
@@ -0,0 +1,164 @@
+"""Store the cleaned books as token IDs over one shared vocabulary"""
+import sys
+import numpy as np
+
+class Corpus:
+    """
+    A collection of tokenized books sharing an interned vocabulary.
+    Each book is stored once as a compact NumPy int32 array of token IDs, so analysis functions can count and slice without re-splitting joined strings.
+    Args:
+        vocabulary (list): Optional list of words; the position of each word is its token ID.
+    """
+    dtype = np.int32
+
+    def __init__(self, vocabulary=None):
+        self.vocabulary = []
+        self.word_to_id = {}
+        self.documents = {}
+        for word in vocabulary or []:
+            self.intern(word)
+
+    @classmethod
+    def from_books(cls, books):
+        """
+        Build a corpus from the cleaned books produced by preprocess_all_books.
+        Args:
+            books (list): List of book dictionaries with a title and a list of tokens as text.
+        """
+        corpus = cls()
+        for book in books:
+            corpus.add(book["title"], book["text"])
+        return corpus
+
+    @classmethod
+    def from_texts(cls, book_texts):
+        """
+        Build a corpus from a dictionary of texts.
+        Args:
+            book_texts (dict): Dictionary with book titles as keys and either full text or token lists as values.
+        """
+        corpus = cls()
+        for title, text in book_texts.items():
+            corpus.add(title, text.split() if isinstance(text, str) else text)
+        return corpus
+
+    def intern(self, word):
+        """
+        Return the token ID of a word, adding it to the vocabulary if it is new.
+        Args:
+            word (string): The word to look up.
+        """
+        token_id = self.word_to_id.get(word)
+        if token_id is None:
+            token_id = len(self.vocabulary)
+            word = sys.intern(word)
+            self.vocabulary.append(word)
+            self.word_to_id[word] = token_id
+        return token_id
+
+    def add(self, title, tokens):
+        """
+        Encode a book's tokens and store them under its title.
+        Args:
+            title (string): The title of the book.
+            tokens (list): The book's cleaned tokens.
+        """
+        intern = self.intern
+        self.documents[title] = np.fromiter((intern(w) for w in tokens), dtype=self.dtype, count=len(tokens))
+
+    def encode(self, words):
+        """
+        Convert words into token IDs; words outside the vocabulary map to -1.
+        Args:
+            words (list): Words to convert.
+        """
+        return np.array([self.word_to_id.get(w, -1) for w in words], dtype=self.dtype)
+
+    def decode(self, token_ids):
+        """
+        Convert token IDs back into words.
+        Args:
+            token_ids (iterable): Token IDs to convert.
+        """
+        vocabulary = self.vocabulary
+        return [vocabulary[i] for i in np.asarray(token_ids).tolist()]
+
+    def titles(self):
+        """Return the book titles in insertion order."""
+        return list(self.documents)
+
+    def tokens(self, title):
+        """Return the token ID array of a book."""
+        return self.documents[title]
+
+    def words(self, title):
+        """Return the tokens of a book as a list of words."""
+        return self.decode(self.documents[title])
+
+    def text(self, title):
+        """Return the tokens of a book joined into a single string."""
+        return ' '.join(self.words(title))
+
+    def num_tokens(self, title=None):
+        """
+        Return the number of tokens in one book, or in the whole corpus if no title is given.
+        Args:
+            title (string): Optional book title.
+        """
+        if title is not None:
+            return len(self.documents[title])
+        return sum(len(ids) for ids in self.documents.values())
+
+    def counts(self, title=None):
+        """
+        Return an array of term counts indexed by token ID for one book, or for the whole corpus.
+        Args:
+            title (string): Optional book title.
+        """
+        docs = [self.documents[title]] if title is not None else self.documents.values()
+        total = np.zeros(len(self.vocabulary), dtype=np.int64)
+        for ids in docs:
+            total += np.bincount(ids, minlength=len(self.vocabulary))
+        return total
+
+    def combined(self, title):
+        """
+        Return a corpus sharing this vocabulary with every book concatenated into a single document.
+        Args:
+            title (string): Title of the combined document (ie "Sherlock Holmes Novels").
+        """
+        merged = self.subset([])
+        docs = list(self.documents.values())
+        merged.documents[title] = np.concatenate(docs) if docs else np.zeros(0, dtype=self.dtype)
+        return merged
+
+    def subset(self, titles):
+        """
+        Return a corpus sharing this vocabulary that only holds the given books.
+        Args:
+            titles (iterable): Titles of the books to keep.
+        """
+        view = type(self).__new__(type(self))
+        view.vocabulary = self.vocabulary
+        view.word_to_id = self.word_to_id
+        view.documents = {title: self.documents[title] for title in titles}
+        return view
+
+    def items(self):
+        """Return (title, token ID array) pairs."""
+        return self.documents.items()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __iter__(self):
+        return iter(self.documents)
+
+    def __contains__(self, title):
+        return title in self.documents
+
+    def __getitem__(self, title):
+        return self.documents[title]
+
+    def __repr__(self):
+        return f"Corpus({len(self.documents)} books, {self.num_tokens()} tokens, {len(self.vocabulary)} words)"
@@ -0,0 +1,157 @@
+"""Track how often words occur across the positions of a book with prefix sums of their counts"""
+import numpy as np
+from data_positional_index import smallest_unsigned_dtype
+
+# Chapter markers closer together than this are one table of contents rather than chapters of their own
+CHAPTER_MIN_GAP = 100
+
+def chapter_starts(corpus, title, marker="chapter", min_gap=CHAPTER_MIN_GAP):
+    """
+    Return the token positions where a book's chapters start, from the chapter headings that survive preprocessing as the word "chapter".
+    The word also opens every entry of the table of contents at the start of a book, so markers fewer than min_gap tokens apart form
+    one run and only the last of a run starts a chapter: the last entry of a table of contents is the heading of the first chapter,
+    which directly follows it.
+    Args:
+        corpus (Corpus): The tokenized books.
+        title (string): The title of the book.
+        marker (string): The word left of a chapter heading.
+        min_gap (int): Fewest tokens between two chapter starts.
+    """
+    if marker not in corpus.word_to_id:
+        return np.zeros(0, dtype=np.int64)
+    positions = np.flatnonzero(corpus.tokens(title) == corpus.word_to_id[marker])
+    if len(positions) == 0:
+        return positions
+    return positions[np.append(np.diff(positions) >= min_gap, True)]
+
+class DispersionIndex:
+    """
+    Cumulative counts of chosen words over each book's tokens: prefix[i, p] is the number of times word i occurs in the first p tokens.
+    Any count over a range of tokens is then the difference of two entries, so range counts, chapter histograms and rolling-window
+    curves cost O(1) per range and word, however long the ranges are, instead of a scan of the book for each question.
+    Memory is one row of book length + 1 counters per word, in the smallest unsigned dtype holding the word's largest count.
+    Args:
+        words (list): The tracked words.
+        prefixes (dict): Book titles mapped to their (number of words, book length + 1) prefix count arrays.
+    """
+    def __init__(self, words, prefixes):
+        self.words = list(words)
+        self.word_index = {word: i for i, word in enumerate(self.words)}
+        self.prefixes = prefixes
+
+    @classmethod
+    def from_corpus(cls, corpus, words, titles=None):
+        """
+        Build the prefix counts of words with one scan of each book's tokens and one cumulative sum over its (words x tokens) array.
+        Args:
+            corpus (Corpus): The tokenized books.
+            words (list): Words to track; words outside the vocabulary are tracked with zero counts.
+            titles (iterable): Books to index; every book of the corpus by default.
+        """
+        words = list(dict.fromkeys(words))
+        # Map every token ID to the row of its word, or -1 for untracked words
+        lookup = np.full(len(corpus.vocabulary), -1, dtype=np.int64)
+        for i, word in enumerate(words):
+            if word in corpus.word_to_id:
+                lookup[corpus.word_to_id[word]] = i
+        prefixes = {}
+        for title in (corpus.titles() if titles is None else titles):
+            rows = lookup[corpus.tokens(title)]
+            # A word's prefix counts never exceed the book length
+            prefix = np.zeros((len(words), len(rows) + 1), dtype=smallest_unsigned_dtype(len(rows)))
+            # Mark each tracked occurrence at its row and position (each position holds one word), then sum every row at once
+            positions = np.flatnonzero(rows >= 0)
+            prefix[rows[positions], positions + 1] = 1
+            np.cumsum(prefix, axis=1, dtype=prefix.dtype, out=prefix)
+            prefixes[title] = prefix
+        return cls(words, prefixes)
+
+    def length(self, title):
+        """Return the number of tokens of a book."""
+        return self.prefixes[title].shape[1] - 1
+
+    def _rows(self, words):
+        """Return the prefix rows of words (all tracked words if None)."""
+        if words is None:
+            return slice(None)
+        return [self.word_index[word] for word in words]
+
+    def count(self, word, title, start=0, stop=None):
+        """
+        Return how many times a word occurs in tokens start to stop (exclusive) of a book.
+        Args:
+            word (string): A tracked word.
+            title (string): The title of the book.
+            start (int): First token of the range.
+            stop (int): End of the range; the end of the book if None.
+        """
+        prefix = self.prefixes[title][self.word_index[word]]
+        stop = len(prefix) - 1 if stop is None else stop
+        return int(prefix[stop]) - int(prefix[start])
+
+    def range_counts(self, title, starts, stops, words=None):
+        """
+        Return a (words x ranges) array of the counts of words in many token ranges of a book at once.
+        Args:
+            title (string): The title of the book.
+            starts (array-like): First token of each range.
+            stops (array-like): End (exclusive) of each range.
+            words (list): Words to count; all tracked words if None.
+        """
+        prefix = self.prefixes[title][self._rows(words)]
+        return prefix[:, np.asarray(stops)].astype(np.int64) - prefix[:, np.asarray(starts)]
+
+    def histogram(self, title, bins=10, boundaries=None, words=None):
+        """
+        Return the counts of words in consecutive segments of a book, ie its chapters, as (words x segments counts, segment edges).
+        Args:
+            title (string): The title of the book.
+            bins (int): Number of equal segments, used when no boundaries are given.
+            boundaries (array-like): Token positions where segments start, ie chapter_starts(); the first segment starts at 0.
+            words (list): Words to count; all tracked words if None.
+        """
+        length = self.length(title)
+        if boundaries is None:
+            edges = np.linspace(0, length, bins + 1).astype(np.int64)
+        else:
+            edges = np.unique(np.concatenate([[0], np.clip(boundaries, 0, length), [length]]).astype(np.int64))
+        return self.range_counts(title, edges[:-1], edges[1:], words), edges
+
+    def rolling(self, title, window=2000, step=None, words=None):
+        """
+        Return the frequency of words (per 1,000 tokens) in a window sliding over a book, as (window centers, words x windows frequencies).
+        Args:
+            title (string): The title of the book.
+            window (int): Number of tokens per window; the whole book if it is shorter.
+            step (int): Tokens between window starts; a tenth of the window by default.
+            words (list): Words to count; all tracked words if None.
+        """
+        length = self.length(title)
+        window = max(1, min(window, length))
+        starts = np.arange(0, length - window + 1, step or max(1, window // 10))
+        counts = self.range_counts(title, starts, starts + window, words)
+        return starts + window / 2, counts * 1000 / window
+
+    def juilland_d(self, title, parts=10, words=None):
+        """
+        Return Juilland's D of words over equal parts of a book: 1 for a word spread evenly, near 0 for one concentrated in a single part.
+        Args:
+            title (string): The title of the book.
+            parts (int): Number of equal parts.
+            words (list): Words to measure; all tracked words if None.
+        """
+        counts, _ = self.histogram(title, parts, words=words)
+        mean = counts.mean(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            variation = counts.std(axis=1) / mean
+            return np.where(mean > 0, 1 - variation / np.sqrt(parts - 1), np.nan)
+
+    def nbytes(self):
+        """Return the bytes held by the prefix counts."""
+        return sum(prefix.nbytes for prefix in self.prefixes.values())
+
+    def __contains__(self, word):
+        return word in self.word_index
+
+    def __repr__(self):
+        return f"DispersionIndex({len(self.words)} words, {len(self.prefixes)} books, {self.nbytes()} bytes)"
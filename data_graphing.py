@@ -1,14 +1,80 @@
 """Visualize data structures"""
+import itertools
 import os
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
 from os import path
 import numpy as np
 import pandas as pd
-import seaborn as sns # External
-from wordcloud import WordCloud # External
-from PIL import Image
 import matplotlib.pyplot as plt
 import matplotlib.cm as cm
-from data_analysis import calculate_mean_word_length
+from data_analysis import calculate_mean_word_length, lexical_statistics, book_length, frequency_table
+from data_corpus import Corpus
+from data_profiling import stage
+
+# Where figures go: with no directory they are shown interactively, otherwise each one is saved there
+OUTPUT = {"dir": None, "format": "png"}
+
+def configure_output(output_dir=None, image_format="png"):
+    """
+    Choose between showing figures interactively and saving them headless.
+    Args:
+        output_dir (string): Directory to save figures in with the Agg backend; None shows them with plt.show().
+        image_format (string): File format of saved figures, ie "png" or "svg".
+    """
+    OUTPUT["dir"] = output_dir
+    OUTPUT["format"] = image_format
+    if output_dir is not None:
+        plt.switch_backend("Agg")
+        os.makedirs(output_dir, exist_ok=True)
+
+def figure_name(kind, titles):
+    """
+    Build a file name for a figure from its kind and the book it shows, or the number of books.
+    Args:
+        kind (string): Kind of figure, ie "wordcloud".
+        titles (iterable): Titles of the books in the figure.
+    """
+    titles = list(titles)
+    if len(titles) != 1:
+        return f"{kind}_{len(titles)}_books"
+    return f"{kind}_" + re.sub(r"[^a-z0-9]+", "_", titles[0].lower()).strip("_")
+
+def show_figure(fig, name):
+    """
+    Show a finished figure, or save it to the output directory and return its path.
+    Args:
+        fig (matplotlib.figure.Figure): The figure.
+        name (string): File name of the figure without extension.
+    """
+    if OUTPUT["dir"] is None:
+        plt.show()
+        return None
+    file_path = path.join(OUTPUT["dir"], f"{name}.{OUTPUT['format']}")
+    fig.savefig(file_path, bbox_inches="tight")
+    plt.close(fig)
+    return file_path
+
+def _render_job(job):
+    """Call one plotting function given as a (function, args, kwargs) tuple."""
+    function, args, kwargs = job
+    with stage(f"plot_{function.__name__}"):
+        return function(*args, **kwargs)
+
+def render_figures(jobs, workers=1):
+    """
+    Render independent figures, in a process pool when saving headless with more than one worker.
+    Return the result of each job (the saved file paths) in order.
+    Args:
+        jobs (list): (plotting function, args, kwargs) tuples; arguments must be picklable to render in parallel.
+        workers (int): Number of worker processes.
+    """
+    if workers <= 1 or OUTPUT["dir"] is None:
+        return [_render_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers, initializer=configure_output, initargs=(OUTPUT["dir"], OUTPUT["format"])) as executor:
+        return list(executor.map(_render_job, jobs))
 
 def generate_color_map(common_words):
     """
@@ -24,43 +90,94 @@ def create_color_func(color_map):
     Args:
         color_map (dict): A dictionary of words with predefined colors
     """
-    def color_func(word, font_size, position, orientation, random_state=None, **kwargs):
-        # Convert the color from float format to integer format (0-255)
-        color = color_map.get(word, (0, 0, 0))  # Default to black if word is not in color_map
-        return tuple(int(c * 255) for c in color[:3])  # Convert to RGB
-    return color_func
+    # A partial of a module-level function can be pickled to render in worker processes
+    return partial(map_word_color, color_map)
 
-def create_wordcloud(books_text, color_function, unique_chart=False):
+def map_word_color(color_map, word, font_size, position, orientation, random_state=None, **kwargs):
+    """
+    Return the RGB color of a word for the WordCloud library.
+    Args:
+        color_map (dict): A dictionary of words with predefined colors
+        word (string): The word being drawn.
+    """
+    # Convert the color from float format to integer format (0-255)
+    color = color_map.get(word, (0, 0, 0))  # Default to black if word is not in color_map
+    return tuple(int(c * 255) for c in color[:3])  # Convert to RGB
+
+@lru_cache(maxsize=None)
+def load_mask(file_name="magnifier.png"):
+    """
+    Load a wordcloud mask image once per process; white (255) pixels are left empty.
+    Args:
+        file_name (string): Image file next to this module.
+    """
+    from PIL import Image
+    mask_image = np.array(Image.open(path.join(path.dirname(path.abspath(__file__)), file_name)))
+    mask_image[mask_image == 0] = 255
+    # The array is shared by every wordcloud, so guard it against changes
+    mask_image.flags.writeable = False
+    return mask_image
+
+def word_frequencies(books_text, max_words=200):
+    """
+    Return the most common words of each book as a {word: count} dictionary, the input of WordCloud.generate_from_frequencies.
+    WordCloud's stopwords are left out, as WordCloud.generate leaves them out of text.
+    Args:
+        books_text (dict or Corpus): Dictionary with book titles as keys and word counts (dict or (word, count) pairs) or full text as values, or a Corpus.
+        max_words (int): Number of words kept per book, as many as a wordcloud draws.
+    """
+    from wordcloud import STOPWORDS
+    frequencies = {}
+    for title in books_text:
+        if isinstance(books_text, Corpus):
+            ranked = frequency_table(books_text, title).most_common()
+        elif isinstance(books_text[title], str):
+            ranked = frequency_table(books_text[title], title).most_common()
+        else:
+            ranked = Counter(dict(books_text[title])).most_common()
+        frequencies[title] = dict(itertools.islice(((word, count) for word, count in ranked if word not in STOPWORDS), max_words))
+    return frequencies
+
+def _layout_wordcloud(frequencies, color_function):
+    """Lay out one wordcloud from word frequencies and return it as an RGB image array."""
+    # seaborn and wordcloud are imported by the figures that use them, so importing this module stays cheap
+    from wordcloud import WordCloud # External
+    return WordCloud(
+        background_color="white",
+        mask=load_mask(),
+        width=1200,
+        height=750,
+        color_func=color_function  # Apply consistent color function
+    ).generate_from_frequencies(frequencies).to_array()
+
+def create_wordcloud(books_text, color_function, unique_chart=False, workers=1):
     """
     Generate and plot a wordcloud for most common words.
     Args:
-        books_text (dict): A dictionary of books with processed text.
+        books_text (dict or Corpus): A dictionary of books with word counts (ie from CorpusIndex.most_common) or processed text, or a Corpus.
         color_function (function): Passes colors assigned to most common words.
         unique_chart (bool): True only if it a unique wordchart (as opposed to a most common wordchart) is desired.
+        workers (int): Number of processes laying out the per-book wordclouds in parallel.
     """
-    #Create mask in the shape of a magnifying glass
-    d = path.dirname(__file__) if "__file__" in locals() else os.getcwd()
-    mask_image = np.array(Image.open(path.join(d, "magnifier.png")))
-    mask_image[mask_image == 0] = 255
+    frequencies = word_frequencies(books_text)
+    # Laying out the words is the slow part, and each book's layout is independent
+    if workers > 1 and len(frequencies) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(frequencies))) as executor:
+            images = list(executor.map(_layout_wordcloud, frequencies.values(), [color_function] * len(frequencies)))
+    else:
+        images = [_layout_wordcloud(words, color_function) for words in frequencies.values()]
     # Create subplots for word clouds
-    fig, axes = plt.subplots(1, len(books_text), figsize=(20, 8))
+    fig, axes = plt.subplots(1, len(frequencies), figsize=(20, 8))
     # If there is only one subplot, axes will not be a list; convert to list
-    if len(books_text) == 1:
+    if len(frequencies) == 1:
         axes = [axes]
-    # Generate word clouds for each book and display
-    for ax, (title, text) in zip(axes, books_text.items()):
-        wc = WordCloud(
-            background_color="white",
-            mask=mask_image,
-            width=1200,
-            height=750,
-            color_func=color_function  # Apply consistent color function
-        ).generate(text)
-        ax.imshow(wc, interpolation="bilinear")
+    # Display the word cloud of each book
+    for ax, title, image in zip(axes, frequencies, images):
+        ax.imshow(image, interpolation="bilinear")
         ax.axis("off")
         ax.set_title(title, fontsize=16, pad=10, loc='center')
     # Adjust layout and display
-    if (len(books_text) != 1):
+    if (len(frequencies) != 1):
         plt.suptitle(
         "Unique Words" if unique_chart else "Most Common Words",
         fontsize=20, y = 0.8
@@ -71,7 +188,7 @@ def create_wordcloud(books_text, color_function, unique_chart=False):
         fontsize=20, y = 1
         )
     plt.tight_layout()
-    plt.show()
+    return show_figure(fig, figure_name("wordcloud_unique" if unique_chart else "wordcloud_common", frequencies))
 
 
 def create_barchart(books_common_words, color_map, normalize=False, books_text=None):
@@ -81,13 +198,13 @@ def create_barchart(books_common_words, color_map, normalize=False, books_text=N
         books_common_words (dict): A dictionary of books with their most common words and counts.
         color_map (dict): A mapping of words to colors for consistent visual representation.
         normalize (bool): Set to true to normalize word counts based on the total word count of the book. False by default.
-        books_text (dict): A dictionary of books with their full text (needed for normalization).
+        books_text (dict or Corpus): A dictionary of books with their full text, or a Corpus (needed for normalization).
     """
     # Calculate normalized frequencies if required
     if normalize and books_text:
         normalized_common_words = {}
         for title, words in books_common_words.items():
-            total_words = len(books_text[title].split())
+            total_words = book_length(books_text, title)
             normalized_common_words[title] = [(word, count / total_words) for word, count in words]
         books_common_words = normalized_common_words
     # Plot most common words
@@ -116,13 +233,13 @@ def create_barchart(books_common_words, color_map, normalize=False, books_text=N
         fontsize=16
     )
     fig.tight_layout()
-    plt.show()
+    return show_figure(fig, figure_name("barchart_normalized" if normalize else "barchart", books_common_words))
 
 def create_mean_word_length_chart(text_dict, number_common_words):
     '''
     Create a line chart for the mean word lengths of the most common words in books.
     Args:
-        text_dict (dict): A dictionary where keys are book titles and values are texts
+        text_dict (dict, Corpus or DataFrame): A dictionary where keys are book titles and values are texts, a Corpus, or a table from lexical_statistics
         number_common_words (int): The number of most common words to calculate average length of 
     '''
     mean_lengths = calculate_mean_word_length(text_dict, number_common_words)
@@ -130,7 +247,7 @@ def create_mean_word_length_chart(text_dict, number_common_words):
     df = pd.DataFrame(list(mean_lengths.items()), columns=['Book', 'Mean Word Length'])
     df['Index'] = np.arange(len(df))
     # Plot
-    plt.figure(figsize=(10, 6))
+    fig = plt.figure(figsize=(10, 6))
     plt.plot(df['Index'], df['Mean Word Length'], marker='o', color='black', label='Mean Word Length')
     plt.xticks(df['Index'], df['Book'], rotation=30, ha='right', fontsize=10)
     plt.yticks(fontsize=10)
@@ -142,7 +259,36 @@ def create_mean_word_length_chart(text_dict, number_common_words):
     plt.grid(axis='y', linestyle='--', alpha=0.7)
     # Display
     plt.tight_layout()
-    plt.show()
+    return show_figure(fig, figure_name(f"mean_word_length_top_{number_common_words}", mean_lengths))
+
+def plot_lexical_statistics(statistics):
+    """
+    Plot the vocabulary growth curve and the word-length distribution of each book, read from a lexical statistics table.
+    Args:
+        statistics (DataFrame or dict or Corpus): A table from lexical_statistics, or the books to compute it from.
+    """
+    table = lexical_statistics(statistics) if not isinstance(statistics, pd.DataFrame) else statistics
+    fig, (growth_ax, length_ax) = plt.subplots(nrows=1, ncols=2, figsize=(18, 6))
+    for title, row in table.iterrows():
+        # Type/token ratio, hapax legomena and Zipf slope are summarized in the legend
+        growth_ax.plot(row['growth_tokens'], row['growth_types'], linewidth=1.5,
+                       label=f"{title} (TTR {row['type_token_ratio']:.3f}, hapax {row['hapax_legomena']:,}, Zipf {row['zipf_slope']:.2f})")
+        histogram = row['length_histogram']
+        length_ax.plot(np.arange(len(histogram)), 100 * histogram / max(row['tokens'], 1), marker='o', markersize=3, label=title)
+    growth_ax.set_title("Vocabulary Growth", fontsize=14)
+    growth_ax.set_xlabel("Tokens read", fontsize=12)
+    growth_ax.set_ylabel("Distinct words", fontsize=12)
+    growth_ax.legend(fontsize=8)
+    length_ax.set_title("Word Length Distribution (All Tokens)", fontsize=14)
+    length_ax.set_xlabel("Word length (characters)", fontsize=12)
+    length_ax.set_ylabel("Share of tokens (%)", fontsize=12)
+    length_ax.xaxis.set_major_locator(plt.MaxNLocator(integer=True))
+    length_ax.legend(fontsize=8)
+    for ax in (growth_ax, length_ax):
+        ax.grid(axis='y', linestyle='--', alpha=0.7)
+    fig.suptitle("Lexical Statistics of Sherlock Holmes Novels", fontsize=16)
+    fig.tight_layout()
+    return show_figure(fig, figure_name("lexical_statistics", table.index))
 
 def plot_tfidf_heatmap(tfidf_df, smooth=False, top_n=26):
     """
@@ -152,10 +298,12 @@ def plot_tfidf_heatmap(tfidf_df, smooth=False, top_n=26):
         smooth (bool): Optionally graph smooth IDF.
         top_n (int): Number of top words per book to include.
     """
+    import seaborn as sns # External
     # Filter top N words per book
     top_words = (
-        tfidf_df.groupby("Book")
-        .apply(lambda x: x.nlargest(top_n, "TF-IDF"))
+        tfidf_df.sort_values("TF-IDF", ascending=False, kind="stable")
+        .groupby("Book", sort=False)
+        .head(top_n)
         .reset_index(drop=True)
     )
     # Pivot table to create a matrix for heatmap
@@ -163,7 +311,7 @@ def plot_tfidf_heatmap(tfidf_df, smooth=False, top_n=26):
         index="Word", columns="Book", values="TF-IDF", fill_value=0
     ) * 1e3
     # Plot heatmap
-    plt.figure(figsize=(12, 8))
+    fig = plt.figure(figsize=(12, 8))
     sns.heatmap(
         heatmap_data,
         cmap="YlGnBu",
@@ -181,7 +329,7 @@ def plot_tfidf_heatmap(tfidf_df, smooth=False, top_n=26):
     plt.xlabel("Books")
     plt.xticks(rotation=45)
     plt.tight_layout()
-    plt.show()
+    return show_figure(fig, "tfidf_heatmap_smooth" if smooth else "tfidf_heatmap")
 
 
 def plot_cooccurrence_heatmap(cooccurrence_matrices, common_word_list, window_size):
@@ -192,10 +340,12 @@ def plot_cooccurrence_heatmap(cooccurrence_matrices, common_word_list, window_si
         common_word_list (dict): Dictionary where keys are book titles and values are lists of common words.
         window_size (int): The size of the window to check for word co-occurrences.
     """
+    import seaborn as sns # External
+    file_paths = []
     for book, matrix in cooccurrence_matrices.items():
         words = common_word_list[book]  # Get the corresponding common words for the current book
         # Set up the figure
-        plt.figure(figsize=(10, 8))
+        fig = plt.figure(figsize=(10, 8))
 
         # Create the heatmap
         heatmap = sns.heatmap(
@@ -215,7 +365,8 @@ def plot_cooccurrence_heatmap(cooccurrence_matrices, common_word_list, window_si
         plt.ylabel('Words')
 
         # Show the heatmap for this book
-        plt.show()
+        file_paths.append(show_figure(fig, figure_name(f"cooccurrence_window_{window_size}", [book])))
+    return file_paths
 
 def plot_ngrams(ngram_frequencies, top_n, n_gram_length):
     """
@@ -263,4 +414,36 @@ def plot_ngrams(ngram_frequencies, top_n, n_gram_length):
     # Overall title and adjustments
     fig.suptitle(f"Top {top_n} N-Grams of Length {n_gram_length}", fontsize=16)
     fig.tight_layout()
-    plt.show()
+    return show_figure(fig, figure_name(f"ngrams_{n_gram_length}", [title for title, _ in books_to_plot]))
+
+def plot_dispersion(dispersion, words=None, window=2000, step=None, color_map=None, chapters=None):
+    """
+    Plot how the frequency of several words changes through up to 5 books, as rolling-window curves read from a DispersionIndex.
+    Args:
+        dispersion (DispersionIndex): Prefix counts of the words over the books.
+        words (list): Words to plot; every word of the index if None.
+        window (int): Number of tokens per rolling window.
+        step (int): Tokens between window starts; a tenth of the window by default.
+        color_map (dict): Optional word-to-color mapping, so words keep the colors of the other charts.
+        chapters (dict): Optional book titles mapped to the token positions where their chapters start, drawn as vertical lines.
+    """
+    words = dispersion.words if words is None else [word for word in words if word in dispersion]
+    titles = list(dispersion.prefixes)[:5]
+    fig, axes = plt.subplots(nrows=len(titles), ncols=1, figsize=(14, 3 * len(titles)), sharey=True, squeeze=False)
+    for ax, title in zip(axes[:, 0], titles):
+        centers, frequencies = dispersion.rolling(title, window, step, words)
+        # Positions as a share of the book, so books of different lengths line up
+        progress = 100 * centers / max(dispersion.length(title), 1)
+        for word, frequency in zip(words, frequencies):
+            ax.plot(progress, frequency, label=word, linewidth=1.2, color=(color_map or {}).get(word))
+        for start in (chapters or {}).get(title, ()):
+            ax.axvline(100 * start / max(dispersion.length(title), 1), color="grey", linewidth=0.6, linestyle=":")
+        ax.set_title(title, fontsize=12)
+        ax.set_xlim(0, 100)
+        ax.set_ylabel("Per 1,000 tokens", fontsize=10)
+        ax.grid(axis="y", linestyle="--", alpha=0.7)
+    axes[-1, 0].set_xlabel("Position in book (%)", fontsize=10)
+    axes[0, 0].legend(loc="upper left", bbox_to_anchor=(1.01, 1), fontsize=9)
+    fig.suptitle(f"Word Frequency Through Each Book ({window}-Token Rolling Window)", fontsize=16)
+    fig.tight_layout()
+    return show_figure(fig, figure_name(f"dispersion_window_{window}", titles))
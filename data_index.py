@@ -0,0 +1,254 @@
+"""Keep per-book and corpus-wide term counts up to date as books are added or removed"""
+import json
+import os
+from collections import Counter
+import numpy as np
+from data_corpus import Corpus
+from data_analysis import inverse_document_frequency
+
+INDEX_PATH = "books_index.npz"
+INDEX_FORMAT_VERSION = 1
+
+class CorpusIndex:
+    """
+    Persistent index of per-book term counts, global term counts and document frequencies.
+    Adding or removing a book only touches that book's distinct terms, so the collection is never recounted.
+    """
+    def __init__(self):
+        # A Corpus without books serves as the interned vocabulary table
+        self.lexicon = Corpus()
+        # Per book: content key, length, and sorted distinct token IDs with their counts and first positions
+        self.books = {}
+        self.term_counts = np.zeros(0, dtype=np.int64)
+        self.doc_counts = np.zeros(0, dtype=np.int64)
+
+    def _grow(self):
+        """Make the global count arrays cover every word of the vocabulary."""
+        size = len(self.lexicon.vocabulary)
+        if size > len(self.term_counts):
+            capacity = max(size, 2 * len(self.term_counts))
+            self.term_counts = np.concatenate([self.term_counts, np.zeros(capacity - len(self.term_counts), dtype=np.int64)])
+            self.doc_counts = np.concatenate([self.doc_counts, np.zeros(capacity - len(self.doc_counts), dtype=np.int64)])
+
+    def add_book(self, title, tokens, key=None):
+        """
+        Add a book, replacing any book with the same title.
+        Args:
+            title (string): The title of the book.
+            tokens (list): The book's cleaned tokens.
+            key (string): Optional content key (ie the cache hash) used by sync to detect changed books.
+        """
+        intern = self.lexicon.intern
+        token_ids = np.fromiter((intern(w) for w in tokens), dtype=np.int64, count=len(tokens))
+        ids, first_index, counts = np.unique(token_ids, return_index=True, return_counts=True)
+        self._add_counts(title, ids, first_index, counts, len(token_ids), key)
+
+    def add_book_ids(self, title, token_ids, vocabulary, key=None):
+        """
+        Add a book given as token IDs over another vocabulary (ie a book of a Corpus), replacing any book with the same title.
+        Args:
+            title (string): The title of the book.
+            token_ids (np.ndarray): The book's token IDs.
+            vocabulary (list): Words indexed by the token IDs.
+            key (string): Optional content key used by sync to detect changed books.
+        """
+        ids, first_index, counts = np.unique(token_ids, return_index=True, return_counts=True)
+        # Translate only the book's distinct IDs into the index vocabulary
+        intern = self.lexicon.intern
+        ids = np.array([intern(vocabulary[i]) for i in ids.tolist()], dtype=np.int64)
+        self._add_counts(title, ids, first_index, counts, len(token_ids), key)
+
+    def _add_counts(self, title, ids, first_index, counts, length, key):
+        """Record a book's distinct token IDs, first positions and counts, and add them to the global counts."""
+        if title in self.books:
+            self.remove_book(title)
+        self._grow()
+        order = np.argsort(ids)
+        ids, first_index, counts = ids[order], first_index[order].astype(np.int64), counts[order].astype(np.int64)
+        # ids are distinct, so fancy-index updates touch each term once
+        self.term_counts[ids] += counts
+        self.doc_counts[ids] += 1
+        self.books[title] = {"key": key, "length": length, "ids": ids, "counts": counts, "first": first_index}
+
+    def remove_book(self, title):
+        """
+        Remove a book and subtract its counts.
+        Args:
+            title (string): The title of the book.
+        """
+        book = self.books.pop(title)
+        self.term_counts[book["ids"]] -= book["counts"]
+        self.doc_counts[book["ids"]] -= 1
+
+    def sync(self, corpus, keys=None):
+        """
+        Bring the index in line with a corpus: remove books that are gone and add books that are new or whose key changed.
+        Args:
+            corpus (Corpus): The current books.
+            keys (dict): Optional content key per title; without keys, books already indexed are assumed unchanged.
+        """
+        keys = keys or {}
+        for title in [t for t in self.books if t not in corpus]:
+            self.remove_book(title)
+        for title, token_ids in corpus.items():
+            book = self.books.get(title)
+            if book is None or book["key"] != keys.get(title, book["key"]):
+                self.add_book_ids(title, token_ids, corpus.vocabulary, keys.get(title))
+        # Re-added books go to the end, so restore corpus order: most_common breaks ties by first occurrence in it
+        self.books = {title: self.books[title] for title in corpus}
+
+    def num_books(self):
+        """Return the number of indexed books."""
+        return len(self.books)
+
+    def most_common(self, number_common_words=None, title=None):
+        """
+        Return the most common words of one book, or of the whole collection, as (word, count) pairs.
+        Ties are ordered by first occurrence, as return_most_common does on the joined text.
+        Args:
+            number_common_words (int): What number of most common words to return (all if None).
+            title (string): Optional book title.
+        """
+        vocabulary = self.lexicon.vocabulary
+        if title is not None:
+            book = self.books[title]
+            order = np.lexsort((book["first"], -book["counts"]))[:number_common_words]
+            return list(zip([vocabulary[i] for i in book["ids"][order].tolist()], book["counts"][order].tolist()))
+        counts = self.term_counts[:len(vocabulary)]
+        candidates = np.flatnonzero(counts)
+        if number_common_words is not None and number_common_words < len(candidates):
+            # Only words tied with or above the k-th count can make the top k
+            threshold = -np.partition(-counts[candidates], number_common_words - 1)[number_common_words - 1]
+            candidates = candidates[counts[candidates] >= threshold]
+        # Position of each candidate's first occurrence in the books joined in index order
+        first_seen = np.full(len(candidates), np.iinfo(np.int64).max, dtype=np.int64)
+        offset = 0
+        for book in self.books.values():
+            if len(book["ids"]):
+                found = np.minimum(np.searchsorted(book["ids"], candidates), len(book["ids"]) - 1)
+                present = book["ids"][found] == candidates
+                first_seen = np.where(present, np.minimum(first_seen, book["first"][found] + offset), first_seen)
+            offset += book["length"]
+        order = np.lexsort((first_seen, -counts[candidates]))[:number_common_words]
+        return list(zip([vocabulary[i] for i in candidates[order].tolist()], counts[candidates[order]].tolist()))
+
+    def unique_words(self, title=None):
+        """
+        Return a Counter of the words that occur in only one book, for one book or as a dict for every book.
+        Args:
+            title (string): Optional book title.
+        """
+        if title is None:
+            return {t: self.unique_words(t) for t in self.books}
+        book = self.books[title]
+        unique = self.doc_counts[book["ids"]] == 1
+        # Keep first-occurrence order, as unique_words_from_texts(return_counts=True) does
+        order = np.argsort(book["first"][unique])
+        vocabulary = self.lexicon.vocabulary
+        return Counter(dict(zip(
+            [vocabulary[i] for i in book["ids"][unique][order].tolist()],
+            book["counts"][unique][order].tolist(),
+        )))
+
+    def tf_idf(self, smooth=False, words=None):
+        """
+        Return TF-IDF scores in the long format of calculate_vocabulary_tf_idf, from the stored counts.
+        Args:
+            smooth (bool): Optionally compute smooth IDF.
+            words (iterable): Optional words to restrict the result to.
+        """
+        # Imported here so loading the index for top-k queries does not pay for pandas
+        import pandas as pd
+        vocabulary = np.array(self.lexicon.vocabulary, dtype=object)
+        wanted = None
+        if words is not None:
+            wanted = np.array(sorted(self.lexicon.word_to_id[w] for w in set(words) if w in self.lexicon.word_to_id), dtype=np.int64)
+        frames = []
+        for title, book in self.books.items():
+            ids, counts = book["ids"], book["counts"]
+            if wanted is not None:
+                keep = np.isin(ids, wanted)
+                ids, counts = ids[keep], counts[keep]
+            tf = counts / book["length"] if book["length"] else np.zeros(len(counts))
+            idf = inverse_document_frequency(self.doc_counts[ids], len(self.books), smooth)
+            frames.append(pd.DataFrame({
+                'Book': title,
+                'Word': vocabulary[ids],
+                'Frequency': counts,
+                'TF': tf,
+                'IDF': idf,
+                'TF-IDF': tf * idf,
+            }))
+        if not frames:
+            return pd.DataFrame(columns=['Book', 'Word', 'Frequency', 'TF', 'IDF', 'TF-IDF'])
+        return pd.concat(frames, ignore_index=True)
+
+    def save(self, path=INDEX_PATH):
+        """
+        Save the index to a .npz file, replacing it atomically.
+        Args:
+            path (string): Path of the index file.
+        """
+        books = list(self.books.values())
+        header = {
+            "format": INDEX_FORMAT_VERSION,
+            "titles": list(self.books),
+            "keys": [book["key"] for book in books],
+            "lengths": [book["length"] for book in books],
+        }
+        size = len(self.lexicon.vocabulary)
+        empty = np.zeros(0, dtype=np.int64)
+        with open(f"{path}.tmp", "wb") as f:
+            np.savez(
+                f,
+                header=np.array(json.dumps(header)),
+                vocabulary=np.array("\n".join(self.lexicon.vocabulary)),
+                sizes=np.array([len(book["ids"]) for book in books], dtype=np.int64),
+                ids=np.concatenate([book["ids"] for book in books] or [empty]),
+                counts=np.concatenate([book["counts"] for book in books] or [empty]),
+                first=np.concatenate([book["first"] for book in books] or [empty]),
+                term_counts=self.term_counts[:size],
+                doc_counts=self.doc_counts[:size],
+            )
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        """
+        Load an index saved by save().
+        Args:
+            path (string): Path of the index file.
+        """
+        with np.load(path) as data:
+            header = json.loads(str(data["header"]))
+            if header["format"] != INDEX_FORMAT_VERSION:
+                raise ValueError(f"Unsupported index format in {path}: {header['format']}")
+            index = cls()
+            vocabulary = str(data["vocabulary"])
+            index.lexicon = Corpus(vocabulary.split("\n") if vocabulary else [])
+            index.term_counts = data["term_counts"]
+            index.doc_counts = data["doc_counts"]
+            bounds = np.concatenate([[0], np.cumsum(data["sizes"])])
+            ids, counts, first = data["ids"], data["counts"], data["first"]
+            for i, title in enumerate(header["titles"]):
+                start, end = bounds[i], bounds[i + 1]
+                index.books[title] = {
+                    "key": header["keys"][i],
+                    "length": header["lengths"][i],
+                    "ids": ids[start:end],
+                    "counts": counts[start:end],
+                    "first": first[start:end],
+                }
+        return index
+
+    @classmethod
+    def load_or_create(cls, path=INDEX_PATH):
+        """
+        Load the index at path, or return an empty index if there is none.
+        Args:
+            path (string): Path of the index file.
+        """
+        try:
+            return cls.load(path)
+        except FileNotFoundError:
+            return cls()
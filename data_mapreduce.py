@@ -0,0 +1,321 @@
+"""Run the analysis stage as a map-reduce over shards of books, in worker processes"""
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from data_analysis import (
+    NgramCounts, consumed_window_groups, ngram_tables, tf_idf_table, window_pair_counts,
+)
+
+def shard_titles(corpus, shards):
+    """
+    Split the books into contiguous shards of about the same number of tokens.
+    Args:
+        corpus (Corpus): The tokenized books.
+        shards (int): Number of shards.
+    """
+    titles = corpus.titles()
+    lengths = np.array([corpus.num_tokens(title) for title in titles], dtype=np.int64)
+    # Cut where the running token count crosses each multiple of total / shards
+    bounds = np.searchsorted(np.cumsum(lengths), np.arange(1, shards) * lengths.sum() / shards, side="right")
+    return [shard for shard in np.split(np.array(titles, dtype=object), bounds) if len(shard)]
+
+def cooccurrence_partial(token_ids, target_lookup, size, window_size, sliding=False):
+    """
+    Count the co-occurrences of one book, with what the reducer needs to add the pairs that span book boundaries.
+    With consumed windows, a window opened near the end of the previous book consumes the occurrences in the first tokens of this book,
+    so the book is counted once for each number of tokens (0 to window_size) the previous book's last window can reach into it.
+    Args:
+        token_ids (np.ndarray): Token IDs of the book.
+        target_lookup (np.ndarray): Row of each token ID in the matrix, or -1 if it is not a common word.
+        size (int): Number of common words.
+        window_size (int): The size of the window to check for word co-occurrences.
+        sliding (bool): Use sliding-window semantics instead of consuming each occurrence once.
+    """
+    length = len(token_ids)
+    targets = target_lookup[token_ids]
+    positions = np.flatnonzero(targets >= 0)
+    targets = targets[positions]
+    if sliding:
+        head = positions < window_size
+        tail = positions >= length - window_size
+        return {
+            "matrix": window_pair_counts(positions, targets, size, window_size),
+            "head": (positions[head], targets[head]),
+            "tail": (positions[tail], targets[tail]),
+        }
+    variants = []
+    for reach in range(window_size + 1):
+        # Occurrences before reach are consumed by the previous book's last window (group 0)
+        carried = int(np.searchsorted(positions, reach))
+        groups = np.concatenate([np.zeros(carried, dtype=np.int64), consumed_window_groups(positions[carried:], window_size)])
+        variant = {
+            "matrix": window_pair_counts(positions, targets, size, window_size, groups),
+            "head": targets[:carried],
+            # Whether a window opened in this book, ending the one carried into it
+            "closes": carried < len(positions),
+        }
+        if variant["closes"]:
+            last_start = int(np.searchsorted(groups, groups[-1]))
+            variant["tail"] = targets[last_start:][-window_size:]
+            variant["reach"] = max(0, int(positions[last_start]) + window_size - length + 1)
+        else:
+            variant["reach"] = max(0, reach - length)
+        variants.append(variant)
+    return {"variants": variants}
+
+def map_shard(books, vocabulary_size, target_ids, window_size, sliding, ns):
+    """
+    Compute the mergeable partials of a shard of books: term counts, a document-frequency vector, co-occurrence counts and n-gram counts.
+    Runs in a worker process, so it only takes and returns arrays.
+    Args:
+        books (list): (title, token ID array) pairs.
+        vocabulary_size (int): Number of words in the shared vocabulary.
+        target_ids (np.ndarray): Token IDs of the common words of the co-occurrence matrices (-1 for words outside the vocabulary).
+        window_size (int): The size of the window to check for word co-occurrences.
+        sliding (bool): Use sliding-window semantics instead of consuming each occurrence once.
+        ns (list): Sizes of n-grams to count.
+    """
+    target_lookup = np.full(vocabulary_size, -1, dtype=np.int64)
+    present = target_ids >= 0
+    target_lookup[target_ids[present]] = np.flatnonzero(present)
+    doc_counts = np.zeros(vocabulary_size, dtype=np.int64)
+    partials = {}
+    for title, token_ids in books:
+        ids, first_index, counts = np.unique(token_ids, return_index=True, return_counts=True)
+        doc_counts[ids] += 1
+        edge = max(ns, default=1) - 1
+        partials[title] = {
+            "length": len(token_ids),
+            "terms": (ids, counts, first_index),
+            "cooccurrence": cooccurrence_partial(token_ids, target_lookup, len(target_ids), window_size, sliding),
+            # Count every n-gram, as one below min_count in each book may still reach it across the corpus
+            "ngrams": ngram_tables(token_ids, ns, vocabulary_size),
+            "head": np.asarray(token_ids[:edge], dtype=np.int64),
+            "tail": np.asarray(token_ids[len(token_ids) - edge:], dtype=np.int64),
+        }
+    return {"books": partials, "doc_counts": doc_counts}
+
+def _map_shard_args(args):
+    """Unpack the arguments of map_shard, for Executor.map."""
+    return map_shard(*args)
+
+def _ranked(ids, counts, first_index, number_common=None):
+    """Return IDs and counts most common first, ties in order of first occurrence."""
+    order = np.lexsort((first_index, -counts))[:number_common]
+    return ids[order], counts[order]
+
+def _merge_ngram_rows(rows, counts, first_index):
+    """Sum the counts of equal n-gram rows, keeping each row's first occurrence."""
+    rows = np.ascontiguousarray(rows, dtype=np.int64)
+    keys = rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1]))).ravel()
+    _, index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    inverse = inverse.ravel()
+    merged_counts = np.bincount(inverse, weights=counts, minlength=len(index)).astype(np.int64)
+    merged_first = np.full(len(index), np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(merged_first, inverse, first_index)
+    return rows[index], merged_counts, merged_first
+
+class AnalysisReduction:
+    """
+    The reduced results of run_analysis, in the formats of the data_analysis functions.
+    Corpus-wide results equal those of the books concatenated in order (ie Corpus.combined) without building the concatenation:
+    counts are summed, first occurrences are offset by the lengths of the books before, and co-occurrences and n-grams spanning two books
+    are added from the edges of each book.
+    Args:
+        vocabulary (list): Words indexed by token ID.
+        titles (list): Book titles in corpus order.
+        partials (list): Results of map_shard, in shard order.
+        common_words (list): Common words of the co-occurrence matrices.
+        window_size (int): The size of the window co-occurrences were counted in.
+        sliding (bool): Whether co-occurrences were counted in sliding windows.
+        ns (list): Sizes of the n-grams counted.
+    """
+    def __init__(self, vocabulary, titles, partials, common_words, window_size, sliding, ns):
+        self.vocabulary = vocabulary
+        self.titles = list(titles)
+        self.common_words = list(common_words)
+        self.window_size = window_size
+        self.sliding = sliding
+        self.ns = list(ns)
+        self.books = {}
+        self.doc_counts = np.zeros(len(vocabulary), dtype=np.int64)
+        for partial in partials:
+            self.books.update(partial["books"])
+            self.doc_counts += partial["doc_counts"]
+        self.offsets = {}
+        offset = 0
+        for title in self.titles:
+            self.offsets[title] = offset
+            offset += self.books[title]["length"]
+        self.num_tokens = offset
+        self.counts = np.zeros(len(vocabulary), dtype=np.int64)
+        self.first_seen = np.full(len(vocabulary), np.iinfo(np.int64).max, dtype=np.int64)
+        for title in self.titles:
+            ids, counts, first_index = self.books[title]["terms"]
+            # IDs are distinct within a book, so fancy indexing adds each count once
+            self.counts[ids] += counts
+            self.first_seen[ids] = np.minimum(self.first_seen[ids], first_index + self.offsets[title])
+
+    def book_lengths(self):
+        """Return the number of tokens of each book."""
+        return {title: self.books[title]["length"] for title in self.titles}
+
+    def most_common(self, number_common_words=None, title=None):
+        """
+        Return the most common words as (word, count) pairs, like return_most_common.
+        Args:
+            number_common_words (int): What number of most common words to return (all if None).
+            title (string): Book to count; if None, the whole corpus.
+        """
+        if title is not None:
+            ids, counts = _ranked(*self.books[title]["terms"], number_common_words)
+        else:
+            present = np.flatnonzero(self.counts)
+            ids, counts = _ranked(present, self.counts[present], self.first_seen[present], number_common_words)
+        return [(self.vocabulary[i], count) for i, count in zip(ids.tolist(), counts.tolist())]
+
+    def unique_words(self):
+        """Return a Counter of the words each book alone contains, like unique_words_from_texts(..., return_counts=True)."""
+        unique_words = {}
+        for title in self.titles:
+            ids, counts, first_index = self.books[title]["terms"]
+            unique = self.doc_counts[ids] == 1
+            order = np.argsort(first_index[unique])
+            unique_words[title] = Counter(dict(zip(
+                [self.vocabulary[i] for i in ids[unique][order].tolist()], counts[unique][order].tolist()
+            )))
+        return unique_words
+
+    def update_missing_words(self, common_words):
+        """
+        Complete each book's most common words with its counts of the other books' most common words, like update_missing_words.
+        Args:
+            common_words (dict): Dictionary with book titles as keys and list of tuples (word, frequency) as values.
+        """
+        all_common_words = set(word for words in common_words.values() for word, _ in words)
+        updated_books_common_words = {}
+        for title, top_words in common_words.items():
+            ids, counts, _ = self.books[title]["terms"]
+            book_counts = dict(zip((self.vocabulary[i] for i in ids.tolist()), counts.tolist()))
+            current_top_words = set(word for word, _ in top_words)
+            updated_top_words = top_words[:]
+            for word in all_common_words:
+                if word not in current_top_words:
+                    updated_top_words.append((word, book_counts.get(word, 0)))
+            updated_books_common_words[title] = updated_top_words
+        return updated_books_common_words
+
+    def tf_idf(self, word_frequencies, smooth=False):
+        """
+        Calculate TF-IDF scores for common words across books, like calculate_tf_idf.
+        Args:
+            word_frequencies (dict): Dictionary with book titles as keys and list of tuples (word, frequency) as values.
+            smooth (bool): Optionally compute smooth IDF.
+        """
+        return tf_idf_table(word_frequencies, self.book_lengths(), smooth)
+
+    def cooccurrence(self, title=None):
+        """
+        Return the co-occurrence matrix of the common words, like calculate_word_pair_frequencies.
+        Args:
+            title (string): Book to count; if None, every book as one concatenated document.
+        """
+        size = len(self.common_words)
+        if title is not None:
+            partial = self.books[title]["cooccurrence"]
+            return (partial if self.sliding else partial["variants"][0])["matrix"].copy()
+        matrix = np.zeros((size, size), dtype=int)
+        if self.sliding:
+            # Occurrences in the last window_size tokens so far, as (position in the concatenation, row)
+            carry = []
+            for title in self.titles:
+                partial = self.books[title]["cooccurrence"]
+                offset = self.offsets[title]
+                matrix += partial["matrix"]
+                for position, target in zip(*(a.tolist() for a in partial["head"])):
+                    for carried_position, carried_target in carry:
+                        if offset + position - carried_position <= self.window_size:
+                            matrix[carried_target, target] += 1
+                            matrix[target, carried_target] += 1
+                end = offset + self.books[title]["length"]
+                carry = [item for item in carry if item[0] >= end - self.window_size]
+                carry += [(offset + p, t) for p, t in zip(*(a.tolist() for a in partial["tail"]))]
+            return matrix
+        # Rows of the occurrences in the window still open at the end of the books so far, and how far it reaches into the next book
+        carry, reach = [], 0
+        for title in self.titles:
+            variant = self.books[title]["cooccurrence"]["variants"][reach]
+            matrix += variant["matrix"]
+            window = carry + variant["head"].tolist()
+            # Pair occurrences of the open window on either side of the boundary, at most window_size occurrences apart
+            for second in range(len(carry), len(window)):
+                for first in range(max(0, second - self.window_size), len(carry)):
+                    matrix[window[first], window[second]] += 1
+                    matrix[window[second], window[first]] += 1
+            carry = variant["tail"].tolist() if variant["closes"] else window[-self.window_size:]
+            reach = variant["reach"]
+        return matrix
+
+    def ngrams(self, n, title=None, min_count=1):
+        """
+        Return the n-gram counts of a book, or of every book as one concatenated document, like count_ngrams.
+        Args:
+            n (int): Size of n-grams; one of the sizes passed to run_analysis.
+            title (string): Book to count; if None, every book as one concatenated document.
+            min_count (int): Drop n-grams occurring fewer times than this.
+        """
+        titles = [title] if title is not None else self.titles
+        rows, counts, first_index = [np.zeros((0, n), dtype=np.int64)], [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        # The last n - 1 tokens so far, which start the n-grams spanning into the next book
+        carry = np.zeros(0, dtype=np.int64)
+        for book in titles:
+            partial = self.books[book]
+            offset = self.offsets[book] if title is None else 0
+            book_rows, book_counts, book_first = partial["ngrams"][n]
+            rows.append(book_rows)
+            counts.append(book_counts)
+            first_index.append(book_first + offset)
+            if title is None and n > 1:
+                edge = np.concatenate([carry, partial["head"][:n - 1]])
+                starts = np.arange(max(0, min(len(carry), len(edge) - n + 1)))
+                if len(starts):
+                    rows.append(edge[starts[:, None] + np.arange(n)])
+                    counts.append(np.ones(len(starts), dtype=np.int64))
+                    first_index.append(offset - len(carry) + starts)
+                carry = np.concatenate([carry, partial["tail"][-(n - 1):] if partial["length"] >= n - 1 else partial["head"]])[-(n - 1):]
+        rows, counts, first_index = _merge_ngram_rows(np.concatenate(rows), np.concatenate(counts), np.concatenate(first_index))
+        keep = counts >= min_count
+        rows, counts, first_index = rows[keep], counts[keep], first_index[keep]
+        order = np.lexsort((first_index, -counts))
+        return NgramCounts(self.vocabulary, rows[order], counts[order])
+
+def run_analysis(corpus, common_words=(), window_size=1, sliding=False, ns=(2,), workers=1, shards=None, executor=None):
+    """
+    Compute the analysis stage as a map-reduce: books are split into shards, each shard is reduced to mergeable partials in a worker,
+    and the partials are merged into per-book and corpus-wide results.
+    Args:
+        corpus (Corpus): The tokenized books.
+        common_words (list): Common words of the co-occurrence matrices.
+        window_size (int): The size of the window to check for word co-occurrences.
+        sliding (bool): Use sliding-window semantics instead of consuming each occurrence once.
+        ns (iterable): Sizes of n-grams to count.
+        workers (int): Number of worker processes; 1 maps the shards in this process.
+        shards (int): Number of shards; the number of workers by default.
+        executor (concurrent.futures.Executor): Optional executor to map the shards on instead of a process pool of its own.
+    """
+    ns = list(ns)
+    common_words = list(common_words)
+    target_ids = np.array([corpus.word_to_id.get(word, -1) for word in common_words], dtype=np.int64)
+    tasks = [
+        # Views drop the memmap subclass, so token arrays are pickled as plain arrays
+        ([(title, corpus.tokens(title).view(np.ndarray)) for title in shard], len(corpus.vocabulary), target_ids, window_size, sliding, ns)
+        for shard in shard_titles(corpus, shards or workers)
+    ]
+    if executor is not None:
+        partials = list(executor.map(_map_shard_args, tasks))
+    elif workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            partials = list(pool.map(_map_shard_args, tasks))
+    else:
+        partials = [map_shard(*task) for task in tasks]
+    return AnalysisReduction(corpus.vocabulary, corpus.titles(), partials, common_words, window_size, sliding, ns)
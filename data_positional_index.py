@@ -0,0 +1,419 @@
+"""Find where words and phrases occur with a positional inverted index"""
+import json
+import os
+from collections import Counter
+import numpy as np
+from data_corpus import Corpus
+
+POSITIONAL_INDEX_PATH = "books_positions.npz"
+POSITIONAL_INDEX_FORMAT_VERSION = 1
+
+def smallest_unsigned_dtype(max_value):
+    """Return the smallest unsigned integer dtype that holds max_value."""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_value <= np.iinfo(dtype).max:
+            return dtype
+    return np.uint64
+
+def encode_postings(token_ids):
+    """
+    Build the postings of one book: the sorted distinct term IDs, and for each term its first position and the gaps between its later positions.
+    Gaps are stored in the smallest unsigned dtype that fits them (usually uint16), and the gaps of term i are deltas[offsets[i]:offsets[i + 1]].
+    Args:
+        token_ids (np.ndarray): The book's token IDs.
+    """
+    # A stable sort groups the positions of each term, in increasing order within the term
+    order = np.argsort(token_ids, kind="stable")
+    terms, starts, counts = np.unique(token_ids[order], return_index=True, return_counts=True)
+    gaps = np.diff(order)
+    # Drop the differences that cross from one term's positions to the next term's
+    within_term = np.ones(len(gaps), dtype=bool)
+    within_term[starts[1:] - 1] = False
+    gaps = gaps[within_term]
+    # Positions and offsets are below the book length, so they share its dtype
+    position_dtype = smallest_unsigned_dtype(len(token_ids))
+    return {
+        "length": len(token_ids),
+        "terms": terms.astype(Corpus.dtype),
+        "firsts": order[starts].astype(position_dtype),
+        "offsets": np.concatenate([[0], np.cumsum(counts - 1)]).astype(position_dtype),
+        "deltas": gaps.astype(smallest_unsigned_dtype(int(gaps.max()) if len(gaps) else 0)),
+    }
+
+def decode_positions(postings, term_index):
+    """Return the sorted positions of the term_index-th term of a book's postings."""
+    start, end = int(postings["offsets"][term_index]), int(postings["offsets"][term_index + 1])
+    positions = np.empty(end - start + 1, dtype=np.int64)
+    positions[0] = postings["firsts"][term_index]
+    positions[1:] = postings["deltas"][start:end]
+    return np.cumsum(positions)
+
+def decode_tokens(postings):
+    """Rebuild a book's token ID array from its postings, decoding every term at once."""
+    if postings["length"] == 0:
+        return np.zeros(0, dtype=Corpus.dtype)
+    counts = np.diff(postings["offsets"]).astype(np.int64) + 1
+    segment_starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    values = np.empty(postings["length"], dtype=np.int64)
+    is_start = np.zeros(postings["length"], dtype=bool)
+    is_start[segment_starts] = True
+    values[segment_starts] = postings["firsts"]
+    values[~is_start] = postings["deltas"]
+    # A running sum over all terms, minus what the previous terms added, gives each term's positions
+    running = np.cumsum(values)
+    positions = running - np.repeat(running[segment_starts] - postings["firsts"], counts)
+    tokens = np.empty(postings["length"], dtype=Corpus.dtype)
+    tokens[positions] = np.repeat(postings["terms"], counts)
+    return tokens
+
+class PositionalIndex:
+    """
+    Positional inverted index: for every book, the sorted positions of each term, delta-encoded.
+    Answers term, phrase, proximity and keyword-in-context queries, and co-occurrence and n-gram counts around a word,
+    by reading only the postings of the words involved instead of scanning the books.
+    """
+    def __init__(self):
+        # A Corpus without books serves as the interned vocabulary table
+        self.lexicon = Corpus()
+        # Per book: content key and postings (see encode_postings)
+        self.books = {}
+        # Token arrays rebuilt from the postings for context queries, per title
+        self._tokens = {}
+        # Corpus whose token arrays context queries read instead, if one is attached
+        self.source = None
+
+    @classmethod
+    def from_corpus(cls, corpus, keys=None):
+        """
+        Index every book of a corpus.
+        Args:
+            corpus (Corpus): The tokenized books.
+            keys (dict): Optional content key per title, used by sync to detect changed books.
+        """
+        index = cls()
+        index.sync(corpus, keys)
+        return index
+
+    @classmethod
+    def from_books(cls, books):
+        """
+        Index the cleaned books produced by preprocess_all_books.
+        Args:
+            books (list): List of book dictionaries with a title and a list of tokens as text.
+        """
+        return cls.from_corpus(Corpus.from_books(books))
+
+    def add_book_ids(self, title, token_ids, vocabulary, key=None):
+        """
+        Index a book given as token IDs over another vocabulary (ie a book of a Corpus), replacing any book with the same title.
+        Args:
+            title (string): The title of the book.
+            token_ids (np.ndarray): The book's token IDs.
+            vocabulary (list): Words indexed by the token IDs.
+            key (string): Optional content key used by sync to detect changed books.
+        """
+        ids, inverse = np.unique(token_ids, return_inverse=True)
+        # Translate only the book's distinct IDs into the index vocabulary
+        intern = self.lexicon.intern
+        translated = np.array([intern(vocabulary[i]) for i in ids.tolist()], dtype=np.int64)
+        self.books[title] = dict(encode_postings(translated[inverse.ravel()]), key=key)
+        self._tokens.pop(title, None)
+
+    def remove_book(self, title):
+        """
+        Remove a book from the index.
+        Args:
+            title (string): The title of the book.
+        """
+        del self.books[title]
+        self._tokens.pop(title, None)
+
+    def sync(self, corpus, keys=None):
+        """
+        Bring the index in line with a corpus: remove books that are gone and index books that are new or whose key changed.
+        Args:
+            corpus (Corpus): The current books.
+            keys (dict): Optional content key per title; without keys, books already indexed are assumed unchanged.
+        """
+        keys = keys or {}
+        for title in [t for t in self.books if t not in corpus]:
+            self.remove_book(title)
+        for title, token_ids in corpus.items():
+            book = self.books.get(title)
+            if book is None or book["key"] != keys.get(title, book["key"]):
+                self.add_book_ids(title, token_ids, corpus.vocabulary, keys.get(title))
+
+    def _titles(self, title):
+        """Return the titles a query covers: one book, or every book if title is None."""
+        if title is None:
+            return list(self.books)
+        if title not in self.books:
+            raise KeyError(f"Unknown book: {title}")
+        return [title]
+
+    def _term_positions(self, book, term_id):
+        """Return the positions of a term ID in a book's postings (empty if it does not occur)."""
+        terms = book["terms"]
+        i = np.searchsorted(terms, term_id)
+        if i == len(terms) or terms[i] != term_id:
+            return np.zeros(0, dtype=np.int64)
+        return decode_positions(book, i)
+
+    def positions(self, word, title=None):
+        """
+        Return the sorted positions of a word, as {title: np.ndarray} for one book or every book.
+        Args:
+            word (string): The word to look up.
+            title (string): Optional book title.
+        """
+        term_id = self.lexicon.word_to_id.get(word, -1)
+        return {t: self._term_positions(self.books[t], term_id) for t in self._titles(title)}
+
+    def count(self, word, title=None):
+        """
+        Return how many times a word occurs in one book, or in every book.
+        Args:
+            word (string): The word to look up.
+            title (string): Optional book title.
+        """
+        return sum(len(p) for p in self.positions(word, title).values())
+
+    def phrase(self, words, title=None):
+        """
+        Return the start positions of an exact phrase, as {title: np.ndarray}.
+        Args:
+            words (list or string): Words of the phrase, or the phrase as one string.
+            title (string): Optional book title.
+        """
+        words = words.split() if isinstance(words, str) else list(words)
+        term_ids = [self.lexicon.word_to_id.get(w, -1) for w in words]
+        matches = {}
+        for t in self._titles(title):
+            if not term_ids:
+                # An empty phrase occurs nowhere
+                matches[t] = np.zeros(0, dtype=np.int64)
+                continue
+            book = self.books[t]
+            postings = [self._term_positions(book, term_id) for term_id in term_ids]
+            # Start from the rarest word, so the candidates only shrink
+            rarest = min(range(len(postings)), key=lambda i: len(postings[i]))
+            starts = postings[rarest] - rarest
+            for i, positions in enumerate(postings):
+                if i != rarest and len(starts):
+                    found = np.minimum(np.searchsorted(positions, starts + i), max(len(positions) - 1, 0))
+                    starts = starts[positions[found] == starts + i] if len(positions) else starts[:0]
+            matches[t] = starts[starts >= 0]
+        return matches
+
+    def near(self, first, second, distance, title=None, ordered=False):
+        """
+        Return the occurrences of two words at most distance words apart, as {title: (positions of first, positions of second)} arrays.
+        Args:
+            first (string): The first word.
+            second (string): The second word.
+            distance (int): Maximum number of positions between the two words.
+            title (string): Optional book title.
+            ordered (bool): Only match the second word after the first.
+        """
+        matches = {}
+        first_positions = self.positions(first, title)
+        second_positions = self.positions(second, title)
+        for t, a in first_positions.items():
+            b = second_positions[t]
+            low = np.searchsorted(b, a + 1 if ordered else a - distance, side="left")
+            high = np.searchsorted(b, a + distance, side="right")
+            counts = high - low
+            left = np.repeat(a, counts)
+            # Index of each match in b: low of its occurrence of the first word, plus its rank among that occurrence's matches
+            ranks = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            right = b[np.repeat(low, counts) + ranks]
+            # A word is not near itself
+            keep = left != right
+            matches[t] = (left[keep], right[keep])
+        return matches
+
+    def attach(self, corpus):
+        """
+        Read the context of kwic, cooccurrence and ngrams_with from the token arrays of a corpus instead of decoding a second copy from the postings.
+        Args:
+            corpus (Corpus): The books the index was synced with.
+        """
+        for title in self.books:
+            if title in corpus and corpus.num_tokens(title) != self.books[title]["length"]:
+                raise ValueError(f"The corpus does not hold the indexed text of {title}")
+        self.source = corpus
+        self._tokens.clear()
+
+    def tokens(self, title):
+        """Return the token IDs of a book, rebuilt from its postings once and kept for later context queries."""
+        tokens = self._tokens.get(title)
+        if tokens is None:
+            tokens = self._tokens[title] = decode_tokens(self.books[title])
+        return tokens
+
+    def _context(self, title):
+        """Return the token IDs of a book and the vocabulary they index, from the attached corpus if it holds the book."""
+        if self.source is not None and title in self.source:
+            return self.source.tokens(title), self.source.vocabulary
+        return self.tokens(title), self.lexicon.vocabulary
+
+    def kwic(self, words, width=5, title=None, limit=None):
+        """
+        Return keyword-in-context snippets of a word or phrase as (title, position, left context, match, right context) tuples.
+        Args:
+            words (list or string): The word or phrase to find.
+            width (int): Number of words of context on each side.
+            title (string): Optional book title.
+            limit (int): Maximum number of snippets (all if None).
+        """
+        words = words.split() if isinstance(words, str) else list(words)
+        snippets = []
+        for t, starts in self.phrase(words, title).items():
+            tokens, vocabulary = self._context(t)
+            for start in starts.tolist():
+                if limit is not None and len(snippets) >= limit:
+                    return snippets
+                end = start + len(words)
+                snippets.append((
+                    t,
+                    start,
+                    " ".join(vocabulary[i] for i in tokens[max(start - width, 0):start].tolist()),
+                    " ".join(words),
+                    " ".join(vocabulary[i] for i in tokens[end:end + width].tolist()),
+                ))
+        return snippets
+
+    def cooccurrence(self, word, window_size=1, title=None):
+        """
+        Return a Counter of the words at most window_size positions from each occurrence of a word, reading only the positions around it.
+        Args:
+            word (string): The word.
+            window_size (int): The size of the window around each occurrence.
+            title (string): Optional book title.
+        """
+        counts = Counter()
+        for t, positions in self.positions(word, title).items():
+            tokens, vocabulary = self._context(t)
+            offsets = np.concatenate([np.arange(-window_size, 0), np.arange(1, window_size + 1)])
+            neighbors = (positions[:, None] + offsets).ravel()
+            neighbors = neighbors[(neighbors >= 0) & (neighbors < len(tokens))]
+            ids, id_counts = np.unique(tokens[neighbors], return_counts=True)
+            counts.update(dict(zip([vocabulary[i] for i in ids.tolist()], id_counts.tolist())))
+        return counts
+
+    def cooccurrence_matrix(self, words, window_size=1, title=None):
+        """
+        Count, for each pair of words, the pairs of occurrences at most window_size positions apart by intersecting their postings.
+        Gives the same matrix as calculate_word_pair_frequencies(..., sliding=True) on the same book, without scanning it.
+        Args:
+            words (list): Words of the rows and columns.
+            window_size (int): The size of the window to check for word co-occurrences.
+            title (string): Optional book title; if None, the matrices of every book are summed.
+        """
+        postings = [self.positions(w, title) for w in words]
+        matrix = np.zeros((len(words), len(words)), dtype=int)
+        for t in self._titles(title):
+            for i, a in enumerate(postings):
+                for j, b in enumerate(postings):
+                    low = np.searchsorted(b[t], a[t] - window_size, side="left")
+                    high = np.searchsorted(b[t], a[t] + window_size, side="right")
+                    # An occurrence is not paired with itself
+                    matrix[i, j] += int((high - low).sum()) - (len(a[t]) if i == j else 0)
+        return matrix
+
+    def ngrams_with(self, word, n=2, title=None):
+        """
+        Return a Counter of the n-grams containing a word, reading only the positions around it.
+        Args:
+            word (string): The word.
+            n (int): Size of the n-grams.
+            title (string): Optional book title.
+        """
+        counts = Counter()
+        for t, positions in self.positions(word, title).items():
+            tokens, vocabulary = self._context(t)
+            # Every n-gram start that puts the word in one of its n slots, counted once even if the word occurs twice in it
+            starts = np.unique((positions[:, None] - np.arange(n)).ravel())
+            starts = starts[(starts >= 0) & (starts + n <= len(tokens))]
+            rows = tokens[starts[:, None] + np.arange(n)]
+            for row, count in zip(*np.unique(rows, axis=0, return_counts=True)):
+                counts[tuple(vocabulary[i] for i in row.tolist())] += int(count)
+        return counts
+
+    def tokens_nbytes(self, title=None):
+        """
+        Return the size of the token arrays decoded for context queries and kept, for one book or every book.
+        Args:
+            title (string): Optional book title.
+        """
+        return sum(tokens.nbytes for t, tokens in list(self._tokens.items()) if title is None or t == title)
+
+    def nbytes(self, title=None):
+        """
+        Return the size of the postings in bytes, for one book or every book.
+        Args:
+            title (string): Optional book title.
+        """
+        return sum(
+            sum(self.books[t][key].nbytes for key in ("terms", "firsts", "offsets", "deltas"))
+            for t in self._titles(title)
+        )
+
+    def save(self, path=POSITIONAL_INDEX_PATH):
+        """
+        Save the index to a .npz file, replacing it atomically.
+        Args:
+            path (string): Path of the index file.
+        """
+        books = list(self.books.values())
+        header = {
+            "format": POSITIONAL_INDEX_FORMAT_VERSION,
+            "titles": list(self.books),
+            "keys": [book["key"] for book in books],
+            "lengths": [book["length"] for book in books],
+        }
+        arrays = {}
+        # Each book keeps its own delta dtype, so arrays are stored per book
+        for i, book in enumerate(books):
+            for key in ("terms", "firsts", "offsets", "deltas"):
+                arrays[f"{key}_{i}"] = book[key]
+        with open(f"{path}.tmp", "wb") as f:
+            np.savez(
+                f,
+                header=np.array(json.dumps(header)),
+                vocabulary=np.array("\n".join(self.lexicon.vocabulary)),
+                **arrays,
+            )
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path=POSITIONAL_INDEX_PATH):
+        """
+        Load an index saved by save().
+        Args:
+            path (string): Path of the index file.
+        """
+        with np.load(path) as data:
+            header = json.loads(str(data["header"]))
+            if header["format"] != POSITIONAL_INDEX_FORMAT_VERSION:
+                raise ValueError(f"Unsupported positional index format in {path}: {header['format']}")
+            index = cls()
+            vocabulary = str(data["vocabulary"])
+            index.lexicon = Corpus(vocabulary.split("\n") if vocabulary else [])
+            for i, title in enumerate(header["titles"]):
+                book = {key: data[f"{key}_{i}"] for key in ("terms", "firsts", "offsets", "deltas")}
+                book.update(length=header["lengths"][i], key=header["keys"][i])
+                index.books[title] = book
+        return index
+
+    @classmethod
+    def load_or_create(cls, path=POSITIONAL_INDEX_PATH):
+        """
+        Load the index at path, or return an empty index if there is none.
+        Args:
+            path (string): Path of the index file.
+        """
+        try:
+            return cls.load(path)
+        except FileNotFoundError:
+            return cls()
@@ -1,55 +1,261 @@
 """Process the raw data so that it is ready for textual analysis"""
 import re
-import nltk # External package
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-nltk.download('punkt', quiet=True)
-nltk.download('punkt_tab', quiet=True)
-nltk.download('wordnet', quiet=True)
-nltk.download('omw-1.4', quiet=True)
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+# NLTK packages the pipeline needs, with the path each one is found under in the NLTK data directories
+NLTK_RESOURCES = {
+    "punkt": "tokenizers/punkt",
+    "punkt_tab": "tokenizers/punkt_tab",
+    "wordnet": "corpora/wordnet",
+    "omw-1.4": "corpora/omw-1.4",
+    "stopwords": "corpora/stopwords",
+}
+
+# Bump whenever a change to the pipeline changes its output, so cached cleaned books are rebuilt
+PREPROCESSING_VERSION = 1
+
+# Markers around the book in Project Gutenberg texts (matched after lower-casing)
+BOOK_START_MARKER = " ***"
+BOOK_END_MARKER = "end of the project gutenberg"
+# Digits are removed in their own pass so that words next to them (ie "ii2") are matched by NOISE_PATTERN afterwards
+DIGIT_PATTERN = re.compile(r"\d+")
+# Roman numerals (chapter numbers), words not handled correctly by NLTK, and any run of punctuation, dashes, underscores and whitespace
+NOISE_PATTERN = re.compile(
+    r"\b(?:ii|iii|iv|v|vi|vii|viii|ix|x|xi|xii|was|has|yes|said|us|would|could|upon|one|two|well|may|mr|mrs)\b"
+    r"|[\W_]+"
+)
+
+@lru_cache(maxsize=None)
+def ensure_nltk_resources(download=True):
+    """
+    Check once per process that the NLTK resources are installed, looking only at the local NLTK data path.
+    Missing resources are downloaded if allowed; raises LookupError if any are still missing.
+    Args:
+        download (bool): Download missing resources (needs network access).
+    """
+    # nltk imports scipy and more, which takes about a second, so it is only imported when text is preprocessed
+    import nltk
+
+    def missing_resources():
+        missing = []
+        for package, resource in NLTK_RESOURCES.items():
+            try:
+                nltk.data.find(resource)
+            except LookupError:
+                missing.append(package)
+        return missing
+
+    missing = missing_resources()
+    if missing and download:
+        for package in missing:
+            nltk.download(package, quiet=True)
+        missing = missing_resources()
+    if missing:
+        raise LookupError(f"Missing NLTK resources: {', '.join(missing)} (install them with nltk.download)")
+
+class PreprocessingPipeline:
+    """
+    Compiled preprocessing steps that are reused across tokens and books.
+    Keeps one lemmatizer, the stopwords as a frozenset, and an LRU cache of lemmas per surface form.
+    Args:
+        lemma_cache_size (int): Maximum number of distinct words whose lemma is remembered.
+        download (bool): Download missing NLTK resources; worker processes only load the ones their parent installed.
+    """
+    def __init__(self, lemma_cache_size=65536, download=True):
+        ensure_nltk_resources(download)
+        from nltk.tokenize import word_tokenize
+        from nltk.corpus import stopwords
+        from nltk.stem import WordNetLemmatizer
+        self.word_tokenize = word_tokenize
+        self.lemmatizer = WordNetLemmatizer()
+        self.stop_words = frozenset(stopwords.words('english'))
+        # Most lemmatize calls are repeats of a few thousand frequent words
+        self.lemmatize = lru_cache(maxsize=lemma_cache_size)(self.lemmatizer.lemmatize)
+
+    @staticmethod
+    def strip_boilerplate(text):
+        """
+        Remove the Project Gutenberg text before and after the book.
+        Args:
+            text (string): Lower-cased raw text.
+        """
+        start = text.find(BOOK_START_MARKER)
+        if start != -1:
+            text = text[start + len(BOOK_START_MARKER):]
+        end = text.find(BOOK_END_MARKER)
+        if end != -1:
+            text = text[:end]
+        return text
+
+    def clean(self, text):
+        """
+        Remove digits, roman numerals, noise words and punctuation, leaving words separated by spaces.
+        Args:
+            text (string): Lower-cased book text.
+        """
+        text = DIGIT_PATTERN.sub("", text)
+        return NOISE_PATTERN.sub(" ", text).strip()
+
+    def tokenize(self, text):
+        """
+        Tokenize cleaned text, then lemmatize it and drop stopwords.
+        Args:
+            text (string): Text returned by clean().
+        """
+        # The text has no sentence punctuation left, so sentence splitting can be skipped
+        lemmatize = self.lemmatize
+        stop_words = self.stop_words
+        filtered_text = []
+        for w in self.word_tokenize(text, preserve_line=True):
+            lemma = lemmatize(w)
+            if lemma not in stop_words:
+                filtered_text.append(lemma)
+        return filtered_text
+
+    def __call__(self, text):
+        """
+        Convert raw text to preprocessed tokens.
+        Args:
+            text (string): Contains the unprocessed, downloaded text
+        """
+        return self.tokenize(self.clean(self.strip_boilerplate(text.lower())))
+
+_pipeline = None
+
+def get_pipeline(download=True):
+    """Return the shared preprocessing pipeline, creating it on first use.
+        Args:
+            download (bool): Download missing NLTK resources when the pipeline is created.
+    """
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = PreprocessingPipeline(download=download)
+    return _pipeline
 
 def preprocess_text(text):
     """Convert raw text to preprocessed text.
         Args: 
             text (string): Contains the unprocessed, downloaded text 
     """
-    # Make all text lower-case
-    text = text.lower()
-    # Remove the introductory Project Gutenberg text (before the book starts)
-    text = re.sub(r"^.*?( \*\*\*)", "", text, flags=re.DOTALL)
-    # Remove the end Project Gutenberg text (after the book ends)
-    text = re.sub(r"(end of the project gutenberg.*)", "", text, flags=re.DOTALL)
-    # Remove digits
-    text = re.sub(r"\d+", "", text)
-    # Remove Roman numerals (chapter numbers) and other words not handled correctly by NLTK
-    text = re.sub(r"\b(ii|iii|iv|v|vi|vii|viii|ix|x|xi|xii|was|has|yes|said|us|would|could|upon|one|two|well|may|mr|mrs)\b", "", text)
-    # Replace punctuation with space
-    text = re.sub(r"[^\w\s]", " ", text)
-    # Replace dashes (hyphen, en dash, em dash) with spaces to preserve word separation
-    text = re.sub(r"[\u2014\u2013\-_()]", " ", text)
-    # Replace multiple spaces with a single space
-    text = re.sub(r"\s+", " ", text)
-    # Strip leading and trailing spaces
-    text = text.strip()
-    # Tokenize the text
-    text = word_tokenize(text)
-    # Lemmatize the text (rocks -> rock)
-    lemmatized_text = []
-    for w in text:
-        lemmatized_text.append(WordNetLemmatizer().lemmatize(w))
-    # Recreate the tokenized list but without NLTK stopwords
-    filtered_text = []
-    for w in lemmatized_text:
-        if w not in stopwords.words('english'):
-            filtered_text.append(w)
-    return filtered_text
-
-def preprocess_all_books(books_raw):
+    return get_pipeline()(text)
+
+def read_chunks(source, chunk_size):
+    """Yield the text of a file in pieces of at most chunk_size characters.
+        Args:
+            source (string or file): Path of a UTF-8 text file, or an open text file.
+            chunk_size (int): Number of characters read at a time.
+    """
+    if isinstance(source, str):
+        with open(source, "r", encoding="utf-8", newline="") as f:
+            yield from read_chunks(f, chunk_size)
+        return
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+def stream_preprocessed_tokens(source, chunk_size=1048576, header_limit=1048576):
+    """Read raw text in chunks and yield its preprocessed tokens incrementally, so memory stays flat whatever the book size.
+        Yields the same tokens as preprocess_text, except that the start marker is only searched for in the first header_limit characters.
+        Args:
+            source (string or file): Path of a UTF-8 text file, or an open text file.
+            chunk_size (int): Number of characters read at a time.
+            header_limit (int): Number of characters searched for the Project Gutenberg start marker.
+    """
+    pipeline = get_pipeline()
+    chunks = (chunk.lower() for chunk in read_chunks(source, chunk_size))
+    # Buffer the header until the start marker is found; without one, the whole text is kept
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        if BOOK_START_MARKER in buffer or len(buffer) >= header_limit:
+            break
+    start = buffer.find(BOOK_START_MARKER, 0, header_limit)
+    if start != -1:
+        buffer = buffer[start + len(BOOK_START_MARKER):]
+    # Keep enough characters back that an end marker split across chunks is still found
+    overlap = len(BOOK_END_MARKER) - 1
+    while True:
+        end = buffer.find(BOOK_END_MARKER)
+        if end != -1:
+            yield from pipeline.tokenize(pipeline.clean(buffer[:end]))
+            return
+        # Cut after the last whitespace so that no token crosses into the next chunk
+        limit = len(buffer) - overlap
+        cut = max(buffer.rfind(" ", 0, limit), buffer.rfind("\n", 0, limit)) if limit > 0 else -1
+        if cut != -1:
+            yield from pipeline.tokenize(pipeline.clean(buffer[:cut + 1]))
+            buffer = buffer[cut + 1:]
+        chunk = next(chunks, None)
+        if chunk is None:
+            yield from pipeline.tokenize(pipeline.clean(buffer))
+            return
+        buffer += chunk
+
+def split_into_chunks(text, chunk_size):
+    """Split text into pieces of about chunk_size characters, cutting at paragraph boundaries where possible.
+        Args:
+            text (string): Text to split.
+            chunk_size (int): Target number of characters per chunk.
+    """
+    chunks = []
+    start = 0
+    while len(text) - start > chunk_size:
+        end = start + chunk_size
+        # Prefer a blank line (paragraph), then a line break, then any space
+        cut = max(text.rfind("\n\n", start, end), text.rfind("\n\r\n", start, end))
+        if cut == -1:
+            cut = text.rfind("\n", start, end)
+        if cut == -1:
+            cut = text.rfind(" ", start, end)
+        if cut == -1:
+            # A single run without whitespace; cut at the next space instead
+            cut = text.find(" ", end)
+            if cut == -1:
+                break
+        # Cut just after a whitespace character so no token is split between chunks
+        chunks.append(text[start:cut + 1])
+        start = cut + 1
+    chunks.append(text[start:])
+    return chunks
+
+def _init_worker():
+    """Load the NLTK resources once when a worker process starts; the parent has already downloaded any missing ones."""
+    get_pipeline(download=False)
+
+def _preprocess_chunk(chunk):
+    """Clean and tokenize one chunk of book text inside a worker process."""
+    pipeline = get_pipeline()
+    return pipeline.tokenize(pipeline.clean(chunk))
+
+def preprocess_all_books(books_raw, workers=1, chunk_size=500000):
     """Convert raw text to preprocessed text.
         Args: 
             books_raw (json object): Contains all of the raw books - their text and metadata 
+            workers (int): Number of worker processes; 1 preprocesses the books in this process.
+            chunk_size (int): Books longer than this many characters are split into chunks across workers.
     """
+    if workers <= 1:
+        for book in books_raw:
+            cleaned_text = preprocess_text(book["text"])  # Clean the raw text
+            book["text"] = cleaned_text  # Replace the raw text with the cleaned version
+        return
+    # The Gutenberg header and footer are located on the whole text before it is chunked
+    pipeline_chunks = []
+    chunk_counts = []
     for book in books_raw:
-        cleaned_text = preprocess_text(book["text"])  # Clean the raw text
-        book["text"] = cleaned_text  # Replace the raw text with the cleaned version
+        chunks = split_into_chunks(PreprocessingPipeline.strip_boilerplate(book["text"].lower()), chunk_size)
+        pipeline_chunks.extend(chunks)
+        chunk_counts.append(len(chunks))
+    # Download missing resources once here, rather than racing to download them in every worker
+    ensure_nltk_resources()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        # map returns results in input order, so chunks can be reassembled per book
+        results = executor.map(_preprocess_chunk, pipeline_chunks)
+        for book, count in zip(books_raw, chunk_counts):
+            cleaned_text = []
+            for _ in range(count):
+                cleaned_text.extend(next(results))
+            book["text"] = cleaned_text
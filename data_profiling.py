@@ -0,0 +1,170 @@
+"""Record wall time, CPU time, memory and item counts of pipeline stages"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+from functools import wraps
+try:
+    import resource # Unix only
+except ImportError:
+    resource = None
+
+# Profiling is off until enable_profiling() is called; while off, a stage only checks this flag
+PROFILE = {"enabled": False, "stages": [], "open": []}
+
+def enable_profiling(trace_memory=False):
+    """
+    Start recording stages, discarding any stages recorded before.
+    Args:
+        trace_memory (bool): Also trace Python allocations with tracemalloc, which slows allocation-heavy code (ie plotting) down severalfold.
+    """
+    PROFILE["enabled"] = True
+    PROFILE["stages"] = []
+    PROFILE["open"] = []
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def disable_profiling():
+    """Stop recording stages and tracing allocations; recorded stages are kept for the report."""
+    PROFILE["enabled"] = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def peak_rss_bytes():
+    """Return the peak resident set size of this process in bytes, or None where it is not available."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def _fold_traced_peak():
+    """Add the allocation peak since the last call to every open stage, then start a new peak."""
+    if not tracemalloc.is_tracing():
+        return
+    peak = tracemalloc.get_traced_memory()[1]
+    for record in PROFILE["open"]:
+        record["_peak"] = max(record["_peak"], peak)
+    tracemalloc.reset_peak()
+
+class stage:
+    """
+    Context manager recording one pipeline stage while profiling is enabled.
+    The record it yields is a dict; add item counts to it (ie record["tokens"] = n) to report them with the stage.
+    Args:
+        name (string): Name of the stage, ie "preprocess".
+        **counts: Item counts known before the stage starts.
+    """
+    def __init__(self, name, **counts):
+        self.name = name
+        self.record = dict(counts)
+
+    def __enter__(self):
+        if not PROFILE["enabled"]:
+            return self.record
+        record = self.record
+        record["_depth"] = len(PROFILE["open"])
+        if tracemalloc.is_tracing():
+            _fold_traced_peak()
+            record["_traced"] = record["_peak"] = tracemalloc.get_traced_memory()[0]
+        PROFILE["open"].append(record)
+        record["_wall"] = time.perf_counter()
+        record["_cpu"] = time.process_time()
+        return record
+
+    def __exit__(self, exc_type, exc, traceback):
+        record = self.record
+        if "_wall" not in record:
+            return False
+        wall = time.perf_counter() - record.pop("_wall")
+        cpu = time.process_time() - record.pop("_cpu")
+        result = {"stage": self.name, "depth": record.pop("_depth"), "wall_seconds": wall, "cpu_seconds": cpu}
+        if "_traced" in record:
+            _fold_traced_peak()
+            traced = record.pop("_traced")
+            result["memory_delta_bytes"] = tracemalloc.get_traced_memory()[0] - traced
+            result["memory_peak_bytes"] = record.pop("_peak") - traced
+        # Records are compared by identity, as two open stages may hold equal counts
+        PROFILE["open"] = [r for r in PROFILE["open"] if r is not record]
+        result["peak_rss_bytes"] = peak_rss_bytes()
+        result["counts"] = dict(record)
+        if exc_type is not None:
+            result["error"] = exc_type.__name__
+        PROFILE["stages"].append(result)
+        return False
+
+def profiled(name=None):
+    """
+    Decorator recording every call of a function as a stage.
+    Args:
+        name (string): Name of the stage; defaults to the function name.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not PROFILE["enabled"]:
+                return function(*args, **kwargs)
+            with stage(name or function.__name__):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def profile_report():
+    """Return the recorded stages, in the order they finished, as a JSON-serializable dict."""
+    return {"stages": list(PROFILE["stages"])}
+
+def prometheus_report(prefix="word_analysis"):
+    """
+    Return the recorded stages in the Prometheus text exposition format.
+    Stages recorded more than once (ie one per figure) are summed, except peak memory, which is the maximum.
+    Args:
+        prefix (string): Prefix of the metric names.
+    """
+    metrics = {
+        "wall_seconds": ("Wall-clock time spent in the stage.", sum),
+        "cpu_seconds": ("CPU time of this process spent in the stage.", sum),
+        "memory_delta_bytes": ("Change in traced Python memory over the stage.", sum),
+        "memory_peak_bytes": ("Peak traced Python memory above the start of the stage.", max),
+        "peak_rss_bytes": ("Peak resident set size of the process at the end of the stage.", max),
+    }
+    stages = {}
+    for result in PROFILE["stages"]:
+        stages.setdefault(result["stage"], []).append(result)
+    lines = []
+    for metric, (help_text, combine) in metrics.items():
+        values = {
+            name: combine(r[metric] for r in results)
+            for name, results in stages.items()
+            if all(r.get(metric) is not None for r in results)
+        }
+        if not values:
+            continue
+        lines.append(f"# HELP {prefix}_stage_{metric} {help_text}")
+        lines.append(f"# TYPE {prefix}_stage_{metric} gauge")
+        lines.extend(f'{prefix}_stage_{metric}{{stage="{name}"}} {value}' for name, value in values.items())
+    counts = {}
+    for name, results in stages.items():
+        for result in results:
+            for item, count in result["counts"].items():
+                counts[(name, item)] = counts.get((name, item), 0) + count
+    if counts:
+        lines.append(f"# HELP {prefix}_stage_items Number of items (tokens, words, books, ...) handled by the stage.")
+        lines.append(f"# TYPE {prefix}_stage_items gauge")
+        lines.extend(f'{prefix}_stage_items{{stage="{name}",item="{item}"}} {count}' for (name, item), count in counts.items())
+    return "\n".join(lines) + "\n"
+
+def write_profile(file_path):
+    """
+    Write the recorded stages to a file: Prometheus text if the path ends in .prom or .txt, JSON otherwise.
+    Args:
+        file_path (string): Path of the report.
+    """
+    directory = os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(file_path, "w", encoding="utf-8") as f:
+        if file_path.endswith((".prom", ".txt")):
+            f.write(prometheus_report())
+        else:
+            json.dump(profile_report(), f, indent=1)
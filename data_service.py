@@ -0,0 +1,320 @@
+"""Serve analysis queries over HTTP from a corpus loaded once and kept in memory"""
+import argparse
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from data_collection import load_or_download_books
+from data_cache import load_or_preprocess_corpus, book_key
+from data_index import CorpusIndex, INDEX_PATH
+from data_positional_index import PositionalIndex, POSITIONAL_INDEX_PATH
+from data_storage import CLEANED_STORE_DIR
+from data_analysis import calculate_word_pair_frequencies, count_ngrams
+from data_mapreduce import run_analysis
+from data_profiling import peak_rss_bytes
+
+# Title under which queries about the whole corpus are answered, as in main()
+ALL_BOOKS = "Sherlock Holmes Novels"
+# Largest n-gram size served; n-gram tables are kept once counted, so this also bounds their number
+MAX_NGRAM_SIZE = 5
+# Largest co-occurrence window and keyword-in-context width served
+MAX_WINDOW_SIZE = 50
+HTTP_STATUS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+class AnalysisService:
+    """
+    Answer analysis queries from token arrays and count tables held in memory.
+    Top-k, unique-word and TF-IDF queries read the CorpusIndex; phrase, proximity and keyword-in-context queries read the PositionalIndex;
+    co-occurrence and n-gram queries read the token arrays, and n-gram count tables are kept once computed.
+    Queries about the whole corpus merge per-book results with run_analysis, so no concatenated copy of the books is held.
+    Args:
+        corpus (Corpus): The cleaned books (ie memory-mapped from the token store).
+        index (CorpusIndex): Term counts of the same books.
+        positions (PositionalIndex): Optional positional index of the same books; built from the corpus if None.
+    """
+    def __init__(self, corpus, index, positions=None):
+        self.corpus = corpus
+        self.index = index
+        self.positions = positions if positions is not None else PositionalIndex.from_corpus(corpus)
+        # Context queries read the corpus arrays already in memory rather than decoding a copy of each book from the postings
+        self.positions.attach(corpus)
+        # (n, title) -> NgramCounts, with one lock per table so two threads never count the same table
+        # while tables for other books or sizes are counted concurrently
+        self.ngram_tables = {}
+        self.ngram_locks = {}
+        self.ngram_locks_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, workers=1, cache_dir=CLEANED_STORE_DIR, index_path=INDEX_PATH, positions_path=POSITIONAL_INDEX_PATH):
+        """
+        Load the books as main() does: from the raw store (downloading them if needed), the token store and the saved indexes.
+        Args:
+            workers (int): Number of processes used to preprocess books that are not cached.
+            cache_dir (string): Directory of the token store.
+            index_path (string): File of the corpus index.
+            positions_path (string): File of the positional index.
+        """
+        books = load_or_download_books()
+        corpus = load_or_preprocess_corpus(books, workers=workers, cache_dir=cache_dir)
+        keys = {book["title"]: book_key(book["text"]) for book in books}
+        index = CorpusIndex.load_or_create(index_path)
+        index.sync(corpus, keys)
+        index.save(index_path)
+        positions = PositionalIndex.load_or_create(positions_path)
+        positions.sync(corpus, keys)
+        positions.save(positions_path)
+        return cls(corpus, index, positions)
+
+    def _book(self, title):
+        """Return a corpus holding one book; raise KeyError for an unknown title."""
+        if title not in self.corpus:
+            raise KeyError(f"Unknown book: {title}")
+        return self.corpus.subset([title])
+
+    def books(self):
+        """Return the title and number of tokens of each book."""
+        return [{"title": title, "tokens": self.corpus.num_tokens(title)} for title in self.corpus]
+
+    def top_words(self, k=10, title=None):
+        """
+        Return the k most common words of a book, or of the corpus, as [word, count] pairs.
+        Args:
+            k (int): Number of words.
+            title (string): Optional book title.
+        """
+        if title is not None and title not in self.index.books:
+            raise KeyError(f"Unknown book: {title}")
+        return self.index.most_common(k, title)
+
+    def unique_words(self, k=10, title=None):
+        """
+        Return the k most frequent words that occur only in one book, for that book or for every book.
+        Args:
+            k (int): Number of words per book.
+            title (string): Optional book title.
+        """
+        if title is not None and title not in self.index.books:
+            raise KeyError(f"Unknown book: {title}")
+        titles = [title] if title is not None else list(self.index.books)
+        return {t: self.index.unique_words(t).most_common(k) for t in titles}
+
+    def tf_idf(self, words, smooth=False):
+        """
+        Return the TF-IDF of the given words in every book, as one record per book and word.
+        Args:
+            words (list): Words to score.
+            smooth (bool): Optionally compute smooth IDF.
+        """
+        return self.index.tf_idf(smooth, words).to_dict(orient="records")
+
+    def cooccurrence(self, words, window_size=1, title=None, sliding=False):
+        """
+        Return the co-occurrence matrix of a word list in a book, or in the corpus.
+        Args:
+            words (list): Words of the rows and columns.
+            window_size (int): The size of the window to check for word co-occurrences.
+            title (string): Optional book title.
+            sliding (bool): Use sliding-window semantics instead of consuming each occurrence once.
+        """
+        if title is None:
+            # Books are counted one by one and the windows spanning two books are added at each boundary
+            matrix = run_analysis(self.corpus, words, window_size, sliding, ns=[]).cooccurrence()
+        else:
+            matrix = calculate_word_pair_frequencies(self._book(title), {title: words}, window_size, sliding)[title]
+        return {"words": words, "matrix": matrix.tolist()}
+
+    def ngrams(self, n=2, k=10, title=None):
+        """
+        Return the k most common n-grams of a book, or of the corpus, as [words, count] pairs.
+        Args:
+            n (int): Size of the n-grams.
+            k (int): Number of n-grams.
+            title (string): Optional book title.
+        """
+        key = (n, ALL_BOOKS if title is None else title)
+        corpus = self._book(title) if title is not None else None
+        with self.ngram_locks_lock:
+            lock = self.ngram_locks.setdefault(key, threading.Lock())
+        with lock:
+            table = self.ngram_tables.get(key)
+            if table is None:
+                if title is None:
+                    # Per-book tables merged, with the n-grams spanning two books added at each boundary
+                    table = run_analysis(self.corpus, ns=[n]).ngrams(n)
+                else:
+                    table = count_ngrams(corpus, n)[title]
+                self.ngram_tables[key] = table
+        return [[list(ngram), count] for ngram, count in table.most_common(k)]
+
+    def memory(self):
+        """Return the memory held for each book (token array, index counts, postings, n-gram tables) and for the whole service, in bytes."""
+        # Snapshot, as other threads may be adding tables
+        ngram_tables = list(self.ngram_tables.items())
+        report = {}
+        for title, token_ids in self.corpus.items():
+            book = self.index.books.get(title, {})
+            report[title] = {
+                "tokens": int(token_ids.nbytes),
+                # Arrays loaded from the token store are pages of a mapped file, shared with the page cache
+                "tokens_memory_mapped": not token_ids.flags.owndata,
+                "index": int(sum(book[key].nbytes for key in ("ids", "counts", "first") if key in book)),
+                "positions": int(self.positions.nbytes(title)) if title in self.positions.books else 0,
+                # Token arrays decoded from the postings; none while the corpus is attached
+                "positions_tokens": int(self.positions.tokens_nbytes(title)),
+                "ngrams": int(sum(t.ngram_ids.nbytes + t.counts.nbytes for (_, t_title), t in ngram_tables if t_title == title)),
+            }
+        return {
+            "books": report,
+            "vocabulary_words": len(self.corpus.vocabulary),
+            "index_term_counts": int(self.index.term_counts.nbytes + self.index.doc_counts.nbytes),
+            "ngrams_corpus": int(sum(t.ngram_ids.nbytes + t.counts.nbytes for (_, t_title), t in ngram_tables if t_title == ALL_BOOKS)),
+            "peak_rss": peak_rss_bytes(),
+        }
+
+    @staticmethod
+    def int_param(params, name, default, minimum=0, maximum=None):
+        """
+        Return an integer query parameter; raise ValueError if it is not an integer in [minimum, maximum].
+        Args:
+            params (dict): Query parameters mapped to their last value.
+            name (string): Name of the parameter.
+            default (int): Value when the parameter is missing.
+            minimum (int): Smallest accepted value.
+            maximum (int): Largest accepted value (no limit if None).
+        """
+        text = params.get(name)
+        if text is None:
+            return default
+        bounds = f"between {minimum} and {maximum}" if maximum is not None else f">= {minimum}"
+        try:
+            value = int(text)
+        except ValueError:
+            raise ValueError(f"{name} must be an integer {bounds}, not {text!r}") from None
+        if value < minimum or (maximum is not None and value > maximum):
+            raise ValueError(f"{name} must be an integer {bounds}, not {value}")
+        return value
+
+    def query(self, path, params):
+        """
+        Answer one request given its path and query parameters; raise KeyError for unknown routes or books, ValueError for bad parameters.
+        Args:
+            path (string): Path of the request, ie "/top".
+            params (dict): Query parameters mapped to their last value.
+        """
+        title = params.get("book")
+        words = [w for w in params.get("words", "").split(",") if w]
+        phrase = params.get("phrase", "").split()
+        if path == "/books":
+            return self.books()
+        if path == "/top":
+            return self.top_words(self.int_param(params, "k", 10), title)
+        if path == "/unique":
+            return self.unique_words(self.int_param(params, "k", 10), title)
+        if path == "/tfidf":
+            if not words:
+                raise ValueError("words is required, ie words=moor,douglas")
+            return self.tf_idf(words, params.get("smooth") in ("1", "true"))
+        if path == "/cooccurrence":
+            if not words:
+                raise ValueError("words is required, ie words=holmes,watson")
+            window_size = self.int_param(params, "window", 1, 0, MAX_WINDOW_SIZE)
+            return self.cooccurrence(words, window_size, title, params.get("sliding") in ("1", "true"))
+        if path == "/ngrams":
+            return self.ngrams(self.int_param(params, "n", 2, 1, MAX_NGRAM_SIZE), self.int_param(params, "k", 10), title)
+        if path == "/phrase":
+            if not phrase:
+                raise ValueError("phrase is required, ie phrase=sherlock holmes")
+            # Number of occurrences of a phrase (or word) per book
+            return {t: len(starts) for t, starts in self.positions.phrase(phrase, title).items()}
+        if path == "/near":
+            if len(words) != 2:
+                raise ValueError("words must be two words, ie words=holmes,watson")
+            distance = self.int_param(params, "distance", 5)
+            near = self.positions.near(words[0], words[1], distance, title, params.get("ordered") in ("1", "true"))
+            return {t: len(first) for t, (first, _) in near.items()}
+        if path == "/kwic":
+            if not phrase:
+                raise ValueError("phrase is required, ie phrase=sherlock holmes")
+            width = self.int_param(params, "width", 5, 0, MAX_WINDOW_SIZE)
+            return self.positions.kwic(phrase, width, title, self.int_param(params, "k", 20))
+        if path == "/memory":
+            return self.memory()
+        raise KeyError(f"Unknown path: {path}")
+
+async def handle_request(service, executor, reader, writer):
+    """
+    Read one HTTP GET request, answer it with JSON and close the connection.
+    Queries run in the thread pool, so a slow query does not hold up the others.
+    """
+    try:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        # Skip the headers; queries are fully described by the URL
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        if len(request_line) < 2:
+            status, body = 400, {"error": "Malformed request"}
+        elif request_line[0] != "GET":
+            status, body = 405, {"error": "Only GET is supported"}
+        else:
+            url = urlsplit(request_line[1])
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(executor, service.query, url.path, params)
+                status, body = 200, result
+            except KeyError as error:
+                status, body = 404, {"error": error.args[0]}
+            except ValueError as error:
+                status, body = 400, {"error": str(error)}
+            except Exception as error:
+                status, body = 500, {"error": repr(error)}
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {HTTP_STATUS[status]}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + payload
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+async def serve(service, host="127.0.0.1", port=8000, workers=4):
+    """
+    Serve queries on host:port until cancelled.
+    Args:
+        service (AnalysisService): The loaded service.
+        host (string): Address to listen on; the default only accepts local connections.
+        port (int): Port to listen on.
+        workers (int): Number of threads answering queries concurrently.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        server = await asyncio.start_server(
+            lambda reader, writer: handle_request(service, executor, reader, writer), host, port
+        )
+        print(f"Serving {len(service.corpus)} books on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve word usage queries over the Sherlock Holmes novels.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000).")
+    parser.add_argument("--threads", type=int, default=4, help="Number of queries answered concurrently (default: 4).")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of processes used to preprocess books that are not cached (default: 1).")
+    parser.add_argument("--cache-dir", default=CLEANED_STORE_DIR,
+                        help=f"Directory of the token store of cleaned books (default: {CLEANED_STORE_DIR}).")
+    parser.add_argument("--index-path", default=INDEX_PATH,
+                        help=f"File of the persistent corpus index of term counts (default: {INDEX_PATH}).")
+    parser.add_argument("--positions-path", default=POSITIONAL_INDEX_PATH,
+                        help=f"File of the persistent positional index (default: {POSITIONAL_INDEX_PATH}).")
+    args = parser.parse_args(argv)
+    service = AnalysisService.load(args.workers, args.cache_dir, args.index_path, args.positions_path)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.threads))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Compare books and find near-duplicate editions with MinHash signatures and locality-sensitive hashing"""
+import re
+import zlib
+import numpy as np
+from data_preprocessing import PreprocessingPipeline
+
+# Multiplier combining the word hashes of a shingle (an odd 64-bit constant; products wrap around modulo 2 ** 64)
+SHINGLE_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+WORD_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+def shingle_hashes(words, k=5):
+    """
+    Return the sorted distinct 64-bit hashes of the k-word shingles (runs of k consecutive words) of a text.
+    Hashes are stable across runs and processes, so signatures of different runs can be compared.
+    Args:
+        words (list): The words of the text.
+        k (int): Number of words per shingle; a text shorter than k words is one shingle.
+    """
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+    cache = {}
+    # crc32 is stable across processes, unlike hash()
+    word_hashes = np.array(
+        [cache.get(w) or cache.setdefault(w, zlib.crc32(w.encode("utf-8"))) for w in words],
+        dtype=np.uint64,
+    )
+    k = min(k, len(word_hashes))
+    count = len(word_hashes) - k + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    for j in range(k):
+        hashes = hashes * SHINGLE_MULTIPLIER + word_hashes[j:j + count]
+    return np.unique(hashes)
+
+def raw_text_shingles(raw_text, k=5):
+    """
+    Return the shingle hashes of a raw Project Gutenberg book, without its header and licence, so reprints under other ebook numbers match.
+    Args:
+        raw_text (string): Contains the unprocessed, downloaded text.
+        k (int): Number of words per shingle.
+    """
+    text = PreprocessingPipeline.strip_boilerplate(raw_text.lower())
+    return shingle_hashes(WORD_PATTERN.findall(text), k)
+
+def exact_jaccard(first, second):
+    """
+    Return the Jaccard similarity of two sets of shingle hashes given as sorted distinct arrays.
+    Args:
+        first (np.ndarray): Shingle hashes of the first text.
+        second (np.ndarray): Shingle hashes of the second text.
+    """
+    if not len(first) and not len(second):
+        return 0.0
+    common = len(np.intersect1d(first, second, assume_unique=True))
+    return common / (len(first) + len(second) - common)
+
+class MinHasher:
+    """
+    MinHash with num_perm multiply-shift hash functions: the fraction of equal signature values of two texts estimates their Jaccard similarity.
+    Args:
+        num_perm (int): Number of hash functions (signature length); the estimate's standard error is about 1 / sqrt(num_perm).
+        seed (int): Seed of the hash functions; only signatures with the same seed and num_perm can be compared.
+    """
+    def __init__(self, num_perm=128, seed=0):
+        self.num_perm = num_perm
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        # Odd multipliers make x -> a * x a permutation of the 64-bit integers
+        self.multipliers = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.increments = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+
+    def signature(self, shingles, chunk_size=8192):
+        """
+        Return the MinHash signature (uint32, one value per hash function) of a set of shingle hashes.
+        Args:
+            shingles (np.ndarray): Shingle hashes, ie from shingle_hashes.
+            chunk_size (int): Number of shingles hashed at once, bounding memory to chunk_size * num_perm values.
+        """
+        signature = np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint64)
+        for start in range(0, len(shingles), chunk_size):
+            chunk = shingles[start:start + chunk_size, None]
+            # The high 32 bits of a * x + b (mod 2 ** 64) are a well-mixed hash of x
+            hashed = (chunk * self.multipliers + self.increments) >> np.uint64(32)
+            np.minimum(signature, hashed.min(axis=0), out=signature)
+        return signature.astype(np.uint32)
+
+class MinHashIndex:
+    """
+    Index of MinHash signatures with LSH banding: signatures are cut into bands, and books sharing any band are candidates.
+    Two books of Jaccard similarity s become candidates with probability 1 - (1 - s ** rows) ** bands, so only similar books are compared,
+    and candidates are re-ranked by their exact Jaccard similarity over the stored shingles.
+    Args:
+        num_perm (int): Signature length.
+        bands (int): Number of bands; must divide num_perm. The default 16 bands of 8 rows starts finding pairs around s = 0.7.
+        seed (int): Seed of the hash functions.
+    """
+    def __init__(self, num_perm=128, bands=16, seed=0):
+        if num_perm % bands:
+            raise ValueError(f"bands ({bands}) must divide num_perm ({num_perm})")
+        self.hasher = MinHasher(num_perm, seed)
+        self.bands = bands
+        self.rows = num_perm // bands
+        # One {band value: keys} table per band
+        self.buckets = [{} for _ in range(bands)]
+        # Order books were added in, so candidates and tied results come out in a stable order
+        self.positions = {}
+        self.signatures = {}
+        self.shingles = {}
+
+    def _band_keys(self, signature):
+        """Return the bucket key of each band of a signature."""
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def add(self, key, shingles):
+        """
+        Add a book.
+        Args:
+            key (hashable): Key of the book, ie its title or position.
+            shingles (np.ndarray): Shingle hashes of the book, kept for exact re-ranking.
+        """
+        signature = self.hasher.signature(shingles)
+        for bucket, band_key in zip(self.buckets, self._band_keys(signature)):
+            bucket.setdefault(band_key, []).append(key)
+        self.positions.setdefault(key, len(self.positions))
+        self.signatures[key] = signature
+        self.shingles[key] = shingles
+
+    def candidates(self, signature):
+        """
+        Return the keys of the books sharing at least one band with a signature, in the order they were added.
+        Args:
+            signature (np.ndarray): A signature from the same hasher.
+        """
+        found = {}
+        for bucket, band_key in zip(self.buckets, self._band_keys(signature)):
+            for key in bucket.get(band_key, ()):
+                found[key] = None
+        return sorted(found, key=self.positions.get)
+
+    def query(self, shingles, threshold=0.0, k=None, exclude=None):
+        """
+        Return the indexed books most similar to a text as (key, Jaccard similarity) pairs, most similar first.
+        Args:
+            shingles (np.ndarray): Shingle hashes of the text.
+            threshold (float): Minimum exact Jaccard similarity.
+            k (int): Maximum number of results (all if None).
+            exclude (hashable): Key to leave out, ie the queried book itself.
+        """
+        signature = self.hasher.signature(shingles)
+        scored = [
+            (key, exact_jaccard(shingles, self.shingles[key]))
+            for key in self.candidates(signature) if key != exclude
+        ]
+        scored = [(key, score) for key, score in scored if score >= threshold]
+        # sorted is stable, so ties keep the order books were added in
+        return sorted(scored, key=lambda item: item[1], reverse=True)[:k]
+
+    def similar(self, key, k=10, threshold=0.0):
+        """
+        Return the books most similar to an indexed book as (key, Jaccard similarity) pairs.
+        Args:
+            key (hashable): Key of the book.
+            k (int): Maximum number of results.
+            threshold (float): Minimum exact Jaccard similarity.
+        """
+        return self.query(self.shingles[key], threshold, k, exclude=key)
+
+    def estimated_jaccard(self, first, second):
+        """Return the Jaccard similarity of two indexed books estimated from their signatures alone."""
+        return float(np.mean(self.signatures[first] == self.signatures[second]))
+
+    def near_duplicates(self, threshold=0.9):
+        """
+        Return every pair of indexed books whose exact Jaccard similarity is at least threshold, as (key, key, similarity) tuples.
+        Only pairs sharing a bucket are compared.
+        Args:
+            threshold (float): Minimum exact Jaccard similarity.
+        """
+        pairs = {}
+        for bucket in self.buckets:
+            for keys in bucket.values():
+                for i, first in enumerate(keys):
+                    for second in keys[i + 1:]:
+                        if (first, second) not in pairs:
+                            pairs[(first, second)] = exact_jaccard(self.shingles[first], self.shingles[second])
+        return [(first, second, score) for (first, second), score in pairs.items() if score >= threshold]
+
+def find_duplicate_books(books, threshold=0.9, k=5):
+    """
+    Find raw books that are near-duplicates (ie reprints) of an earlier book in the list.
+    Return a {position of duplicate: position of the book it duplicates} dictionary.
+    Args:
+        books (list): Book dictionaries with title and raw text.
+        threshold (float): Minimum Jaccard similarity of the books' k-word shingles to count as a duplicate.
+        k (int): Number of words per shingle.
+    """
+    index = MinHashIndex()
+    duplicates = {}
+    for i, book in enumerate(books):
+        shingles = raw_text_shingles(book["text"], k)
+        matches = index.query(shingles, threshold, k=1)
+        if matches:
+            duplicates[i] = matches[0][0]
+        else:
+            index.add(i, shingles)
+    return duplicates
+
+def drop_duplicate_books(books, threshold=0.9):
+    """
+    Return the books without near-duplicates of earlier books, reporting each one dropped.
+    Args:
+        books (list): Book dictionaries with title and raw text.
+        threshold (float): Minimum Jaccard similarity to count as a duplicate.
+    """
+    duplicates = find_duplicate_books(books, threshold)
+    for duplicate, original in duplicates.items():
+        print(f"Skipping {books[duplicate]['title']}: near-duplicate of {books[original]['title']}")
+    return [book for i, book in enumerate(books) if i not in duplicates]
@@ -0,0 +1,203 @@
+"""Approximate most common words in bounded memory with mergeable sketches"""
+import hashlib
+import itertools
+from collections import Counter
+import numpy as np
+
+class CountMinSketch:
+    """
+    Count-min sketch: a depth x width table of counters where each word is hashed to one counter per row.
+    Estimates never undercount, and overcount by at most 2 * total / width with probability 1 - 0.5 ** depth.
+    Sketches with the same width, depth and seed can be merged by adding their tables.
+    Args:
+        width (int): Number of counters per row.
+        depth (int): Number of rows (independent hash functions).
+        seed (int): Seed of the hash functions.
+    """
+    def __init__(self, width=2048, depth=5, seed=0):
+        self.width = width
+        self.depth = depth
+        self.seed = seed
+        self._salts = [seed.to_bytes(8, "little") + row.to_bytes(8, "little") for row in range(depth)]
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+
+    def _columns(self, word):
+        """Return the counter of each row that word hashes to."""
+        data = word.encode("utf-8")
+        # A blake2b salted per row gives each row an independent hash (a crc32 seeded per row does not: words colliding
+        # in one row collide in all of them); unlike hash() it is stable across processes, so sketches can be merged
+        return [
+            int.from_bytes(hashlib.blake2b(data, digest_size=8, salt=salt).digest(), "little") % self.width
+            for salt in self._salts
+        ]
+
+    def update(self, counts):
+        """
+        Add word counts to the sketch.
+        Args:
+            counts (dict): Words mapped to how many times they were seen.
+        """
+        rows = np.arange(self.depth)
+        for word, count in counts.items():
+            self.table[rows, self._columns(word)] += count
+            self.total += count
+
+    def estimate(self, word):
+        """
+        Return an upper bound on the count of a word.
+        Args:
+            word (string): The word to look up.
+        """
+        return int(self.table[np.arange(self.depth), self._columns(word)].min())
+
+    def merge(self, other):
+        """
+        Return a sketch of both streams.
+        Args:
+            other (CountMinSketch): A sketch with the same width, depth and seed.
+        """
+        if (self.width, self.depth, self.seed) != (other.width, other.depth, other.seed):
+            raise ValueError("Only sketches with the same width, depth and seed can be merged")
+        merged = CountMinSketch(self.width, self.depth, self.seed)
+        merged.table = self.table + other.table
+        merged.total = self.total + other.total
+        return merged
+
+class SpaceSaving:
+    """
+    Space-Saving summary of the most frequent words in a token stream, holding at most capacity counters.
+    Each kept word has an overestimated count and an error: its true count lies in [count - error, count].
+    Any word that is not kept occurs at most min_count times.
+    Summaries are mergeable, so per-book summaries combine into a corpus-wide one without re-reading text.
+    Args:
+        capacity (int): Maximum number of words kept.
+        sketch (CountMinSketch): Optional count-min sketch updated alongside, used to tighten the reported counts.
+    """
+    def __init__(self, capacity=1000, sketch=None):
+        self.capacity = capacity
+        self.sketch = sketch
+        self.counts = {}
+        self.errors = {}
+        self.min_count = 0
+        self.total = 0
+
+    @classmethod
+    def from_counts(cls, counts, capacity=1000, sketch=None):
+        """
+        Summarize exact word counts (ie of one chunk of a stream), keeping the capacity most frequent words.
+        Args:
+            counts (Counter): Words mapped to their exact counts.
+            capacity (int): Maximum number of words kept.
+            sketch (CountMinSketch): Optional count-min sketch to update with the counts.
+        """
+        summary = cls(capacity, sketch)
+        ranked = counts.most_common(capacity + 1)
+        if len(ranked) > capacity:
+            # Every dropped word occurs at most as often as the first one left out
+            summary.min_count = ranked[capacity][1]
+            ranked = ranked[:capacity]
+        summary.counts = dict(ranked)
+        summary.errors = dict.fromkeys(summary.counts, 0)
+        summary.total = sum(counts.values())
+        if sketch is not None:
+            sketch.update(counts)
+        return summary
+
+    def update(self, tokens, chunk_size=65536):
+        """
+        Add a stream of tokens, reading it in chunks so memory stays bounded by capacity + chunk_size.
+        Args:
+            tokens (iterable): Words, ie a stream from stream_preprocessed_tokens.
+            chunk_size (int): Number of tokens counted exactly before being merged into the summary.
+        """
+        tokens = iter(tokens)
+        while True:
+            chunk = Counter(itertools.islice(tokens, chunk_size))
+            if not chunk:
+                return self
+            self._absorb(SpaceSaving.from_counts(chunk, self.capacity, self.sketch))
+
+    def merge(self, other):
+        """
+        Return a summary of both streams.
+        Args:
+            other (SpaceSaving): Another summary; the result keeps this summary's capacity.
+        """
+        merged = SpaceSaving(self.capacity)
+        if self.sketch is not None and other.sketch is not None:
+            merged.sketch = self.sketch.merge(other.sketch)
+        merged._absorb(self)
+        merged._absorb(other)
+        return merged
+
+    def _absorb(self, other):
+        """Merge another summary into this one (Agarwal et al., Mergeable Summaries)."""
+        # dict.fromkeys keeps the order deterministic, so ties rank the same on every run
+        words = dict.fromkeys(itertools.chain(self.counts, other.counts))
+        # A word missing from a summary may still have occurred up to that summary's min_count times
+        counts = {w: self.counts.get(w, self.min_count) + other.counts.get(w, other.min_count) for w in words}
+        errors = {w: self.errors.get(w, self.min_count) + other.errors.get(w, other.min_count) for w in words}
+        min_count = self.min_count + other.min_count
+        if len(counts) > self.capacity:
+            ranked = sorted(counts, key=counts.get, reverse=True)
+            min_count = max(min_count, counts[ranked[self.capacity]])
+            counts = {w: counts[w] for w in ranked[:self.capacity]}
+        self.counts = counts
+        self.errors = {w: errors[w] for w in counts}
+        self.min_count = min_count
+        self.total += other.total
+
+    def top_k(self, k=None):
+        """
+        Return the k most frequent words as (word, count, error) tuples; the true count lies in [count - error, count].
+        Args:
+            k (int): Number of words to return (all kept words if None).
+        """
+        ranked = []
+        for word, count in self.counts.items():
+            lower = count - self.errors[word]
+            if self.sketch is not None:
+                count = min(count, self.sketch.estimate(word))
+            ranked.append((word, count, count - lower))
+        ranked.sort(key=lambda item: item[1], reverse=True)
+        return ranked[:k]
+
+    def most_common(self, k=None):
+        """
+        Return the k most frequent words as (word, count) pairs, like return_most_common.
+        Args:
+            k (int): Number of words to return (all kept words if None).
+        """
+        return [(word, count) for word, count, _ in self.top_k(k)]
+
+    def error_bound(self):
+        """Return the largest count a word missing from the summary can have."""
+        return self.min_count
+
+def book_summaries(book_texts, capacity=1000, sketch_width=None):
+    """
+    Build one Space-Saving summary per book.
+    Args:
+        book_texts (dict or Corpus): Dictionary with book titles as keys and full text, token lists or token streams as values, or a Corpus.
+        capacity (int): Maximum number of words kept per summary.
+        sketch_width (int): If set, back each summary with a count-min sketch of this width.
+    """
+    # Imported here to avoid a circular import: data_analysis uses SpaceSaving in return_most_common
+    from data_analysis import book_tokens
+    return {
+        title: SpaceSaving(capacity, CountMinSketch(sketch_width) if sketch_width else None).update(book_tokens(book_texts, title))
+        for title in book_texts
+    }
+
+def merge_summaries(summaries):
+    """
+    Merge per-book summaries into one summary of the whole collection, without re-reading any text.
+    Args:
+        summaries (iterable): SpaceSaving summaries.
+    """
+    summaries = list(summaries)
+    merged = summaries[0]
+    for summary in summaries[1:]:
+        merged = merged.merge(summary)
+    return merged
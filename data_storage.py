@@ -0,0 +1,190 @@
+"""Store raw and cleaned books in a compact binary format"""
+import json
+import os
+import numpy as np
+from data_corpus import Corpus
+
+FORMAT_VERSION = 1
+RAW_STORE_DIR = "books_raw"
+CLEANED_STORE_DIR = "books_cleaned"
+HEADER_FILE = "header.json"
+VOCABULARY_FILE = "vocabulary.txt"
+
+def read_header(store_dir):
+    """
+    Read the JSON header of a store, or return None if the store does not exist.
+    Args:
+        store_dir (string): Directory of the store.
+    """
+    try:
+        with open(os.path.join(store_dir, HEADER_FILE), "r", encoding="utf-8") as f:
+            header = json.load(f)
+    except FileNotFoundError:
+        return None
+    if header.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported store format in {store_dir}: {header.get('format')}")
+    return header
+
+def write_header(store_dir, header):
+    """
+    Write the JSON header of a store atomically; it is written last, so it only ever describes complete files.
+    Args:
+        store_dir (string): Directory of the store.
+        header (dict): Header contents.
+    """
+    path = os.path.join(store_dir, HEADER_FILE)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(dict(header, format=FORMAT_VERSION), f, indent=1, ensure_ascii=False)
+    os.replace(f"{path}.tmp", path)
+
+def save_raw_books(books, store_dir=RAW_STORE_DIR):
+    """
+    Save raw books as one UTF-8 text file per book, with their metadata in the header.
+    Args:
+        books (list): Book dictionaries with title, author, language and raw text.
+        store_dir (string): Directory of the store.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    entries = []
+    for i, book in enumerate(books):
+        file_name = f"{i:05d}.txt"
+        # newline="" keeps the Gutenberg CRLF line endings byte for byte
+        with open(os.path.join(store_dir, file_name), "w", encoding="utf-8", newline="") as f:
+            f.write(book["text"])
+        entries.append(dict({k: v for k, v in book.items() if k != "text"}, file=file_name))
+    write_header(store_dir, {"books": entries})
+
+def load_raw_books(store_dir=RAW_STORE_DIR):
+    """
+    Load raw books saved by save_raw_books in the same format as books_raw.json.
+    Raises FileNotFoundError if the store does not exist.
+    Args:
+        store_dir (string): Directory of the store.
+    """
+    header = read_header(store_dir)
+    if header is None:
+        raise FileNotFoundError(f"No raw book store in {store_dir}")
+    books = []
+    for entry in header["books"]:
+        with open(os.path.join(store_dir, entry["file"]), "r", encoding="utf-8", newline="") as f:
+            text = f.read()
+        book = {k: v for k, v in entry.items() if k != "file"}
+        book["text"] = text
+        books.append(book)
+    return books
+
+def raw_book_files(store_dir=RAW_STORE_DIR):
+    """
+    Return the metadata of each raw book with the path of its text file instead of the text, for streaming large books.
+    Args:
+        store_dir (string): Directory of the store.
+    """
+    header = read_header(store_dir)
+    if header is None:
+        raise FileNotFoundError(f"No raw book store in {store_dir}")
+    return [
+        dict({k: v for k, v in entry.items() if k != "file"}, path=os.path.join(store_dir, entry["file"]))
+        for entry in header["books"]
+    ]
+
+class TokenStore:
+    """
+    Cleaned books stored as one uint32 token array per book over a shared, append-only vocabulary table.
+    Token arrays are saved as .npy files, so a book's tokens load zero-copy through np.memmap.
+    Args:
+        store_dir (string): Directory of the store.
+    """
+    def __init__(self, store_dir=CLEANED_STORE_DIR):
+        self.store_dir = store_dir
+        header = read_header(store_dir) or {"vocabulary_size": 0, "vocabulary_bytes": 0, "books": {}}
+        self.books = header["books"]
+        self.vocabulary_bytes = header["vocabulary_bytes"]
+        # Lines past vocabulary_size belong to a write that never reached the header
+        vocabulary = []
+        if header["vocabulary_size"]:
+            with open(os.path.join(store_dir, VOCABULARY_FILE), "rb") as f:
+                vocabulary = f.read(self.vocabulary_bytes).decode("utf-8").split("\n")[:header["vocabulary_size"]]
+        # A Corpus without books serves as the interned vocabulary table
+        self.lexicon = Corpus(vocabulary)
+        self.saved_vocabulary_size = len(vocabulary)
+        # Keys whose token files are deleted once the header no longer lists them
+        self.removed = set()
+
+    def token_path(self, key):
+        """Return the path of the token array stored under a key."""
+        return os.path.join(self.store_dir, "tokens", f"{key}.npy")
+
+    def __contains__(self, key):
+        return key in self.books
+
+    def add(self, key, tokens):
+        """
+        Encode a book's cleaned tokens and save them under a key. Call flush() to make them visible.
+        Args:
+            key (string): Key of the book, ie its content hash.
+            tokens (list): The book's cleaned tokens (words without newlines).
+        """
+        intern = self.lexicon.intern
+        token_ids = np.fromiter((intern(w) for w in tokens), dtype=np.uint32, count=len(tokens))
+        path = self.token_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "wb") as f:
+            np.save(f, token_ids)
+        os.replace(f"{path}.tmp", path)
+        self.books[key] = {"tokens": len(token_ids)}
+        self.removed.discard(key)
+
+    def remove(self, key):
+        """
+        Drop the book stored under a key. Its token file is deleted by flush(), after the header stops listing it.
+        The vocabulary table is append-only, so the book's words stay in it.
+        Args:
+            key (string): Key of the book.
+        """
+        del self.books[key]
+        self.removed.add(key)
+
+    def flush(self):
+        """Append new words to the vocabulary table, write the header, then delete the token files of removed books."""
+        os.makedirs(self.store_dir, exist_ok=True)
+        new_words = self.lexicon.vocabulary[self.saved_vocabulary_size:]
+        if new_words:
+            path = os.path.join(self.store_dir, VOCABULARY_FILE)
+            with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                # Overwrite anything left behind by an interrupted append
+                f.seek(self.vocabulary_bytes)
+                f.truncate()
+                prefix = "\n" if self.vocabulary_bytes else ""
+                self.vocabulary_bytes += f.write((prefix + "\n".join(new_words)).encode("utf-8"))
+            self.saved_vocabulary_size = len(self.lexicon.vocabulary)
+        write_header(self.store_dir, {
+            "vocabulary_size": self.saved_vocabulary_size,
+            "vocabulary_bytes": self.vocabulary_bytes,
+            "books": self.books,
+        })
+        for key in self.removed:
+            try:
+                os.remove(self.token_path(key))
+            except FileNotFoundError:
+                pass
+        self.removed.clear()
+
+    def load(self, key):
+        """
+        Return the token IDs stored under a key as a read-only np.memmap.
+        Args:
+            key (string): Key of the book.
+        """
+        return np.load(self.token_path(key), mmap_mode="r")
+
+    def corpus(self, books):
+        """
+        Return a Corpus over the store's vocabulary whose books are memory-mapped token arrays.
+        Args:
+            books (list): (title, key) pairs in the order the books should appear.
+        """
+        corpus = self.lexicon.subset([])
+        for title, key in books:
+            # Reinterpret the uint32 IDs as the corpus' int32 without copying
+            corpus.documents[title] = self.load(key).view(Corpus.dtype)
+        return corpus
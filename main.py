@@ -1,88 +1,178 @@
 """Execute code from other scripts in main()"""
-import json
+import argparse
 from data_collection import load_or_download_books
-from data_preprocessing import preprocess_all_books
-from data_analysis import return_most_common, unique_words_from_texts, calculate_tf_idf, calculate_word_pair_frequencies, analyze_ngrams, update_missing_words
-from data_graphing import create_wordcloud, create_barchart, create_mean_word_length_chart, generate_color_map, create_color_func, plot_tfidf_heatmap, plot_cooccurrence_heatmap, plot_ngrams
+from data_cache import load_or_preprocess_corpus, book_key, CACHE_DIR
+from data_index import CorpusIndex, INDEX_PATH
+from data_mapreduce import run_analysis
+from data_dispersion import DispersionIndex, chapter_starts
+from data_analysis import lexical_statistics
+from data_profiling import stage, enable_profiling, write_profile
+
+def parse_args(argv=None):
+    """
+    Parse the command line options of main().
+    Args:
+        argv (list): Command line arguments; sys.argv is used if None.
+    """
+    parser = argparse.ArgumentParser(description="Analyze word usage in the Sherlock Holmes novels.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of processes used to preprocess the books (default: 1).")
+    parser.add_argument("--cache-dir", default=CACHE_DIR,
+                        help=f"Directory of the token store of cleaned books, keyed by content hash (default: {CACHE_DIR}).")
+    parser.add_argument("--index-path", default=INDEX_PATH,
+                        help=f"File of the persistent corpus index of term counts (default: {INDEX_PATH}).")
+    parser.add_argument("--analysis-workers", type=int, default=1,
+                        help="Number of processes the books are sharded across for the co-occurrence, n-gram and TF-IDF analysis (default: 1).")
+    parser.add_argument("--output-dir", default=None,
+                        help="Save figures to this directory with the headless Agg backend instead of showing them.")
+    parser.add_argument("--format", default="png", choices=["png", "svg"],
+                        help="File format of saved figures (default: png).")
+    parser.add_argument("--render-workers", type=int, default=1,
+                        help="Number of processes rendering saved figures in parallel (default: 1).")
+    parser.add_argument("--layout-workers", type=int, default=1,
+                        help="Number of processes laying out the per-book wordclouds of a figure in parallel (default: 1).")
+    parser.add_argument("--profile", default=None, metavar="FILE",
+                        help="Record time, memory and item counts of each stage and write them to FILE (Prometheus text if it ends in .prom, JSON otherwise).")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="With --profile, also record the traced Python memory of each stage (tracemalloc; slows the run down).")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Stages are only recorded with --profile; otherwise they cost a flag check each
+    if args.profile:
+        enable_profiling(trace_memory=args.profile_memory)
 
-def main():
     # Load raw books, if available; if not, redownload them
-    # To test functionality, delete books_raw.json
-    books = load_or_download_books()
-
-    # Preprocess each book (remove text, make lowercase, etc.) and update its text field
-    preprocess_all_books(books)
-
-    # Save the processed text back to a new JSON file
-    with open("books_cleaned.json", "w", encoding="utf-8") as file:
-        json.dump(books, file, indent=4, ensure_ascii=False)
-
-    # Read the processed text and analyze
-    with open("books_cleaned.json", "r", encoding="utf-8") as f:
-        cleaned_books = json.load(f)
-
-    # Text from each book in string format to generate WordCloud
-    books_text = {book['title']: ' '.join(book['text']) for book in cleaned_books}
-
-    # Text from all novels in string format
-    all_text = {
-        "Sherlock Holmes Novels": ' '.join(books_text.values()),
-    }
-
-    # 10 most common words for each book
-    books_common_words = {title: return_most_common(text, 10) for title, text in books_text.items()}
-
-    # 10 most common words for all of the novels
-    all_text_common_words  = {
-        "Sherlock Holmes Novels": return_most_common(all_text["Sherlock Holmes Novels"], 10),
-    }
+    # To test functionality, delete the books_raw directory (and books_raw.json, which is converted on first run)
+    with stage("load_books") as record:
+        books = load_or_download_books()
+        record["books"] = len(books)
+
+    # Preprocess each book (remove text, make lowercase, etc.); books whose raw text is unchanged are memory-mapped from the token store
+    # Token IDs for each book over one shared vocabulary, built once and shared by every analysis
+    with stage("load_corpus") as record:
+        books_text = load_or_preprocess_corpus(books, workers=args.workers, cache_dir=args.cache_dir)
+        record["tokens"] = books_text.num_tokens()
+        record["vocabulary"] = len(books_text.vocabulary)
+
+    # Per-book and corpus-wide term counts, only updated for books added, removed or changed since the last run
+    with stage("index_sync", books=len(books_text)) as record:
+        index = CorpusIndex.load_or_create(args.index_path)
+        index.sync(books_text, {book["title"]: book_key(book["text"]) for book in books})
+        index.save(args.index_path)
+        record["vocabulary"] = len(index.lexicon.vocabulary)
+
+    with stage("most_common"):
+        # 10 most common words for each book
+        books_common_words = {title: index.most_common(10, title) for title in books_text}
+
+        # 10 most common words for all of the novels
+        all_text_common_words  = {
+            "Sherlock Holmes Novels": index.most_common(10),
+        }
 
-    # 50 most common words for all of the novels (without count)
-    common_word_list = {
-        book: [word for word, _ in words]
-        for book, words in {
-        "Sherlock Holmes Novels": return_most_common(all_text["Sherlock Holmes Novels"], 50),
+        # 50 most common words for all of the novels (without count)
+        common_word_list = {
+            book: [word for word, _ in words]
+            for book, words in {
+            "Sherlock Holmes Novels": index.most_common(50),
+            }
+            .items()
         }
-        .items()
-    }
+
+    # Plotting pulls in matplotlib, seaborn and wordcloud, so it is only imported once the figures are drawn
+    from data_graphing import create_wordcloud, create_barchart, create_mean_word_length_chart, generate_color_map, create_color_func, plot_tfidf_heatmap, plot_cooccurrence_heatmap, plot_ngrams, plot_dispersion, plot_lexical_statistics, configure_output, render_figures
 
     # Take the most common words and assign a color to them which is consistent for graphical analysis. Wordclouds use a color function, barcharts use a color mapping
     common_words = set(word for book in books_common_words.values() for word, _ in book)
     color_map = generate_color_map(common_words)
     color_func = create_color_func(color_map)
 
+    # Figures are independent, so they are collected as (function, args, kwargs) jobs and rendered together
+    configure_output(args.output_dir, args.format)
+    figures = []
+
+    # Wordclouds are drawn from counts the index already holds, so no text is re-tokenized; stopwords are dropped before the 200 words a wordcloud shows are kept
+    wordcloud_options = {"workers": args.layout_workers}
+
     # Create 5 wordclouds for each of the novels showing most common words
-    create_wordcloud(books_text, color_func)
+    figures.append((create_wordcloud, ({title: index.most_common(title=title) for title in books_text}, color_func), wordcloud_options))
 
     # Create a wordcloud which shows the most common words for all novels
-    create_wordcloud(all_text, color_func)
+    figures.append((create_wordcloud, ({"Sherlock Holmes Novels": index.most_common()}, color_func), wordcloud_options))
 
     # Create 5 barcharts to compare counts of most common words
-    create_barchart(books_common_words, color_map)
+    figures.append((create_barchart, (books_common_words, color_map), {}))
 
     # Create 5 barcharts to compare frequencies of most common words
-    create_barchart(all_text_common_words, color_map)
+    figures.append((create_barchart, (all_text_common_words, color_map), {}))
+
+    # Lexical statistics of every book (type/token ratio, hapax legomena, word lengths, vocabulary growth, Zipf slope) in one pass over the token IDs
+    with stage("lexical_statistics", tokens=books_text.num_tokens()):
+        statistics = lexical_statistics(books_text, 50)
 
     # Create a line chart which shows the average length of the top n (in this case, 50) words for each novel
-    create_mean_word_length_chart(books_text, 50)
+    figures.append((create_mean_word_length_chart, (statistics, 50), {}))
+
+    # Plot the vocabulary growth and word-length distribution of each novel
+    figures.append((plot_lexical_statistics, (statistics,), {}))
 
     # Create 5 wordclouds for each of the novels, showing unique words in each
-    create_wordcloud({title: ' '.join(words) for title, words in unique_words_from_texts(books_text).items()}, color_func, True)
+    with stage("unique_words") as record:
+        unique_words = {title: index.unique_words(title) for title in books_text}
+        record["words"] = sum(len(words) for words in unique_words.values())
+    figures.append((create_wordcloud, (unique_words, color_func, True), wordcloud_options))
+
+    # Books are sharded across worker processes, each reducing its books to mergeable partials (term counts, document frequencies,
+    # co-occurrence and n-gram counts); the all-novels results are merged from them, so the novels are never concatenated
+    with stage("map_reduce", books=len(books_text), tokens=books_text.num_tokens()):
+        analysis = run_analysis(books_text, common_word_list["Sherlock Holmes Novels"], window_size=1, ns=[2], workers=args.analysis_workers)
+
+    # Term frequencies of the most common words of every book, including words that are common in other books
+    with stage("update_missing_words"):
+        tf_idf_words = analysis.update_missing_words(books_common_words)
 
     #Plot standard tfidf heatmap
-    plot_tfidf_heatmap(calculate_tf_idf(update_missing_words(books_common_words, books_text), books_text))
+    with stage("tf_idf"):
+        figures.append((plot_tfidf_heatmap, (analysis.tf_idf(tf_idf_words),), {}))
 
     #Plot smooth tfidf heatmap
-    plot_tfidf_heatmap(calculate_tf_idf(update_missing_words(books_common_words, books_text), books_text, smooth=True), smooth=True)
+    with stage("tf_idf_smooth"):
+        figures.append((plot_tfidf_heatmap, (analysis.tf_idf(tf_idf_words, smooth=True),), {"smooth": True}))
 
     # Create a co-occurrence heatmap for the 50 most common words (windowsize 1, which looks at the words next to each common word - 3 word segments)
-    plot_cooccurrence_heatmap(calculate_word_pair_frequencies(all_text, common_word_list, 1), common_word_list, 1)
+    with stage("cooccurrence"):
+        cooccurrence_matrices = {"Sherlock Holmes Novels": analysis.cooccurrence()}
+    for book, matrix in cooccurrence_matrices.items():
+        figures.append((plot_cooccurrence_heatmap, ({book: matrix}, common_word_list, 1), {}))
 
     # Plot the top 10 2-word combinations for each book in the collection (itertools)
-    plot_ngrams(analyze_ngrams(books_text, 2), 10, 2)
+    with stage("ngrams_books") as record:
+        book_ngrams = {title: analysis.ngrams(2, title) for title in books_text}
+        record["ngrams"] = sum(len(ngrams) for ngrams in book_ngrams.values())
+    figures.append((plot_ngrams, (book_ngrams, 10, 2), {}))
 
     # Plot the top 10 2-word combinations for all Sherlock Holmes Novels
-    plot_ngrams(analyze_ngrams(all_text, 2), 10, 2)
+    with stage("ngrams_all") as record:
+        all_ngrams = {"Sherlock Holmes Novels": analysis.ngrams(2)}
+        record["ngrams"] = sum(len(ngrams) for ngrams in all_ngrams.values())
+    figures.append((plot_ngrams, (all_ngrams, 10, 2), {}))
+
+    # Plot how the 8 most common words of all novels rise and fall through each book (2000-token rolling window), from prefix counts built in one pass,
+    # with the chapter starts found from the chapter headings
+    with stage("dispersion", tokens=books_text.num_tokens()) as record:
+        dispersion = DispersionIndex.from_corpus(books_text, [word for word, _ in index.most_common(8)])
+        chapters = {title: chapter_starts(books_text, title) for title in books_text}
+        record["bytes"] = dispersion.nbytes()
+    figures.append((plot_dispersion, (dispersion,), {"window": 2000, "color_map": color_map, "chapters": chapters}))
+
+    # Figures rendered in this process are also recorded one by one, as plot_<function> stages
+    with stage("render_figures", figures=len(figures)):
+        render_figures(figures, args.render_workers)
+
+    if args.profile:
+        write_profile(args.profile)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,113 @@
+"""The analysis functions give the same results on a Corpus, and on their faster paths, as the dict and Counter code they replaced"""
+from collections import Counter
+import numpy as np
+import pandas as pd
+import pytest
+import reference_analysis as reference
+from data_corpus import Corpus
+from data_analysis import (
+    unique_words_from_texts, return_most_common, update_missing_words, calculate_tf_idf, tf_idf_matrices, calculate_vocabulary_tf_idf,
+    calculate_mean_word_length, analyze_ngrams, count_ngrams, clear_frequency_tables,
+)
+
+@pytest.fixture(scope="module")
+def books_text():
+    # Zipf-like counts over a small vocabulary, so many words tie and some only occur in one book
+    rng = np.random.default_rng(0)
+    vocabulary = [f"{'w' * (i % 7 + 1)}{i}" for i in range(60)]
+    weights = 1 / np.arange(1, len(vocabulary) + 1)
+    return {
+        f"book {i}": " ".join(rng.choice(vocabulary[i * 5:], size=length, p=weights[i * 5:] / weights[i * 5:].sum()))
+        for i, length in enumerate([1500, 40, 900, 2])
+    }
+
+@pytest.fixture(autouse=True)
+def fresh_frequency_tables():
+    clear_frequency_tables()
+
+def test_corpus_round_trip(books_text):
+    corpus = Corpus.from_texts(books_text)
+    assert corpus.titles() == list(books_text)
+    assert len(corpus.vocabulary) == len(set(" ".join(books_text.values()).split()))
+    for title, text in books_text.items():
+        assert corpus.tokens(title).dtype == Corpus.dtype
+        assert corpus.text(title) == text
+        assert corpus.num_tokens(title) == len(text.split())
+        assert dict(zip(corpus.vocabulary, corpus.counts(title).tolist())) == {
+            word: Counter(text.split())[word] for word in corpus.vocabulary
+        }
+    assert corpus.num_tokens() == sum(len(text.split()) for text in books_text.values())
+    assert corpus.counts().tolist() == [Counter(" ".join(books_text.values()).split())[w] for w in corpus.vocabulary]
+    assert corpus.encode(["w0", "unknown"]).tolist() == [corpus.word_to_id["w0"], -1]
+    assert corpus.decode(corpus.encode(corpus.vocabulary)) == corpus.vocabulary
+
+def test_corpus_views_share_the_vocabulary(books_text):
+    corpus = Corpus.from_texts(books_text)
+    subset = corpus.subset(["book 2", "book 0"])
+    assert subset.titles() == ["book 2", "book 0"] and subset.vocabulary is corpus.vocabulary
+    assert subset.text("book 0") == books_text["book 0"]
+    combined = corpus.combined("all")
+    assert combined.titles() == ["all"] and combined.vocabulary is corpus.vocabulary
+    assert combined.text("all") == " ".join(books_text.values())
+
+def test_corpus_matches_dict_code_paths(books_text):
+    corpus = Corpus.from_texts(books_text)
+    all_text = " ".join(books_text.values())
+    for title, text in books_text.items():
+        assert return_most_common(corpus, 10, title) == reference.return_most_common(text, 10)
+    assert return_most_common(corpus, 50) == reference.return_most_common(all_text, 50)
+    common_words = {title: reference.return_most_common(text, 10) for title, text in books_text.items()}
+    missing_words = reference.update_missing_words(common_words, books_text)
+    assert update_missing_words(common_words, corpus) == missing_words
+    assert update_missing_words(common_words, books_text) == missing_words
+    for smooth in (False, True):
+        expected = reference.calculate_tf_idf(missing_words, books_text, smooth)
+        pd.testing.assert_frame_equal(calculate_tf_idf(missing_words, corpus, smooth), expected)
+        pd.testing.assert_frame_equal(calculate_tf_idf(missing_words, books_text, smooth), expected)
+    expected = reference.calculate_mean_word_length(books_text, 20)
+    assert calculate_mean_word_length(corpus, 20) == expected
+    assert calculate_mean_word_length(books_text, 20) == expected
+    for n in (1, 2, 3):
+        expected = reference.analyze_ngrams(books_text, n)
+        assert analyze_ngrams(corpus, n) == expected
+        assert {title: dict(counts.most_common()) for title, counts in count_ngrams(corpus, n).items()} == expected
+        for title, counts in count_ngrams(corpus, n).items():
+            assert counts.most_common() == expected[title].most_common()
+
+@pytest.mark.parametrize("texts", [
+    {"first": "a b c a d", "second": "b e e f", "third": "c g a", "empty": ""},
+    # Punctuation splits words the same way as in the set-based version
+    {"first": "holmes's pipe, watson's hat", "second": "the pipe... the hound!"},
+    {"only": "one book has every word unique w w"},
+])
+def test_unique_words_match_set_version(texts):
+    expected = reference.unique_words_from_texts(texts)
+    assert unique_words_from_texts(texts) == expected
+    assert unique_words_from_texts(texts, return_counts=True) == {title: Counter(words) for title, words in expected.items()}
+    for title, counts in unique_words_from_texts(texts, return_counts=True).items():
+        assert list(counts) == list(Counter(expected[title]))
+
+def test_unique_words_of_corpus(books_text):
+    expected = reference.unique_words_from_texts(books_text)
+    assert any(expected.values())
+    assert unique_words_from_texts(Corpus.from_texts(books_text)) == expected
+    assert unique_words_from_texts(books_text) == expected
+
+@pytest.mark.parametrize("smooth", [False, True])
+def test_tf_idf_matrices_match_dict_tf_idf(books_text, smooth):
+    # Every word of every book, plus one in all books (IDF 0) and an empty book
+    texts = dict({title: f"{text} everywhere" for title, text in books_text.items()}, empty="")
+    word_frequencies = {title: Counter(text.split()).most_common() for title, text in texts.items()}
+    expected = reference.calculate_tf_idf(word_frequencies, texts, smooth).sort_values(["Book", "Word"], ignore_index=True)
+    corpus = Corpus.from_texts(texts)
+    result = calculate_vocabulary_tf_idf(corpus, smooth).sort_values(["Book", "Word"], ignore_index=True)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+    counts, tf, idf, tf_idf = tf_idf_matrices(corpus, smooth)
+    assert counts.shape == tf.shape == tf_idf.shape == (len(texts), len(corpus.vocabulary))
+    idf_by_word = dict(zip(expected["Word"], expected["IDF"]))
+    np.testing.assert_allclose(idf[corpus.encode(list(idf_by_word))], list(idf_by_word.values()))
+    for i, (title, freqs) in enumerate(word_frequencies.items()):
+        ids = corpus.encode([word for word, _ in freqs])
+        assert counts[i].toarray().ravel().tolist() == corpus.counts(title).tolist()
+        np.testing.assert_allclose(tf[i, ids].toarray().ravel(), [freq / len(texts[title].split()) for _, freq in freqs])
+        np.testing.assert_allclose(tf_idf[i, ids].toarray().ravel(), tf[i, ids].toarray().ravel() * idf[ids])
@@ -0,0 +1,64 @@
+"""
+Benchmarks of the analysis functions with pytest-benchmark over synthetic corpora of growing size, compared against the baseline stored in
+benchmarks/. Each function is also timed in its pre-optimization form (tests/reference_analysis.py), in the same benchmark group, so the
+report shows the speedup at every size and the baseline holds the reference timings.
+"""
+from functools import lru_cache
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import reference_analysis as reference
+from benchmark import ALL_BOOKS, analysis_cases, nltk_available, preprocessing_case, synthetic_corpus, synthetic_raw_text
+from data_analysis import clear_frequency_tables
+
+# Synthetic corpus sizes as (books, total tokens), Zipf-distributed words
+SIZES = [(2, 10000), (10, 50000), (20, 200000)]
+# Their reference implementations grow quadratically, so they are only timed on the smallest corpus
+SLOW_REFERENCES = {"unique_words_from_texts", "preprocess_text"}
+
+def reference_cases(corpus):
+    """Return the reference calls on a corpus, with their inputs prepared as analysis_cases(corpus, "text") prepares them."""
+    books_text = {title: corpus.text(title) for title in corpus}
+    all_words = " ".join(books_text.values())
+    common_words = {title: reference.return_most_common(books_text[title], 10) for title in books_text}
+    common_word_list = {ALL_BOOKS: [word for word, _ in reference.return_most_common(all_words, 50)]}
+    missing_words = reference.update_missing_words(common_words, books_text)
+    raw_texts = [synthetic_raw_text(corpus, title) for title in corpus]
+    return {
+        "unique_words_from_texts": lambda: reference.unique_words_from_texts(books_text),
+        "return_most_common": lambda: reference.return_most_common(all_words, 50),
+        "update_missing_words": lambda: reference.update_missing_words(common_words, books_text),
+        "calculate_tf_idf": lambda: reference.calculate_tf_idf(missing_words, books_text),
+        "calculate_mean_word_length": lambda: reference.calculate_mean_word_length(books_text, 50),
+        "calculate_word_pair_frequencies": lambda: reference.calculate_word_pair_frequencies({ALL_BOOKS: all_words}, common_word_list, 1),
+        "analyze_ngrams": lambda: reference.analyze_ngrams(books_text, 2),
+        # count_ngrams replaced analyze_ngrams in main()
+        "count_ngrams": lambda: reference.analyze_ngrams(books_text, 2),
+        "preprocess_text": lambda: [reference.preprocess_text(text) for text in raw_texts],
+    }
+
+@lru_cache(maxsize=None)
+def cases(size):
+    """Return the current and reference calls on the synthetic corpus of a size, building it once."""
+    corpus = synthetic_corpus(*size)
+    return {"current": dict(analysis_cases(corpus), preprocess_text=preprocessing_case(corpus)), "reference": reference_cases(corpus)}
+
+NAMES = list(analysis_cases(synthetic_corpus(1, 100))) + ["preprocess_text"]
+PARAMS = [
+    pytest.param(implementation, name, size, id=f"{name}-{implementation}-{size[0]}x{size[1]}")
+    for name in NAMES
+    for size in SIZES
+    for implementation in ("current", "reference")
+    if implementation == "current"
+    or name in reference_cases(synthetic_corpus(1, 100)) and (name not in SLOW_REFERENCES or size == SIZES[0])
+]
+
+@pytest.mark.parametrize("implementation, name, size", PARAMS)
+def test_analysis(benchmark, implementation, name, size):
+    if name == "preprocess_text" and not nltk_available():
+        pytest.skip("The NLTK resources preprocess_text needs are not installed")
+    benchmark.group = f"{name} ({size[0]} books, {size[1]} tokens)"
+    benchmark.extra_info.update(implementation=implementation, books=size[0], tokens=size[1])
+    # Memoized frequency tables are cleared before every round, so each round does the full work
+    benchmark.pedantic(cases(size)[implementation][name], setup=clear_frequency_tables, rounds=5, warmup_rounds=1)
@@ -0,0 +1,26 @@
+"""Cleaned books are served from the token store and stale entries are pruned"""
+import os
+from data_cache import CACHE_DIR, book_key, load_or_preprocess_corpus
+from data_index import INDEX_PATH
+from data_storage import TokenStore
+
+def test_cache_serves_stored_books_and_prunes_stale_ones(tmp_path):
+    books_raw = [{"title": "First", "text": "raw text one"}, {"title": "Second", "text": "raw text two"}]
+    store = TokenStore(tmp_path)
+    # Books cleaned by an earlier run, plus one whose raw text (or pipeline version) has since changed
+    store.add(book_key("raw text one"), ["holmes", "watson"])
+    store.add(book_key("raw text two"), ["moor", "hound", "holmes"])
+    store.add(book_key("old raw text"), ["lestrade"])
+    store.flush()
+    stale_path = store.token_path(book_key("old raw text"))
+    # Every book is stored, so nothing is preprocessed
+    corpus = load_or_preprocess_corpus(books_raw, cache_dir=tmp_path)
+    assert corpus.titles() == ["First", "Second"]
+    assert corpus.words("Second") == ["moor", "hound", "holmes"]
+    assert set(TokenStore(tmp_path).books) == {book_key("raw text one"), book_key("raw text two")}
+    assert not os.path.exists(stale_path)
+
+def test_main_uses_the_cache_defaults():
+    from main import parse_args
+    args = parse_args([])
+    assert (args.cache_dir, args.index_path) == (CACHE_DIR, INDEX_PATH)
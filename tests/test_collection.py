@@ -0,0 +1,82 @@
+"""Books download over HTTP with revalidation, retries and a store that is only written once every book arrived"""
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+pytest.importorskip("requests")
+from data_collection import download_book, download_books, load_or_download_books, read_download_cache
+
+BOOK_TEXT = "Title: A Study in Scarlet\r\nAuthor: Arthur Conan Doyle\r\nLanguage: English\r\n\r\nMr. Sherlock Holmes\r\n"
+
+class GutenbergStandIn(BaseHTTPRequestHandler):
+    """Serves /book with an ETag, /flaky after two 503 responses, and nothing else."""
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("If-None-Match")))
+        if self.path == "/flaky" and sum(path == "/flaky" for path, _ in self.server.requests) <= 2:
+            self.send_response(503)
+            self.end_headers()
+        elif self.path in ("/book", "/flaky"):
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = BOOK_TEXT.encode("utf-8")
+            self.send_response(200)
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server(monkeypatch):
+    # Reach the stand-in directly, even where a proxy is configured
+    monkeypatch.setenv("NO_PROXY", "127.0.0.1")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), GutenbergStandIn)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def url(server, path):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+def test_download(server):
+    assert download_book(url(server, "/book")) == BOOK_TEXT
+    assert download_books([url(server, "/book"), url(server, "/missing")], workers=2, cache_dir=None) == [BOOK_TEXT, None]
+
+def test_revalidation_with_etag(server, tmp_path):
+    assert download_book(url(server, "/book"), cache_dir=tmp_path) == BOOK_TEXT
+    assert read_download_cache(url(server, "/book"), tmp_path) == (BOOK_TEXT, {"etag": '"v1"'})
+    # The second download sends the ETag back and is answered 304 Not Modified from the cache
+    assert download_book(url(server, "/book"), cache_dir=tmp_path) == BOOK_TEXT
+    assert server.requests == [("/book", None), ("/book", '"v1"')]
+
+def test_retry_after_server_error(server):
+    assert download_book(url(server, "/flaky"), retries=3, backoff=0) == BOOK_TEXT
+    assert [path for path, _ in server.requests] == ["/flaky"] * 3
+    server.requests.clear()
+    # Without enough retries the book is reported missing
+    assert download_book(url(server, "/flaky"), retries=0, backoff=0) is None
+
+def test_failed_download_leaves_store_unwritten(server, tmp_path):
+    store_dir, cache_dir = tmp_path / "books_raw", tmp_path / "downloads"
+    books = load_or_download_books(
+        store_dir=store_dir,
+        legacy_file=tmp_path / "books_raw.json",
+        book_urls=[url(server, "/book"), url(server, "/missing")],
+        cache_dir=cache_dir,
+        duplicate_threshold=None,
+    )
+    assert [book["title"] for book in books] == ["A Study in Scarlet"]
+    # The next run retries, and the book that did download comes from the cache
+    assert not os.path.exists(store_dir / "header.json")
+    assert read_download_cache(url(server, "/book"), cache_dir)[0] == BOOK_TEXT
@@ -0,0 +1,54 @@
+"""The consume-once co-occurrence counts match the nested loop of earlier versions"""
+import numpy as np
+import pytest
+from data_analysis import calculate_word_pair_frequencies
+
+def baseline_word_pair_frequencies(all_text, common_word_list, window_size):
+    """calculate_word_pair_frequencies as it was before it was vectorized, kept verbatim as the reference."""
+    cooccurrence_matrices = {}
+    for book, text in all_text.items():
+        common_words = common_word_list[book]
+        word_indices = [i for i, word in enumerate(text.split()) if word in common_words]
+        matrix = np.zeros((len(common_words), len(common_words)), dtype=int)
+        word_to_index = {word: i for i, word in enumerate(common_words)}
+        counted_indices = set()
+        words = text.split()
+        idx = 0
+        while idx < len(word_indices):
+            word_idx = word_indices[idx]
+            if word_idx in counted_indices:
+                idx += 1
+                continue
+            window_start = max(word_idx - window_size, 0)
+            window_end = min(word_idx + window_size + 1, len(words))
+            window_words_indices = [
+                (i, words[i]) for i in range(window_start, window_end) if i not in counted_indices
+            ]
+            for i, (index1, word1) in enumerate(window_words_indices):
+                for j, (index2, word2) in enumerate(window_words_indices[i + 1 :], start=i + 1):
+                    if word1 in word_to_index and word2 in word_to_index:
+                        matrix[word_to_index[word1], word_to_index[word2]] += 1
+                        matrix[word_to_index[word2], word_to_index[word1]] += 1
+                        counted_indices.add(index1)
+                        counted_indices.add(index2)
+            counted_indices.add(word_idx)
+            idx += 1
+        cooccurrence_matrices[book] = matrix
+    return cooccurrence_matrices
+
+@pytest.mark.parametrize("window_size", range(9))
+def test_consume_once_matches_baseline(window_size):
+    rng = np.random.default_rng(window_size)
+    vocabulary = [f"w{i}" for i in range(12)]
+    common_words = vocabulary[:6]
+    # Random streams of random lengths, including texts shorter than the window and an empty one
+    lengths = [0, 1, 2, window_size, window_size + 1] + rng.integers(1, 400, size=20).tolist()
+    texts = {
+        f"book {i}": " ".join(rng.choice(vocabulary, size=length, p=rng.dirichlet(np.ones(len(vocabulary)))))
+        for i, length in enumerate(lengths)
+    }
+    common_word_list = {title: common_words for title in texts}
+    expected = baseline_word_pair_frequencies(texts, common_word_list, window_size)
+    result = calculate_word_pair_frequencies(texts, common_word_list, window_size)
+    for title in texts:
+        np.testing.assert_array_equal(result[title], expected[title], err_msg=f"{title} ({len(texts[title].split())} tokens)")
@@ -0,0 +1,77 @@
+"""Dispersion counts read from prefix sums match a scan of the book's tokens"""
+import numpy as np
+import pytest
+from data_corpus import Corpus
+from data_dispersion import DispersionIndex, chapter_starts
+
+WORDS = ["w0", "w1", "w5", "absent"]
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = np.random.default_rng(0)
+    vocabulary = [f"w{i}" for i in range(12)]
+    return Corpus.from_texts({
+        f"book {i}": " ".join(rng.choice(vocabulary, size=length, p=rng.dirichlet(np.ones(len(vocabulary)))))
+        for i, length in enumerate([1000, 7, 0, 2345])
+    })
+
+@pytest.fixture(scope="module")
+def dispersion(corpus):
+    return DispersionIndex.from_corpus(corpus, WORDS)
+
+def scan(corpus, word, title, start, stop):
+    """Count a word in tokens start to stop of a book by looking at each token."""
+    return sum(w == word for w in corpus.words(title)[start:stop])
+
+def test_count_and_range_counts(corpus, dispersion):
+    rng = np.random.default_rng(1)
+    for title in corpus:
+        length = corpus.num_tokens(title)
+        assert dispersion.length(title) == length
+        starts = rng.integers(0, length + 1, size=20)
+        stops = np.maximum(starts, rng.integers(0, length + 1, size=20))
+        counts = dispersion.range_counts(title, starts, stops)
+        for word, row in zip(WORDS, counts):
+            assert dispersion.count(word, title) == scan(corpus, word, title, 0, length)
+            for start, stop, count in zip(starts, stops, row):
+                assert count == dispersion.count(word, title, start, stop) == scan(corpus, word, title, start, stop)
+
+def test_histogram_and_rolling(corpus, dispersion):
+    title = "book 3"
+    counts, edges = dispersion.histogram(title, boundaries=[400, 150, 2000, 5000], words=["w0", "w5"])
+    assert edges.tolist() == [0, 150, 400, 2000, 2345]
+    assert counts.tolist() == [[scan(corpus, word, title, a, b) for a, b in zip(edges[:-1], edges[1:])] for word in ["w0", "w5"]]
+    centers, frequencies = dispersion.rolling(title, window=300, step=70)
+    starts = np.arange(0, 2345 - 300 + 1, 70)
+    assert centers.tolist() == (starts + 150).tolist()
+    expected = [[scan(corpus, word, title, start, start + 300) * 1000 / 300 for start in starts] for word in WORDS]
+    np.testing.assert_allclose(frequencies, expected)
+    # A window longer than the book covers the whole book once
+    centers, frequencies = dispersion.rolling("book 1", window=2000)
+    assert centers.tolist() == [3.5]
+    np.testing.assert_allclose(frequencies[:, 0], [scan(corpus, word, "book 1", 0, 7) * 1000 / 7 for word in WORDS])
+
+def test_juilland_d(corpus, dispersion):
+    title, parts = "book 0", 10
+    edges = np.linspace(0, 1000, parts + 1).astype(np.int64)
+    for word, d in zip(WORDS, dispersion.juilland_d(title, parts)):
+        counts = np.array([scan(corpus, word, title, a, b) for a, b in zip(edges[:-1], edges[1:])])
+        if counts.sum() == 0:
+            assert np.isnan(d)
+        else:
+            assert d == pytest.approx(1 - counts.std() / counts.mean() / np.sqrt(parts - 1))
+
+def test_chapter_starts():
+    contents = "contents chapter one chapter two chapter three"
+    chapter = " ".join(["holmes watson"] * 60)
+    corpus = Corpus.from_texts({
+        "novel": f"{contents} chapter one {chapter} chapter two {chapter} chapter three {chapter}",
+        "collection": chapter,
+    })
+    words = corpus.words("novel")
+    # The table of contents is skipped and each chapter starts at its heading
+    starts = chapter_starts(corpus, "novel")
+    assert [words[start:start + 2] for start in starts] == [["chapter", "one"], ["chapter", "two"], ["chapter", "three"]]
+    assert starts[0] == 7
+    assert len(chapter_starts(corpus, "collection")) == 0
+    assert len(chapter_starts(corpus, "novel", marker="part")) == 0
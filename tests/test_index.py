@@ -0,0 +1,62 @@
+"""The incremental corpus index matches a full recount after books are added, removed, synced and reloaded"""
+import numpy as np
+import pandas as pd
+import pytest
+from data_corpus import Corpus
+from data_analysis import calculate_vocabulary_tf_idf, clear_frequency_tables, return_most_common, unique_words_from_texts
+from data_index import CorpusIndex
+
+def random_books(seed, count=6):
+    rng = np.random.default_rng(seed)
+    vocabulary = [f"w{i}" for i in range(300)]
+    # An empty book, and skewed frequencies so counts tie and some words occur in a single book
+    lengths = [0] + rng.integers(1, 3000, size=count - 1).tolist()
+    return {
+        f"book {i}": rng.choice(vocabulary, size=length, p=rng.dirichlet(np.ones(len(vocabulary)) * 0.3)).tolist()
+        for i, length in enumerate(lengths)
+    }
+
+def assert_matches_recount(index, corpus):
+    clear_frequency_tables()
+    assert list(index.books) == corpus.titles()
+    for title in corpus.titles():
+        assert index.most_common(title=title) == return_most_common(corpus, None, title)
+    assert index.most_common() == return_most_common(corpus, None)
+    assert index.most_common(10) == return_most_common(corpus, 10)
+    assert index.unique_words() == unique_words_from_texts(corpus, return_counts=True)
+    for smooth in (False, True):
+        expected = calculate_vocabulary_tf_idf(corpus, smooth).sort_values(['Book', 'Word'], ignore_index=True)
+        result = index.tf_idf(smooth).sort_values(['Book', 'Word'], ignore_index=True)
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+def test_index_matches_recount(tmp_path):
+    books = random_books(0)
+    index = CorpusIndex()
+    for title, tokens in books.items():
+        index.add_book(title, tokens, key=f"{title} v1")
+    index.remove_book("book 2")
+    del books["book 2"]
+    assert_matches_recount(index, Corpus.from_texts(books))
+
+    # Sync with a corpus where one book changed, one is gone and one is new
+    changed = random_books(1, count=2)
+    books["book 3"] = changed["book 1"]
+    del books["book 4"]
+    books["book 9"] = random_books(2, count=2)["book 1"]
+    corpus = Corpus.from_texts(books)
+    keys = {title: f"{title} v2" if title in ("book 3", "book 9") else f"{title} v1" for title in books}
+    index.sync(corpus, keys)
+    assert_matches_recount(index, corpus)
+
+    index.save(tmp_path / "index.npz")
+    loaded = CorpusIndex.load(tmp_path / "index.npz")
+    assert_matches_recount(loaded, corpus)
+    # A loaded index keeps updating incrementally
+    loaded.remove_book("book 0")
+    del books["book 0"]
+    assert_matches_recount(loaded, Corpus.from_texts(books))
+
+def test_load_or_create(tmp_path):
+    assert CorpusIndex.load_or_create(tmp_path / "missing.npz").num_books() == 0
+    with pytest.raises(KeyError):
+        CorpusIndex().remove_book("missing")
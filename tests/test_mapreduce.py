@@ -0,0 +1,64 @@
+"""The map-reduce analysis matches the data_analysis functions it replaces"""
+import numpy as np
+import pytest
+from data_corpus import Corpus
+from data_analysis import (
+    calculate_word_pair_frequencies, clear_frequency_tables, count_ngrams, return_most_common, unique_words_from_texts,
+)
+from data_mapreduce import AnalysisReduction, map_shard, run_analysis
+
+def random_corpus(seed, books=6):
+    rng = np.random.default_rng(seed)
+    vocabulary = [f"w{i}" for i in range(40)]
+    # Random book lengths, including an empty book and books shorter than the n-grams
+    lengths = [0, 1, 2] + rng.integers(1, 600, size=books).tolist()
+    return Corpus.from_texts({
+        f"book {i}": " ".join(rng.choice(vocabulary, size=length, p=rng.dirichlet(np.ones(len(vocabulary)))))
+        for i, length in enumerate(lengths)
+    }), vocabulary[:8]
+
+@pytest.mark.parametrize("ns", [[], [1, 2, 3]])
+def test_run_analysis_matches_data_analysis(ns):
+    corpus, words = random_corpus(len(ns))
+    clear_frequency_tables()
+    reduction = run_analysis(corpus, words, 1, ns=ns, shards=3)
+    for title in corpus.titles():
+        assert reduction.most_common(10, title) == return_most_common(corpus, 10, title)
+    assert reduction.most_common(10) == return_most_common(corpus, 10)
+    assert reduction.unique_words() == unique_words_from_texts(corpus, return_counts=True)
+    expected = calculate_word_pair_frequencies(corpus, {title: words for title in corpus.titles()}, 1)
+    for title in corpus.titles():
+        np.testing.assert_array_equal(reduction.cooccurrence(title), expected[title])
+    for n in ns:
+        expected_ngrams = count_ngrams(corpus, n)
+        for title in corpus.titles():
+            assert reduction.ngrams(n, title).most_common(20) == expected_ngrams[title].most_common(20)
+
+def per_book_reduction(corpus, words, window_size, sliding, ns):
+    """Reduce the corpus with every book in a shard of its own, however short, instead of the balanced shards of run_analysis."""
+    target_ids = np.array([corpus.word_to_id.get(word, -1) for word in words], dtype=np.int64)
+    partials = [
+        map_shard([(title, corpus.tokens(title))], len(corpus.vocabulary), target_ids, window_size, sliding, ns)
+        for title in corpus.titles()
+    ]
+    return AnalysisReduction(corpus.vocabulary, corpus.titles(), partials, words, window_size, sliding, ns)
+
+@pytest.mark.parametrize("sliding", [False, True])
+@pytest.mark.parametrize("window_size", [1, 2, 3, 5])
+def test_corpus_wide_results_match_combined_corpus(window_size, sliding):
+    corpus, words = random_corpus(window_size, books=4)
+    # Books shorter than the window, so open windows and n-grams span several books
+    rng = np.random.default_rng(window_size + 100)
+    for i in range(6):
+        corpus.add(f"short {i}", rng.choice(words, size=int(rng.integers(0, window_size + 1))).tolist())
+    combined = corpus.combined("all")
+    expected = calculate_word_pair_frequencies(combined, {"all": words}, window_size, sliding)["all"]
+    expected_ngrams = {n: count_ngrams(combined, n)["all"].most_common() for n in (2, 3)}
+    reductions = [
+        run_analysis(corpus, words, window_size, sliding, ns=[2, 3], shards=3),
+        per_book_reduction(corpus, words, window_size, sliding, [2, 3]),
+    ]
+    for reduction in reductions:
+        np.testing.assert_array_equal(reduction.cooccurrence(), expected)
+        for n in (2, 3):
+            assert reduction.ngrams(n).most_common() == expected_ngrams[n]
@@ -0,0 +1,86 @@
+"""The positional index answers phrase, proximity, keyword-in-context and co-occurrence queries like a scan of the books"""
+from collections import Counter
+import numpy as np
+import pytest
+from data_corpus import Corpus
+from data_positional_index import PositionalIndex, decode_tokens, encode_postings
+
+def random_corpus(seed=0):
+    rng = np.random.default_rng(seed)
+    vocabulary = [f"w{i}" for i in range(15)]
+    # Skewed word frequencies so phrases repeat, and an empty book and a one-word book
+    lengths = [0, 1] + rng.integers(50, 2000, size=4).tolist()
+    return Corpus.from_texts({
+        f"book {i}": " ".join(rng.choice(vocabulary, size=length, p=rng.dirichlet(np.ones(len(vocabulary)) * 0.5)))
+        for i, length in enumerate(lengths)
+    })
+
+@pytest.fixture(params=[False, True], ids=["decoded", "attached"])
+def index(request):
+    corpus = random_corpus()
+    index = PositionalIndex.from_corpus(corpus)
+    if request.param:
+        index.attach(corpus)
+    return index, corpus
+
+def test_encode_decode_round_trip(tmp_path):
+    corpus = random_corpus()
+    for title, token_ids in corpus.items():
+        tokens = decode_tokens(encode_postings(token_ids))
+        assert tokens.dtype == Corpus.dtype
+        np.testing.assert_array_equal(tokens, token_ids)
+    index = PositionalIndex.from_corpus(corpus)
+    index.save(tmp_path / "positions.npz")
+    loaded = PositionalIndex.load(tmp_path / "positions.npz")
+    for title in corpus.titles():
+        assert [loaded.lexicon.vocabulary[i] for i in loaded.tokens(title).tolist()] == corpus.words(title)
+
+def test_phrase(index):
+    index, corpus = index
+    for phrase in (["w0"], ["w0", "w1"], ["w1", "w0", "w1"], ["w2", "w2"], ["w0", "unknown"], ["unknown"]):
+        for title, starts in index.phrase(phrase).items():
+            words = corpus.words(title)
+            expected = [i for i in range(len(words) - len(phrase) + 1) if words[i:i + len(phrase)] == phrase]
+            assert starts.tolist() == expected, (phrase, title)
+
+@pytest.mark.parametrize("ordered", [False, True])
+@pytest.mark.parametrize("distance", [0, 1, 3])
+def test_near(index, distance, ordered):
+    index, corpus = index
+    for first, second in (("w0", "w1"), ("w1", "w1"), ("w0", "unknown")):
+        for title, (left, right) in index.near(first, second, distance, ordered=ordered).items():
+            words = corpus.words(title)
+            expected = sorted(
+                (i, j)
+                for i, a in enumerate(words) if a == first
+                for j, b in enumerate(words) if b == second and i != j
+                and (0 < j - i <= distance if ordered else abs(j - i) <= distance)
+            )
+            assert sorted(zip(left.tolist(), right.tolist())) == expected, (first, second, title)
+
+@pytest.mark.parametrize("width", [0, 2, 5])
+def test_kwic(index, width):
+    index, corpus = index
+    # The most frequent pair of words, so there are more snippets than the limit
+    pairs = Counter(pair for title in corpus.titles() for pair in zip(corpus.words(title), corpus.words(title)[1:]))
+    phrase = list(pairs.most_common(1)[0][0])
+    expected = []
+    for title in corpus.titles():
+        words = corpus.words(title)
+        for i in range(len(words) - 1):
+            if words[i:i + 2] == phrase:
+                expected.append((title, i, " ".join(words[max(i - width, 0):i]), " ".join(phrase), " ".join(words[i + 2:i + 2 + width])))
+    assert index.kwic(phrase, width) == expected
+    assert index.kwic(" ".join(phrase), width, limit=3) == expected[:3]
+
+@pytest.mark.parametrize("window_size", [1, 2, 4])
+def test_cooccurrence(index, window_size):
+    index, corpus = index
+    for word in ("w0", "w3", "unknown"):
+        expected = Counter()
+        for title in corpus.titles():
+            words = corpus.words(title)
+            for i, w in enumerate(words):
+                if w == word:
+                    expected.update(words[j] for j in range(max(i - window_size, 0), min(i + window_size + 1, len(words))) if j != i)
+        assert index.cooccurrence(word, window_size) == expected, word
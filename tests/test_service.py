@@ -0,0 +1,109 @@
+"""The analysis service answers queries like the analysis functions and rejects bad requests"""
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from data_corpus import Corpus
+from data_analysis import calculate_word_pair_frequencies, count_ngrams, return_most_common
+from data_index import CorpusIndex
+from data_service import AnalysisService, MAX_NGRAM_SIZE, handle_request
+
+@pytest.fixture(scope="module")
+def service():
+    rng = np.random.default_rng(0)
+    vocabulary = [f"w{i}" for i in range(30)]
+    corpus = Corpus.from_texts({
+        f"book {i}": " ".join(rng.choice(vocabulary, size=length, p=rng.dirichlet(np.ones(len(vocabulary)))))
+        for i, length in enumerate([400, 3, 0, 900])
+    })
+    index = CorpusIndex()
+    index.sync(corpus)
+    return AnalysisService(corpus, index)
+
+def test_queries_match_analysis_functions(service):
+    corpus = service.corpus
+    combined = corpus.combined("all")
+    assert service.query("/books", {}) == [{"title": t, "tokens": corpus.num_tokens(t)} for t in corpus.titles()]
+    assert service.query("/top", {"k": "5"}) == return_most_common(corpus, 5)
+    assert service.query("/top", {"k": "5", "book": "book 3"}) == return_most_common(corpus, 5, "book 3")
+    words = ["w0", "w1", "w2", "missing"]
+    for window_size in (1, 3):
+        for sliding in (False, True):
+            params = {"words": ",".join(words), "window": str(window_size), "sliding": "1" if sliding else "0"}
+            expected = calculate_word_pair_frequencies(combined, {"all": words}, window_size, sliding)["all"]
+            assert service.query("/cooccurrence", params)["matrix"] == expected.tolist()
+            expected = calculate_word_pair_frequencies(corpus.subset(["book 0"]), {"book 0": words}, window_size, sliding)["book 0"]
+            assert service.query("/cooccurrence", dict(params, book="book 0"))["matrix"] == expected.tolist()
+    for n in (1, 2, 3):
+        expected = [[list(ngram), count] for ngram, count in count_ngrams(combined, n)["all"].most_common(7)]
+        assert service.query("/ngrams", {"n": str(n), "k": "7"}) == expected
+        expected = [[list(ngram), count] for ngram, count in count_ngrams(corpus, n)["book 3"].most_common(7)]
+        assert service.query("/ngrams", {"n": str(n), "k": "7", "book": "book 3"}) == expected
+    assert "corpus_tokens" not in service.query("/memory", {})
+
+@pytest.mark.parametrize("path, params, message", [
+    ("/top", {"k": "-1"}, "k must be an integer >= 0"),
+    ("/top", {"k": "ten"}, "k must be an integer >= 0"),
+    ("/unique", {"k": "-3"}, "k must be an integer >= 0"),
+    ("/ngrams", {"n": "0"}, f"n must be an integer between 1 and {MAX_NGRAM_SIZE}"),
+    ("/ngrams", {"n": str(MAX_NGRAM_SIZE + 1)}, f"n must be an integer between 1 and {MAX_NGRAM_SIZE}"),
+    ("/ngrams", {"n": "2", "k": "-1"}, "k must be an integer >= 0"),
+    ("/cooccurrence", {"words": "w0,w1", "window": "1000"}, "window must be an integer between 0 and 50"),
+    ("/cooccurrence", {}, "words is required"),
+    ("/tfidf", {}, "words is required"),
+    ("/phrase", {"phrase": " "}, "phrase is required"),
+    ("/kwic", {"phrase": ""}, "phrase is required"),
+    ("/kwic", {"phrase": "w0", "width": "-1"}, "width must be an integer between 0 and 50"),
+    ("/near", {"words": "w0"}, "words must be two words"),
+    ("/near", {"words": "w0,w1", "distance": "1.5"}, "distance must be an integer >= 0"),
+])
+def test_bad_parameters_are_rejected(service, path, params, message):
+    with pytest.raises(ValueError, match=message):
+        service.query(path, params)
+
+@pytest.mark.parametrize("path, params", [("/unknown", {}), ("/top", {"book": "missing"}), ("/ngrams", {"book": "missing"})])
+def test_unknown_routes_and_books(service, path, params):
+    with pytest.raises(KeyError):
+        service.query(path, params)
+
+def test_int_param():
+    assert AnalysisService.int_param({}, "k", 10) == 10
+    assert AnalysisService.int_param({"k": "0"}, "k", 10) == 0
+    assert AnalysisService.int_param({"n": "5"}, "n", 2, 1, 5) == 5
+    with pytest.raises(ValueError, match="between 1 and 5, not 6"):
+        AnalysisService.int_param({"n": "6"}, "n", 2, 1, 5)
+
+def request(service, raw):
+    """Send one raw HTTP request to handle_request over a local connection and return the status and JSON body."""
+    async def exchange():
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            server = await asyncio.start_server(
+                lambda reader, writer: handle_request(service, executor, reader, writer), "127.0.0.1", 0
+            )
+            async with server:
+                reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+                writer.write(raw)
+                await writer.drain()
+                response = await reader.read()
+                writer.close()
+        head, _, body = response.partition(b"\r\n\r\n")
+        return int(head.split()[1]), json.loads(body)
+    return asyncio.run(exchange())
+
+@pytest.mark.parametrize("raw, status", [
+    (b"GET /top?k=3 HTTP/1.1\r\nHost: localhost\r\n\r\n", 200),
+    (b"GET /ngrams?n=0 HTTP/1.1\r\n\r\n", 400),
+    (b"GET /phrase?phrase=%20 HTTP/1.1\r\n\r\n", 400),
+    (b"GET /top?book=missing HTTP/1.1\r\n\r\n", 404),
+    (b"GET /nowhere HTTP/1.1\r\n\r\n", 404),
+    (b"POST /top HTTP/1.1\r\n\r\n", 405),
+    (b"GET\r\n\r\n", 400),
+])
+def test_http_status(service, raw, status):
+    code, body = request(service, raw)
+    assert code == status
+    if status == 200:
+        assert body == [list(pair) for pair in return_most_common(service.corpus, 3)]
+    else:
+        assert "error" in body
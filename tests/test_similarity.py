@@ -0,0 +1,68 @@
+"""Near-duplicate books are found by MinHash and LSH like an exact comparison of every pair, and reprints are dropped at ingest"""
+import numpy as np
+from data_similarity import MinHashIndex, drop_duplicate_books, exact_jaccard, find_duplicate_books, raw_text_shingles, shingle_hashes
+
+rng = np.random.default_rng(0)
+VOCABULARY = [f"word{i}" for i in range(2000)]
+
+def body(length=5000):
+    return list(rng.choice(VOCABULARY, size=length))
+
+def gutenberg(title, number, words):
+    """Wrap a book's words in a Project Gutenberg header and licence."""
+    return (
+        f"The Project Gutenberg eBook of {title}\r\n\r\nRelease date: 2024 [eBook #{number}]\r\n\r\n"
+        f"*** START OF THE PROJECT GUTENBERG EBOOK {title.upper()} ***\r\n\r\n{' '.join(words)}\r\n\r\n"
+        f"*** END OF THE PROJECT GUTENBERG EBOOK {title.upper()} ***\r\n\r\nUpdated editions will replace the previous one, ebook {number}."
+    )
+
+def shingle_set(words, k=5):
+    """Return the set of k-word shingles of a text as tuples of words."""
+    return {tuple(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+def test_reprint_is_dropped_and_distinct_books_are_kept():
+    original, other = body(), body()
+    # A reprint under another ebook number, with a few words changed
+    reprint = list(original)
+    for position in rng.choice(len(reprint), size=10, replace=False):
+        reprint[position] = "typo"
+    assert exact_jaccard(raw_text_shingles(gutenberg("Study", 244, original)), raw_text_shingles(gutenberg("Reprint", 2097, reprint))) > 0.95
+    books = [
+        {"title": "A Study in Scarlet", "text": gutenberg("A Study in Scarlet", 244, original)},
+        {"title": "The Sign of the Four", "text": gutenberg("The Sign of the Four", 2097, other)},
+        {"title": "A Study in Scarlet (reprint)", "text": gutenberg("A Study in Scarlet", 30000, reprint)},
+    ]
+    assert find_duplicate_books(books) == {2: 0}
+    assert [book["title"] for book in drop_duplicate_books(books)] == ["A Study in Scarlet", "The Sign of the Four"]
+    # Books sharing half their text are not duplicates at the default threshold
+    half = original[:2500] + other[2500:]
+    assert find_duplicate_books(books[:2] + [{"title": "Half", "text": gutenberg("Half", 1, half)}]) == {}
+
+def test_shingle_hashes_match_shingle_sets():
+    first, second = body(300), body(300)
+    second[100:250] = first[100:250]
+    assert len(shingle_hashes(first)) == len(shingle_set(first))
+    expected = len(shingle_set(first) & shingle_set(second)) / len(shingle_set(first) | shingle_set(second))
+    assert exact_jaccard(shingle_hashes(first), shingle_hashes(second)) == expected
+    assert exact_jaccard(shingle_hashes([]), shingle_hashes([])) == 0.0
+
+def test_near_duplicates_match_exact_comparison():
+    bases = [body(2000) for _ in range(3)]
+    texts = {}
+    for i, base in enumerate(bases):
+        for j, changes in enumerate([0, 5, 20, 400]):
+            words = list(base)
+            words[:changes] = body(changes)
+            texts[(i, j)] = words
+    index = MinHashIndex()
+    for key, words in texts.items():
+        index.add(key, shingle_hashes(words))
+    threshold = 0.8
+    keys = list(texts)
+    expected = {
+        (first, second)
+        for a, first in enumerate(keys) for second in keys[a + 1:]
+        if exact_jaccard(shingle_hashes(texts[first]), shingle_hashes(texts[second])) >= threshold
+    }
+    assert {(first, second) for first, second, _ in index.near_duplicates(threshold)} == expected
+    assert all(first[0] == second[0] for first, second in expected) and len(expected) == 3 * 3
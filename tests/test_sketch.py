@@ -0,0 +1,63 @@
+"""The Space-Saving and count-min summaries keep their error guarantees on single streams and after merging"""
+from collections import Counter
+import numpy as np
+import pytest
+from data_sketch import CountMinSketch, SpaceSaving, book_summaries, merge_summaries
+
+def zipf_books(seed=0, books=4, length=20000, vocabulary_size=3000):
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, vocabulary_size + 1)
+    vocabulary = np.array([f"w{i}" for i in range(vocabulary_size)])
+    # Each book ranks the words in its own order past the first 50, so per-book heavy hitters differ
+    return {
+        f"book {b}": vocabulary[np.concatenate([np.arange(50), 50 + rng.permutation(vocabulary_size - 50)])][
+            rng.choice(vocabulary_size, size=length, p=weights / weights.sum())
+        ].tolist()
+        for b in range(books)
+    }
+
+def assert_within_bound(summary, exact):
+    bound = summary.error_bound()
+    kept = set()
+    for word, count, error in summary.top_k():
+        kept.add(word)
+        # Never undercounts, overcounts by at most the reported error, which is within the bound
+        assert exact[word] <= count <= exact[word] + bound, word
+        assert count - error <= exact[word]
+        assert error <= bound
+    # A word left out occurs at most error_bound() times
+    assert all(count <= bound for word, count in exact.items() if word not in kept)
+    assert summary.total == sum(exact.values())
+
+@pytest.mark.parametrize("sketch_width", [None, 512])
+@pytest.mark.parametrize("capacity", [20, 200])
+def test_top_k_within_error_bound(capacity, sketch_width):
+    books = zipf_books()
+    for title, tokens in books.items():
+        summary = SpaceSaving(capacity, CountMinSketch(sketch_width) if sketch_width else None).update(tokens, chunk_size=1000)
+        assert_within_bound(summary, Counter(tokens))
+
+@pytest.mark.parametrize("sketch_width", [None, 512])
+@pytest.mark.parametrize("capacity", [20, 200])
+def test_merged_summaries_within_error_bound(capacity, sketch_width):
+    books = zipf_books(1)
+    merged = merge_summaries(book_summaries(books, capacity, sketch_width).values())
+    assert_within_bound(merged, Counter(token for tokens in books.values() for token in tokens))
+
+def test_count_min_never_underestimates():
+    books = zipf_books(2)
+    sketches = []
+    for tokens in books.values():
+        sketch = CountMinSketch(width=256, depth=4)
+        sketch.update(Counter(tokens))
+        exact = Counter(tokens)
+        assert all(sketch.estimate(word) >= count for word, count in exact.items())
+        sketches.append(sketch)
+    merged = sketches[0]
+    for sketch in sketches[1:]:
+        merged = merged.merge(sketch)
+    exact = Counter(token for tokens in books.values() for token in tokens)
+    assert all(merged.estimate(word) >= count for word, count in exact.items())
+    assert merged.total == sum(exact.values())
+    with pytest.raises(ValueError):
+        merged.merge(CountMinSketch(width=128, depth=4))
@@ -0,0 +1,24 @@
+"""Starting the command line stays fast: heavy packages are only imported when they are used"""
+import json
+import os
+import subprocess
+import sys
+import pytest
+from benchmark import IMPORT_BUDGETS_MS, check_imports
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Packages main must not import until a figure is drawn or text is preprocessed
+DEFERRED_MODULES = ["nltk", "seaborn", "wordcloud", "matplotlib.pyplot"]
+
+@pytest.mark.parametrize("module", list(IMPORT_BUDGETS_MS))
+def test_import_within_budget(module, record_property):
+    ((_, milliseconds, budget, eager),) = check_imports({module: IMPORT_BUDGETS_MS[module]}, repeat=3)
+    # Kept in the junit XML report, so the startup cost can be followed across runs
+    record_property("import_ms", milliseconds)
+    assert not eager, f"{module} eagerly imports {', '.join(eager)}"
+    assert milliseconds <= budget, f"import {module} took {milliseconds:.0f} ms (budget {budget} ms)"
+
+def test_main_defers_heavy_modules():
+    script = f"import json, sys, main; print(json.dumps([m for m in {DEFERRED_MODULES!r} if m in sys.modules]))"
+    result = subprocess.run([sys.executable, "-c", script], cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    assert json.loads(result.stdout.splitlines()[-1]) == []
@@ -0,0 +1,76 @@
+"""Books survive the round trip through the raw and cleaned stores, including interrupted writes"""
+import os
+import numpy as np
+from data_corpus import Corpus
+from data_storage import TokenStore, VOCABULARY_FILE, load_raw_books, save_raw_books
+
+BOOKS = {
+    "first": ["holmes", "watson", "baker", "street", "holmes"],
+    "empty": [],
+    "second": ["moor", "hound", "watson", "café", "holmes"],
+}
+
+def save_books(store_dir, books):
+    store = TokenStore(store_dir)
+    for key, tokens in books.items():
+        store.add(key, tokens)
+    store.flush()
+    return store
+
+def assert_books(store_dir, books):
+    store = TokenStore(store_dir)
+    for key, tokens in books.items():
+        assert key in store
+        token_ids = store.load(key)
+        assert isinstance(token_ids, np.memmap)
+        assert [store.lexicon.vocabulary[i] for i in token_ids.tolist()] == tokens
+    corpus = store.corpus([(f"title of {key}", key) for key in books])
+    for key, tokens in books.items():
+        assert corpus.tokens(f"title of {key}").dtype == Corpus.dtype
+        assert corpus.words(f"title of {key}") == tokens
+
+def test_token_store_round_trip(tmp_path):
+    save_books(tmp_path, BOOKS)
+    assert_books(tmp_path, BOOKS)
+
+def test_token_store_appends_books(tmp_path):
+    save_books(tmp_path, BOOKS)
+    more = {"third": ["lestrade", "holmes", "scotland", "yard"]}
+    save_books(tmp_path, more)
+    assert_books(tmp_path, dict(BOOKS, **more))
+    # The vocabulary is shared, so known words are not stored twice
+    vocabulary = TokenStore(tmp_path).lexicon.vocabulary
+    assert len(vocabulary) == len(set(vocabulary)) == len({w for tokens in dict(BOOKS, **more).values() for w in tokens})
+
+def test_token_store_of_empty_books(tmp_path):
+    save_books(tmp_path, {"empty": [], "also empty": []})
+    store = TokenStore(tmp_path)
+    assert store.lexicon.vocabulary == []
+    assert len(store.load("empty")) == 0
+    assert_books(tmp_path, {"empty": [], "also empty": []})
+
+def test_token_store_recovers_from_interrupted_write(tmp_path):
+    save_books(tmp_path, BOOKS)
+    # A later run added a book and started appending its words, but stopped before writing the header
+    store = TokenStore(tmp_path)
+    store.add("lost", ["irene", "adler", "holmes"])
+    with open(os.path.join(tmp_path, VOCABULARY_FILE), "ab") as f:
+        f.write("\nirene\nadl".encode("utf-8"))
+    with open(store.token_path("partial") + ".tmp", "wb") as f:
+        f.write(b"\x93NUMPY")
+    # The books the header describes are intact and the unfinished book is not listed
+    assert_books(tmp_path, BOOKS)
+    assert "lost" not in TokenStore(tmp_path)
+    # The next write replaces the leftover vocabulary bytes
+    more = {"third": ["adler", "mycroft", "holmes"]}
+    save_books(tmp_path, more)
+    assert_books(tmp_path, dict(BOOKS, **more))
+    assert "irene" not in TokenStore(tmp_path).lexicon.word_to_id
+
+def test_raw_store_round_trip(tmp_path):
+    books = [
+        {"title": "A Study in Scarlet", "author": "Arthur Conan Doyle", "language": "English", "text": "Line one\r\nLine two\r\n"},
+        {"title": "Empty", "author": "Unknown Author", "language": "English", "text": ""},
+    ]
+    save_raw_books(books, tmp_path)
+    assert load_raw_books(tmp_path) == books